@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+"""
+Time each part generator and the full DXF output as the box grows.
+
+Every benchmark draws into a fresh document, so runs do not pile up
+entities. For each case we record the best and median wall time, the
+number of entities drawn, the peak traced memory of one extra run and, for
+benchmarks that save a file, its size. Results are written as JSON, and
+--compare checks them against an earlier run:
+
+    python benchmark.py -o before.json
+    python benchmark.py -o after.json --compare before.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict
+
+import ezdxf
+import numpy as np
+
+import torsion_box_generator as tbg
+
+# swept values, and the shorter lists used with --quick
+NBRACES = [4, 8, 16, 32, 64]
+NTABS = [2, 3, 6, 12, 24]
+BOXES = [1, 4, 16]
+# braces of the boxes long enough to be nested as tiled pieces
+TILED = [16, 64, 256]
+QUICK = {"nbraces": [4, 16], "ntabs": [3, 12], "boxes": [1, 4], "tiled": [16, 64]}
+# a median this many times slower than the baseline counts as a regression
+THRESHOLD = 1.25
+
+
+def scaled_spec(nbraces=8, ntabs=3):
+    """
+    Default box made long and wide enough to keep room between the fingers.
+    """
+    return tbg.BoxSpec(nbraces=nbraces, ntabs=ntabs,
+                       box_length=max(95.5, 12 * (nbraces - 1)),
+                       box_width=max(47.5, 8 * (ntabs + 1)))
+
+
+# part generators: name -> draw(spec, msp, **options)
+GENERATORS = {
+    "top_plate": lambda spec, msp, **o: tbg.top_plate(spec, msp, **o),
+    "short_brace": lambda spec, msp, **o: tbg.short_brace(spec, msp, (0, 0), **o),
+    "long_brace": lambda spec, msp, **o: tbg.long_brace(spec, msp, (0, 0), **o),
+    "leg_holes": lambda spec, msp, **o: tbg.leg_holes(spec, msp, (0, 0), **o),
+    "layout": lambda spec, msp, **o: tbg.layout(spec, msp, **o),
+}
+
+
+def measure(run, setup=lambda: None, repeat=5):
+    """
+    Best and median seconds of run(setup()) over repeat calls, plus the
+    traced peak memory of one more call, in KiB.
+    """
+    times = []
+    for _ in range(repeat):
+        arg = setup()
+        gc.collect()
+        t = time.perf_counter()
+        run(arg)
+        times.append(time.perf_counter() - t)
+    arg = setup()
+    gc.collect()
+    tracemalloc.start()
+    run(arg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"min_s": min(times), "median_s": statistics.median(times),
+            "peak_kib": round(peak / 1024, 1)}
+
+
+def bench_generator(name, spec, repeat, **options):
+    draw = GENERATORS[name]
+    docs = []
+
+    def setup():
+        # part shapes cached by an earlier run would hide the generation cost
+        tbg.clear_shape_caches()
+        docs.append(tbg.new_document())
+        return docs[-1].modelspace()
+
+    result = measure(lambda msp: draw(spec, msp, **options), setup, repeat)
+    result["entities"] = len(docs[-1].modelspace())
+    return result
+
+
+def bench_plans(specs, repeat):
+    """
+    Build the layout plan of every box of a job, from a cold plan cache.
+    """
+    def run(_):
+        plans[:] = [tbg.layout_plan(spec, (0, k * tbg.BOX_PITCH))
+                    for k, spec in enumerate(specs)]
+
+    plans = []
+    result = measure(run, tbg.clear_shape_caches, repeat)
+    # the placements planned stand in for the entities drawn
+    result["entities"] = sum(len(plan.placements) for plan in plans)
+    return result
+
+
+def bench_contours(specs, repeat):
+    """
+    Build the contours of every part of a job without drawing them, from a
+    cold shape cache.
+    """
+    def run(_):
+        for k, spec in enumerate(specs):
+            plan = tbg.layout_plan(spec, (0, k * tbg.BOX_PITCH))
+            built.extend(len(contours) for _, _, contours in tbg.plan_contours(plan))
+
+    built = []
+    result = measure(run, tbg.clear_shape_caches, repeat)
+    result["entities"] = sum(built) // (repeat + 1)
+    return result
+
+
+def bench_job(specs, repeat, streaming=False, **options):
+    """
+    Lay out and save a whole job (one box, or several stacked).
+    """
+    fd, filename = tempfile.mkstemp(suffix=".dxf")
+    os.close(fd)
+    try:
+        result = measure(lambda _: tbg.write_job(specs, filename, streaming, **options),
+                         tbg.clear_shape_caches, repeat)
+        result["bytes"] = os.path.getsize(filename)
+        result["entities"] = len(ezdxf.readfile(filename).modelspace())
+    finally:
+        os.remove(filename)
+    return result
+
+
+def bench_tiled(spec, repeat, **options):
+    """
+    Nest and save one box that is split into sheet-sized pieces.
+    """
+    import nesting
+
+    fd, filename = tempfile.mkstemp(suffix=".dxf")
+    os.close(fd)
+    try:
+        result = measure(lambda _: nesting.write_nested([spec], filename, **options),
+                         repeat=repeat)
+        msp = ezdxf.readfile(filename).modelspace()
+        result["bytes"] = os.path.getsize(filename)
+        result["entities"] = len(msp)
+        result["pockets"] = len(msp.query('*[layer=="Pocket"]'))
+    finally:
+        os.remove(filename)
+    return result
+
+
+def bench_optimize(spec, repeat):
+    """
+    Score every brace count, tab count and notch length for the box
+    dimensions of spec and reduce them to the Pareto front.
+    """
+    import optimizer
+
+    result = measure(lambda _: optimizer.optimize(spec), repeat=repeat)
+    # the candidates scored stand in for the entities drawn
+    result["entities"] = len(optimizer.candidates()[0])
+    result["front"] = len(optimizer.optimize(spec))
+    return result
+
+
+def bench_sheets(specs, repeat, processes=None, **options):
+    """
+    Write a job as one DXF per sheet, the sheets drawn and saved across
+    processes workers (all cores by default).
+    """
+    import sheets
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "job.dxf")
+        result = measure(lambda _: sheets.write_sheets(specs, filename, False, processes,
+                                                       **options), repeat=repeat)
+        files = [os.path.join(tmp, name) for name in os.listdir(tmp) if name.endswith(".dxf")]
+        result["bytes"] = sum(os.path.getsize(name) for name in files)
+        result["entities"] = sum(len(ezdxf.readfile(name).modelspace()) for name in files)
+        result["files"] = len(files)
+    return result
+
+
+def bench_tools(specs, repeat, shared=True):
+    """
+    The job written for 1/8", 1/4" and 3/8" endmills with the comparison
+    report: from one shared pass, or each tool drawn and ordered on its own.
+    """
+    import tooling
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "job.dxf")
+        result = measure(lambda _: tooling.write_variants(
+            specs, tooling.DIAMETERS, filename, shared=shared), repeat=repeat)
+        files = [os.path.join(tmp, name) for name in os.listdir(tmp)]
+        result["bytes"] = sum(os.path.getsize(name) for name in files)
+        result["entities"] = sum(len(ezdxf.readfile(name).modelspace()) for name in files)
+    return result
+
+
+def bench_exports(specs, repeat, shared=True):
+    """
+    DXF, SVG and PDF of one job: from a single recorded pass exported side
+    by side (shared), or the DXF first and the previews rendered from it
+    one after another.
+    """
+    import export
+
+    with tempfile.TemporaryDirectory() as tmp:
+        names = [os.path.join(tmp, "job" + ext) for ext in (".dxf", ".svg", ".pdf")]
+
+        def run(_):
+            if shared:
+                export.export(export.record(specs), names)
+                return
+            tbg.write_job(specs, names[0])
+            for name in names[1:]:
+                export.export(export.from_dxf(names[0]), [name], processes=1)
+
+        result = measure(run, repeat=repeat)
+        drawing = export.record(specs)
+        result["entities"] = len(drawing.contours) + len(drawing.texts)
+        result["bytes"] = sum(os.path.getsize(name) for name in names)
+    return result
+
+
+def cases(quick=False):
+    """
+    (benchmark, case, function) for every benchmark in the suite.
+    """
+    nbraces = QUICK["nbraces"] if quick else NBRACES
+    ntabs = QUICK["ntabs"] if quick else NTABS
+    boxes = QUICK["boxes"] if quick else BOXES
+    tiled = QUICK["tiled"] if quick else TILED
+    sizes = [(n, 3) for n in nbraces] + [(8, t) for t in ntabs if t != 3]
+    for n, t in sizes:
+        spec = scaled_spec(n, t)
+        for name in GENERATORS:
+            yield name, spec, 1, lambda r, o, name=name, spec=spec: bench_generator(name, spec, r, **o)
+        yield "generate", spec, 1, lambda r, o, spec=spec: bench_job([spec], r, **o)
+    for n in tiled:
+        spec = scaled_spec(n)
+        yield "tiled", spec, 1, lambda r, o, spec=spec: bench_tiled(spec, r, **o)
+        yield "optimize", spec, 1, lambda r, o, spec=spec: bench_optimize(spec, r)
+    spec = scaled_spec()
+    for n in boxes:
+        yield "plans", spec, n, lambda r, o, n=n: bench_plans([spec] * n, r)
+        yield "contours", spec, n, lambda r, o, n=n: bench_contours([spec] * n, r)
+        yield "job", spec, n, lambda r, o, n=n: bench_job([spec] * n, r, **o)
+        yield "job_stream", spec, n, lambda r, o, n=n: bench_job(
+            [spec] * n, r, True, **dict(o, instance=False))
+        yield "sheets", spec, n, lambda r, o, n=n: bench_sheets([spec] * n, r, **o)
+        yield "tools_each", spec, n, lambda r, o, n=n: bench_tools([spec] * n, r, False)
+        yield "tools_shared", spec, n, lambda r, o, n=n: bench_tools([spec] * n, r, True)
+        yield "export_each", spec, n, lambda r, o, n=n: bench_exports([spec] * n, r, False)
+        yield "export_all", spec, n, lambda r, o, n=n: bench_exports([spec] * n, r, True)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(repeat=5, quick=False, only=None, **options):
+    results = []
+    for name, spec, boxes, bench in cases(quick):
+        if only and name not in only:
+            continue
+        result = {"benchmark": name,
+                  "case": {"nbraces": spec.nbraces, "ntabs": spec.ntabs, "boxes": boxes},
+                  "spec": asdict(spec)}
+        result.update(bench(repeat, options))
+        results.append(result)
+        print("{:<12} {:>3} braces {:>3} tabs {:>3} boxes  {:9.2f} ms  {:7d} entities"
+              .format(name, spec.nbraces, spec.ntabs, boxes,
+                      result["median_s"] * 1e3, result["entities"]), file=sys.stderr)
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "ezdxf": ezdxf.__version__,
+            "numpy": np.__version__,
+            "repeat": repeat,
+            "options": options,
+        },
+        "results": results,
+    }
+
+
+def _key(result):
+    return result["benchmark"], json.dumps(result["case"], sort_keys=True)
+
+
+def compare(baseline, current, threshold=THRESHOLD):
+    """
+    Median time ratio of every benchmark found in both runs. Returns the
+    rows that got slower than threshold.
+    """
+    old = {_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = old.get(_key(result))
+        if before is None:
+            continue
+        ratio = result["median_s"] / before["median_s"]
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions.append(result)
+        print("{:<12} {:<40} {:9.2f} -> {:9.2f} ms  {:5.2f}x{}".format(
+            result["benchmark"], _key(result)[1], before["median_s"] * 1e3,
+            result["median_s"] * 1e3, ratio, flag))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-o", "--output", default="benchmark.json")
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("--quick", action="store_true",
+                        help="fewer, smaller cases")
+    parser.add_argument("--only", action="append",
+                        help="run only this benchmark (may be repeated)")
+    parser.add_argument("--lines", action="store_true",
+                        help="draw LINE/ARC entities instead of LWPOLYLINEs")
+    parser.add_argument("--blocks", action="store_true",
+                        help="draw repeated parts as block references")
+    parser.add_argument("--compare", metavar="JSON",
+                        help="earlier results to compare against; exits 1 on "
+                        "a regression")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_suite(args.repeat, args.quick, args.only,
+                       polyline=not args.lines, instance=args.blocks)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
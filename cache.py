@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""
+On-disk cache of generated files, keyed on everything that shapes them.
+
+A key is the sha256 of the canonical JSON of the job kind, every BoxSpec
+field, the output options and the generator version. A hit copies the
+stored file to the requested name without rebuilding any geometry. The
+cache is bounded in bytes and drops the least recently used files first;
+hit, miss and eviction counts are kept next to the files.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import fields
+
+import torsion_box_generator as tbg
+
+DEFAULT_DIR = os.environ.get("TORSION_BOX_CACHE",
+                             os.path.join(os.path.expanduser("~"), ".cache", "torsion_box"))
+DEFAULT_MAX_BYTES = 512 * 2**20
+STATS = "stats.json"
+
+
+def canonical_spec(spec):
+    """
+    Field values with float fields as floats, so BoxSpec(box_length=95)
+    and BoxSpec(box_length=95.0) share a key.
+    """
+    return {f.name: float(getattr(spec, f.name)) if f.type is float else getattr(spec, f.name)
+            for f in fields(spec)}
+
+
+def cache_key(kind, specs, **options):
+    payload = {
+        "version": tbg.__version__,
+        "kind": kind,
+        "specs": [canonical_spec(spec) for spec in specs],
+        "options": options,
+    }
+    text = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class OutputCache:
+    """
+    Directory of generated files named by their key.
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, kind, specs, **options):
+        return cache_key(kind, specs, **options)
+
+    def path(self, key, suffix=".dxf"):
+        return os.path.join(self.directory, key + suffix)
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name != STATS and not entry.name.startswith("."):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def _count(self, **counts):
+        stats = self._load_stats()
+        for name, n in counts.items():
+            stats[name] = stats.get(name, 0) + n
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".")
+        with os.fdopen(fd, "w") as f:
+            json.dump(stats, f)
+        os.replace(tmp, os.path.join(self.directory, STATS))
+
+    def _load_stats(self):
+        try:
+            with open(os.path.join(self.directory, STATS)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def restore(self, key, filename, suffix=".dxf"):
+        """
+        Copy the cached file for key to filename. Returns False on a miss.
+        """
+        cached = self.path(key, suffix)
+        try:
+            shutil.copyfile(cached, filename)
+        except FileNotFoundError:
+            self._count(misses=1)
+            return False
+        # the modification time orders the entries for eviction
+        os.utime(cached)
+        self._count(hits=1)
+        return True
+
+    def store(self, key, filename, suffix=".dxf"):
+        """
+        Add filename under key, then evict down to max_bytes.
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".")
+        os.close(fd)
+        shutil.copyfile(filename, tmp)
+        os.replace(tmp, self.path(key, suffix))
+        self.evict()
+
+    def fetch(self, key, filename, build, suffix=".dxf"):
+        """
+        filename from the cache, or build(filename) and keep a copy.
+        """
+        if not self.restore(key, filename, suffix):
+            build(filename)
+            self.store(key, filename, suffix)
+        return filename
+
+    def evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            evicted += 1
+        if evicted:
+            self._count(evictions=evicted)
+
+    def clear(self):
+        for _, _, path in self._entries():
+            os.remove(path)
+
+    def stats(self):
+        entries = self._entries()
+        stats = {"hits": 0, "misses": 0, "evictions": 0}
+        stats.update(self._load_stats())
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "hit_rate": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "directory": self.directory,
+        })
+        return stats
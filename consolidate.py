@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+"""
+Join the loose LINE and ARC entities of a DXF into ordered paths and merge
+the collinear runs along them.
+
+CAM software has to chain loose segments into toolpaths itself when it
+imports a file. Files written with --lines, and older outputs of this
+generator, hold nothing else. consolidate() does that once. Segment ends
+go into a hash of snapped coordinates, and each path is walked from end
+to end through it, so the work grows linearly with the number of
+segments. Each path becomes one LWPOLYLINE, closed if it returns to its
+start.
+
+    report = consolidate_file("loose.dxf", "joined.dxf")
+"""
+import math
+import time
+
+import ezdxf
+
+# endpoints closer than this are one point, and a vertex this close to the
+# line through its neighbours is dropped, in drawing units
+TOLERANCE = 1e-4
+
+
+def segments(msp):
+    """
+    (x0, y0, x1, y1, bulge, layer, color) of every LINE, ARC and open
+    LWPOLYLINE segment of a layout, and the entities they came from.
+    Full circles and zero length lines are left alone.
+    """
+    out = []
+    entities = []
+    for e in msp.query("LINE ARC LWPOLYLINE"):
+        attrs = (e.dxf.layer, e.dxf.color if e.dxf.hasattr("color") else None)
+        kind = e.dxftype()
+        if kind == "LINE":
+            (x0, y0, _), (x1, y1, _) = e.dxf.start, e.dxf.end
+            if x0 == x1 and y0 == y1:
+                continue
+            out.append((x0, y0, x1, y1, 0.0) + attrs)
+        elif kind == "ARC":
+            sweep = (e.dxf.end_angle - e.dxf.start_angle) % 360
+            if sweep == 0:
+                continue
+            (cx, cy, _), r = e.dxf.center, e.dxf.radius
+            a, b = math.radians(e.dxf.start_angle), math.radians(e.dxf.end_angle)
+            # DXF arcs run CCW, which is a positive bulge
+            out.append((cx + r * math.cos(a), cy + r * math.sin(a),
+                        cx + r * math.cos(b), cy + r * math.sin(b),
+                        math.tan(math.radians(sweep) / 4)) + attrs)
+        elif not e.closed:
+            points = e.get_points("xyb")
+            out.extend((x0, y0, x1, y1, bulge) + attrs
+                       for (x0, y0, bulge), (x1, y1, _) in zip(points, points[1:]))
+        else:
+            continue
+        entities.append(e)
+    return out, entities
+
+
+def unique(segs, tol=TOLERANCE):
+    """
+    segs without repeats: a segment drawn twice, in either direction, on
+    the same layer would otherwise be cut twice.
+    """
+    seen = set()
+    out = []
+    for seg in segs:
+        x0, y0, x1, y1, bulge, layer, _ = seg
+        a = (round(x0 / tol), round(y0 / tol))
+        b = (round(x1 / tol), round(y1 / tol))
+        key = (a, b, round(bulge / tol), layer) if a < b else (b, a, round(-bulge / tol), layer)
+        if key not in seen:
+            seen.add(key)
+            out.append(seg)
+    return out
+
+
+def chain(segs, tol=TOLERANCE):
+    """
+    Order the segments of each layer into paths. Returns (vertices, closed,
+    (layer, color)) per path, the vertices as (x, y, bulge) of the segment
+    leaving each one; an open path ends with a vertex of bulge 0. color is
+    None (by layer) unless every segment of the path has the same one.
+    """
+    index = {}
+    for k, (x0, y0, x1, y1, *_) in enumerate(segs):
+        index.setdefault((round(x0 / tol), round(y0 / tol)), []).append(k)
+        index.setdefault((round(x1 / tol), round(y1 / tol)), []).append(k)
+    used = bytearray(len(segs))
+
+    def take(x, y, layer):
+        # an unused segment of the layer with an end within tol of (x, y),
+        # turned to start there
+        kx, ky = round(x / tol), round(y / tol)
+        for cell in ((kx, ky), (kx - 1, ky), (kx + 1, ky), (kx, ky - 1), (kx, ky + 1),
+                     (kx - 1, ky - 1), (kx + 1, ky - 1), (kx - 1, ky + 1), (kx + 1, ky + 1)):
+            for k in index.get(cell, ()):
+                if used[k]:
+                    continue
+                x0, y0, x1, y1, bulge, other, color = segs[k]
+                if other != layer:
+                    continue
+                if abs(x0 - x) <= tol and abs(y0 - y) <= tol:
+                    used[k] = 1
+                    colors.add(color)
+                    return x0, y0, x1, y1, bulge
+                if abs(x1 - x) <= tol and abs(y1 - y) <= tol:
+                    used[k] = 1
+                    colors.add(color)
+                    return x1, y1, x0, y0, -bulge
+        return None
+
+    paths = []
+    for k, seg in enumerate(segs):
+        if used[k]:
+            continue
+        used[k] = 1
+        layer = seg[5]
+        colors = {seg[6]}
+        path = [seg[:5]]
+        sx, sy = seg[0], seg[1]
+        closed = False
+        while True:
+            x, y = path[-1][2], path[-1][3]
+            if abs(x - sx) <= tol and abs(y - sy) <= tol:
+                closed = True
+                break
+            nxt = take(x, y, layer)
+            if nxt is None:
+                break
+            path.append(nxt)
+        if not closed:
+            # the first segment was in the middle of an open path; walk
+            # back from its start as well
+            back = []
+            while True:
+                prv = take(sx, sy, layer)
+                if prv is None:
+                    break
+                x0, y0, x1, y1, bulge = prv
+                back.append((x1, y1, x0, y0, -bulge))
+                sx, sy = x1, y1
+            path = back[::-1] + path
+        vertices = [(x0, y0, bulge) for x0, y0, _, _, bulge in path]
+        if not closed:
+            vertices.append((path[-1][2], path[-1][3], 0.0))
+        paths.append((vertices, closed,
+                      (layer, colors.pop() if len(colors) == 1 else None)))
+    return paths
+
+
+def _center(p, q):
+    # center and radius of the arc from p to q with bulge p[2]
+    dx, dy = q[0] - p[0], q[1] - p[1]
+    chord = math.hypot(dx, dy)
+    offset = chord * (1 - p[2]**2) / (4 * p[2])
+    return ((p[0] + q[0]) / 2 - dy / chord * offset,
+            (p[1] + q[1]) / 2 + dx / chord * offset,
+            chord * (1 + p[2]**2) / (4 * abs(p[2])))
+
+
+def _joined(p, v, n, tol):
+    """
+    Bulge of one segment from p to n replacing p-v and v-n, or None if
+    they are not one straight line or one arc.
+    """
+    if p[2] == 0 and v[2] == 0:
+        ax, ay = v[0] - p[0], v[1] - p[1]
+        bx, by = n[0] - p[0], n[1] - p[1]
+        length = math.hypot(bx, by)
+        # v lies on the chord from p to n, between them
+        if (length > tol and abs(ax * by - ay * bx) / length <= tol
+                and 0 < ax * bx + ay * by < length**2):
+            return 0.0
+        return None
+    if p[2] * v[2] <= 0:
+        return None
+    sweep = 4 * math.atan(p[2]) + 4 * math.atan(v[2])
+    if abs(sweep) >= 2 * math.pi - 1e-6:
+        return None
+    c1, c2 = _center(p, v), _center(v, n)
+    if all(abs(a - b) <= tol for a, b in zip(c1, c2)):
+        return math.tan(sweep / 4)
+    return None
+
+
+def merge(vertices, closed, tol=TOLERANCE):
+    """
+    Drop every vertex between two segments of the same line, or of the
+    same arc, keeping the path's shape. Returns the shorter vertex list.
+    """
+    out = []
+    for vertex in vertices:
+        out.append(list(vertex))
+        while len(out) >= 3:
+            bulge = _joined(out[-3], out[-2], out[-1], tol)
+            if bulge is None:
+                break
+            out[-3][2] = bulge
+            del out[-2]
+    while closed and len(out) > 3:
+        # the seam where the path closes
+        bulge = _joined(out[-2], out[-1], out[0], tol)
+        if bulge is not None:
+            out[-2][2] = bulge
+            del out[-1]
+            continue
+        bulge = _joined(out[-1], out[0], out[1], tol)
+        if bulge is None:
+            break
+        out[-1][2] = bulge
+        del out[0]
+    return [tuple(v) for v in out]
+
+
+def consolidate(doc, tol=TOLERANCE):
+    """
+    Replace the loose segments in doc's modelspace with one LWPOLYLINE per
+    path, collinear runs merged. Blocks are not touched; explode them
+    first. Returns counts before and after.
+    """
+    msp = doc.modelspace()
+    before = len(msp)
+    segs, entities = segments(msp)
+    kept = unique(segs, tol)
+    paths = chain(kept, tol)
+    # destroy first and drop them from the layout in one pass; deleting one
+    # at a time searches the entity list each time
+    for entity in entities:
+        doc.entitydb.delete_entity(entity)
+    msp.purge()
+    merged = 0
+    for vertices, closed, (layer, color) in paths:
+        vertices = merge(vertices, closed, tol)
+        merged += len(vertices) - (not closed)
+        attribs = {"layer": layer}
+        if color is not None:
+            attribs["color"] = color
+        msp.add_lwpolyline(vertices, format="xyb", close=closed, dxfattribs=attribs)
+    return {
+        "entities_before": before,
+        "entities_after": len(msp),
+        "segments_before": len(segs),
+        "duplicates": len(segs) - len(kept),
+        "segments_after": merged,
+        "paths": len(paths),
+        "open_paths": sum(not closed for _, closed, _ in paths),
+    }
+
+
+def import_time(filename, tol=TOLERANCE, repeat=3):
+    """
+    Best seconds to read a DXF and have every path of it in order, the work
+    a CAM import does: loose segments are chained, polylines are read
+    as they are.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        msp = ezdxf.readfile(filename).modelspace()
+        chain(segments(msp)[0], tol)
+        for e in msp.query("LWPOLYLINE"):
+            e.get_points("xyb")
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def consolidate_file(source, target, tol=TOLERANCE):
+    """
+    consolidate() a DXF file into target. The report adds the import time
+    of both files.
+    """
+    doc = ezdxf.readfile(source)
+    report = consolidate(doc, tol)
+    doc.saveas(target)
+    report["import_s_before"] = round(import_time(source, tol), 4)
+    report["import_s_after"] = round(import_time(target, tol), 4)
+    report["import_speedup"] = round(report["import_s_before"] / report["import_s_after"], 2)
+    return report
@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+"""
+Compare the cut geometry of two DXF files.
+
+Every LINE, ARC and polyline segment, those inside block references
+included, is reduced to a normalized (layer, start, end, bulge) record:
+arcs become bulged segments, and each segment runs from its lower left end
+so that drawing direction does not matter. Records of the two files are
+matched through a hash of their coordinates snapped to the tolerance,
+then within the tolerance through the neighbouring cells. What is left is
+paired by shape, which finds geometry that moved, and the rest was added
+or removed. Notes are compared as text.
+
+Files written with or without --lines, --blocks or --stream therefore
+compare equal when they hold the same cuts:
+
+    report = diff_files("before.dxf", "after.dxf")
+    report["same"], report["layers"]["Pocket"]["moved"]
+
+The files are read tag by tag rather than through ezdxf, which takes
+seconds to load a multi-sheet job drawn with --lines. Only ASCII DXF is
+supported.
+"""
+import math
+import time
+from collections import Counter
+
+from consolidate import TOLERANCE
+
+
+def _entities(filename):
+    """
+    (type, group codes, values) of every entity of the BLOCKS and ENTITIES
+    sections in file order, BLOCK and ENDBLK included. Group codes are
+    left as strings.
+    """
+    with open(filename, encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    if text.startswith("AutoCAD Binary DXF"):
+        raise ValueError("{}: binary DXF is not supported".format(filename))
+    lines = text.splitlines()
+    codes = [code.strip() for code in lines[0::2]]
+    values = lines[1::2]
+    starts = [k for k, code in enumerate(codes) if code == "0"]
+    section = None
+    for i, j in zip(starts, starts[1:] + [len(codes)]):
+        kind = values[i].strip()
+        if kind == "SECTION":
+            section = values[i + 1].strip()
+        elif kind == "ENDSEC":
+            section = None
+        elif section in ("BLOCKS", "ENTITIES"):
+            yield kind, codes[i + 1:j], values[i + 1:j]
+
+
+def _arc(cx, cy, r, start, end):
+    a, b = math.radians(start), math.radians(end)
+    sweep = (end - start) % 360
+    return (cx + r * math.cos(a), cy + r * math.sin(a),
+            cx + r * math.cos(b), cy + r * math.sin(b),
+            math.tan(math.radians(sweep) / 4))
+
+
+def _polyline(vertices, closed):
+    # (x0, y0, x1, y1, bulge) of each segment of a list of (x, y, bulge)
+    ends = vertices[1:] + vertices[:1] if closed else vertices[1:]
+    return [(x0, y0, x1, y1, bulge) for (x0, y0, bulge), (x1, y1, _) in zip(vertices, ends)]
+
+
+class _Drawing:
+    """
+    Segments and notes of one layout or block, before block references
+    are expanded.
+    """
+
+    def __init__(self):
+        # (layer, x0, y0, x1, y1, bulge)
+        self.segments = []
+        # (layer, text, x, y)
+        self.texts = []
+        # (block name, layer, x, y, x scale, y scale, rotation)
+        self.inserts = []
+        self.base = (0.0, 0.0)
+
+
+def read(filename):
+    """
+    (segments, texts, ignored) of a DXF's modelspace, block references
+    expanded: segments as (layer, x0, y0, x1, y1, bulge), texts as (layer,
+    text, x, y), and a count of the entity types that were skipped.
+    """
+    blocks = {}
+    msp = _Drawing()
+    current = msp
+    ignored = Counter()
+    polyline = None
+
+    for kind, codes, values in _entities(filename):
+        get = dict(zip(codes, values)).get
+        if get("67", "0").strip() == "1":
+            # paperspace
+            continue
+        layer = get("8", "0").strip()
+        if polyline is not None and kind != "VERTEX":
+            layer_, vertices, closed = polyline
+            current.segments.extend((layer_,) + s for s in _polyline(vertices, closed))
+            polyline = None
+        if kind == "BLOCK":
+            current = blocks.setdefault(get("2", "").strip(), _Drawing())
+            current.base = (float(get("10", 0)), float(get("20", 0)))
+        elif kind == "ENDBLK":
+            current = msp
+        elif kind == "LINE":
+            current.segments.append((layer, float(get("10")), float(get("20")),
+                                     float(get("11")), float(get("21")), 0.0))
+        elif kind == "ARC":
+            current.segments.append((layer,) + _arc(
+                float(get("10")), float(get("20")), float(get("40")),
+                float(get("50")), float(get("51"))))
+        elif kind == "LWPOLYLINE":
+            vertices = []
+            for code, value in zip(codes, values):
+                if code == "10":
+                    vertices.append([float(value), 0.0, 0.0])
+                elif code == "20":
+                    vertices[-1][1] = float(value)
+                elif code == "42":
+                    vertices[-1][2] = float(value)
+            closed = bool(int(get("70", 0)) & 1)
+            current.segments.extend((layer,) + s for s in _polyline(vertices, closed))
+        elif kind == "POLYLINE":
+            polyline = (layer, [], bool(int(get("70", 0)) & 1))
+        elif kind == "VERTEX" and polyline is not None:
+            polyline[1].append((float(get("10")), float(get("20")), float(get("42", 0))))
+        elif kind == "INSERT":
+            current.inserts.append((get("2", "").strip(), layer,
+                                    float(get("10", 0)), float(get("20", 0)),
+                                    float(get("41", 1)), float(get("42", 1)),
+                                    float(get("50", 0))))
+        elif kind == "TEXT":
+            # DXF writers drop or escape line breaks in TEXT differently
+            text = get("1", "").replace("^J", "").replace("\n", "")
+            current.texts.append((layer, text, float(get("10", 0)), float(get("20", 0))))
+        elif kind != "SEQEND":
+            ignored[kind] += 1
+
+    expanded = {}
+
+    def expand(name):
+        # segments and texts of a block in its own coordinates, its block
+        # references expanded; layer "0" takes the layer of the reference
+        if name not in expanded:
+            block = blocks[name]
+            expanded[name] = _place(block, expand, -block.base[0], -block.base[1])
+        return expanded[name]
+
+    segments, texts = _place(msp, expand)
+    return segments, texts, dict(ignored)
+
+
+def _place(drawing, expand, dx=0.0, dy=0.0):
+    segments = [(layer, x0 + dx, y0 + dy, x1 + dx, y1 + dy, bulge)
+                for layer, x0, y0, x1, y1, bulge in drawing.segments]
+    texts = [(layer, text, x + dx, y + dy) for layer, text, x, y in drawing.texts]
+    for name, layer, ix, iy, sx, sy, rotation in drawing.inserts:
+        inner_segments, inner_texts = expand(name)
+        c, s = math.cos(math.radians(rotation)), math.sin(math.radians(rotation))
+
+        def point(x, y):
+            x, y = x * sx, y * sy
+            return ix + dx + c * x - s * y, iy + dy + s * x + c * y
+
+        # a mirrored reference turns every arc the other way
+        flip = -1 if sx * sy < 0 else 1
+        for inner, x0, y0, x1, y1, bulge in inner_segments:
+            segments.append((layer if inner == "0" else inner,)
+                            + point(x0, y0) + point(x1, y1) + (flip * bulge,))
+        for inner, text, x, y in inner_texts:
+            texts.append((layer if inner == "0" else inner, text) + point(x, y))
+    return segments, texts
+
+
+def normalize(segments, tol=TOLERANCE):
+    """
+    Each segment turned to run from its lower left end, zero length
+    segments dropped, with its snapped key: (key, segment) pairs.
+    """
+    out = []
+    for segment in segments:
+        layer, x0, y0, x1, y1, bulge = segment
+        a = (round(x0 / tol), round(y0 / tol))
+        b = (round(x1 / tol), round(y1 / tol))
+        if a == b:
+            continue
+        if b < a:
+            a, b = b, a
+            segment = (layer, x1, y1, x0, y0, -bulge)
+        out.append(((layer,) + a + b + (round(segment[5] / tol),), segment))
+    return out
+
+
+def _close(p, q, tol):
+    return all(abs(u - v) <= tol for u, v in zip(p[1:], q[1:]))
+
+
+def match(a, b, tol=TOLERANCE):
+    """
+    Match the normalized segments of a against those of b. Returns
+    (matched, only in a, only in b): exact key matches first, then
+    segments within tol of each other through the neighbouring cells.
+    """
+    keys = Counter(key for key, _ in b)
+    matched = []
+    left_a = []
+    for key, segment in a:
+        if keys[key] > 0:
+            keys[key] -= 1
+            matched.append(segment)
+        else:
+            left_a.append(segment)
+    pending = {}
+    for key, segment in b:
+        if keys[key] > 0:
+            keys[key] -= 1
+            pending.setdefault(key[1:3], []).append(segment)
+    if not left_a or not pending:
+        return matched, left_a, [s for group in pending.values() for s in group]
+
+    def find(segment):
+        # remove and return a pending segment within tol, in either
+        # direction: ends that snap to different cells can turn a segment
+        layer, x0, y0, x1, y1, bulge = segment
+        for p in (segment, (layer, x1, y1, x0, y0, -bulge)):
+            kx, ky = round(p[1] / tol), round(p[2] / tol)
+            for cell in ((kx + i, ky + j) for i in (-1, 0, 1) for j in (-1, 0, 1)):
+                group = pending.get(cell, ())
+                for k, other in enumerate(group):
+                    if other[0] == layer and _close(p, other, tol):
+                        return group.pop(k)
+        return None
+
+    only_a = []
+    for segment in left_a:
+        if find(segment) is None:
+            only_a.append(segment)
+        else:
+            matched.append(segment)
+    return matched, only_a, [s for group in pending.values() for s in group]
+
+
+def moves(removed, added, tol=TOLERANCE):
+    """
+    Pair removed and added segments of the same layer, length, direction
+    and bulge. Returns (pairs, still removed, still added); each pair is
+    (removed segment, offset to its added copy).
+    """
+    def shape(segment):
+        layer, x0, y0, x1, y1, bulge = segment
+        return (layer, round((x1 - x0) / tol), round((y1 - y0) / tol), round(bulge / tol))
+
+    groups = {}
+    for segment in removed:
+        groups.setdefault(shape(segment), ([], []))[0].append(segment)
+    for segment in added:
+        groups.setdefault(shape(segment), ([], []))[1].append(segment)
+    pairs, left_removed, left_added = [], [], []
+    for old, new in groups.values():
+        old.sort(key=lambda s: (s[1], s[2]))
+        new.sort(key=lambda s: (s[1], s[2]))
+        n = min(len(old), len(new))
+        pairs += [(p, (q[1] - p[1], q[2] - p[2])) for p, q in zip(old[:n], new[:n])]
+        left_removed += old[n:]
+        left_added += new[n:]
+    return pairs, left_removed, left_added
+
+
+def _bounds(segments):
+    if not segments:
+        return None
+    xs = [v for s in segments for v in (s[1], s[3])]
+    ys = [v for s in segments for v in (s[2], s[4])]
+    return [round(min(xs), 6), round(min(ys), 6), round(max(xs), 6), round(max(ys), 6)]
+
+
+def diff(a, b, tol=TOLERANCE, offsets=5):
+    """
+    Compare the (segments, texts) of two drawings as returned by read().
+    Per layer, the report counts unchanged, moved, added and removed
+    segments, gives the most common offsets of the moved ones and the
+    bounds of what was added and removed.
+    """
+    matched, removed, added = match(normalize(a[0], tol), normalize(b[0], tol), tol)
+    pairs, removed, added = moves(removed, added, tol)
+
+    layers = {}
+
+    def entry(layer):
+        if layer not in layers:
+            layers[layer] = {"unchanged": 0, "moved": 0, "added": 0, "removed": 0,
+                             "offsets": Counter()}
+        return layers[layer]
+
+    for segment in matched:
+        entry(segment[0])["unchanged"] += 1
+    for segment, (dx, dy) in pairs:
+        e = entry(segment[0])
+        e["moved"] += 1
+        e["offsets"][(round(dx, 6), round(dy, 6))] += 1
+    for segment in added:
+        entry(segment[0])["added"] += 1
+    for segment in removed:
+        entry(segment[0])["removed"] += 1
+    for layer, e in layers.items():
+        e["offsets"] = [{"dx": dx, "dy": dy, "segments": n}
+                        for (dx, dy), n in e["offsets"].most_common(offsets)]
+        e["added_bounds"] = _bounds([s for s in added if s[0] == layer])
+        e["removed_bounds"] = _bounds([s for s in removed if s[0] == layer])
+
+    def text_keys(texts):
+        return Counter((layer, text, round(x / tol), round(y / tol))
+                       for layer, text, x, y in texts)
+
+    ta, tb = text_keys(a[1]), text_keys(b[1])
+    texts = {
+        "added": [{"layer": k[0], "text": k[1], "position": [k[2] * tol, k[3] * tol]}
+                  for k in (tb - ta).elements()],
+        "removed": [{"layer": k[0], "text": k[1], "position": [k[2] * tol, k[3] * tol]}
+                    for k in (ta - tb).elements()],
+    }
+    same = not (pairs or added or removed or texts["added"] or texts["removed"])
+    return {"same": same, "tolerance": tol, "layers": dict(sorted(layers.items())),
+            "texts": texts}
+
+
+def diff_files(a, b, tol=TOLERANCE):
+    """
+    diff() two DXF files. The report adds the segment and text count of
+    each file, the entity types that were skipped and the seconds taken.
+    """
+    start = time.perf_counter()
+    drawings = [read(a), read(b)]
+    report = diff(drawings[0][:2], drawings[1][:2], tol)
+    report["files"] = [{"file": name, "segments": len(segments), "texts": len(texts),
+                        "ignored": ignored}
+                       for name, (segments, texts, ignored) in zip((a, b), drawings)]
+    report["seconds"] = round(time.perf_counter() - start, 4)
+    return report
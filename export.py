@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+"""
+Render one recorded layout to DXF, SVG and PDF.
+
+The part generators draw once into a RecordingLayout. The Contours and
+Texts it collects are the backend-neutral drawing, and each exporter
+renders them on its own. export() runs the exporters in parallel
+processes when more than one core is available.
+
+    drawing = record([BoxSpec()])
+    export(drawing, ["box.dxf", "box.svg", "box.pdf"])
+"""
+import math
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from xml.sax.saxutils import escape
+
+from ezdxf import colors
+from ezdxf.enums import TextEntityAlignment
+
+import torsion_box_generator as tbg
+
+# stroke width of the previews, in inches
+STROKE = 0.02
+# margin around the previews, in inches
+MARGIN = 1.0
+# largest page side a PDF reader has to accept, in points
+PDF_MAX = 14400
+
+
+@dataclass
+class Drawing:
+    contours: list
+    texts: list = field(default_factory=list)
+
+    def bounds(self):
+        boxes = [c.bounds() for c in self.contours]
+        for t in self.texts:
+            lines = t.text.split("\n")
+            # rough extent: 0.6 em per character, one line height per line
+            x, y = t.position
+            boxes.append((x, y - t.height * 1.2 * (len(lines) - 1),
+                          x + 0.6 * t.height * max(map(len, lines)), y + t.height))
+        return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def record(specs, nested=False):
+    """
+    Draw a job once and keep it as a Drawing.
+    """
+    recorder = tbg.record_layout(specs, nested)
+    return Drawing(recorder.contours, recorder.texts)
+
+
+def from_dxf(filename):
+    """
+    Drawing of an existing DXF's LWPOLYLINEs and TEXTs, e.g. a file written
+    without --blocks or flattened with --explode.
+    """
+    import ezdxf
+
+    msp = ezdxf.readfile(filename).modelspace()
+    contours = [tbg.Contour.from_vertices(
+                    e.get_points("xyb"), e.dxf.layer,
+                    e.dxf.color if e.dxf.hasattr("color") else None)
+                for e in msp.query("LWPOLYLINE")]
+    texts = [tbg.Text(e.dxf.text.replace("^J", "\n"), tuple(e.dxf.insert)[:2],
+                      e.dxf.height, e.dxf.layer)
+             for e in msp.query("TEXT")]
+    return Drawing(contours, texts)
+
+
+def color_of(layer, color=None):
+    """
+    RGB hex for an entity: its own ACI color, else its layer's. White (the
+    DXF default) is drawn black on the white preview.
+    """
+    aci = color if color is not None else tbg.LAYERS.get(layer, colors.BLACK)
+    if aci in (colors.BLACK, colors.WHITE):
+        return "#000000"
+    return "#{:02x}{:02x}{:02x}".format(*colors.aci2rgb(aci))
+
+
+def _segments(contour):
+    # (x0, y0, x1, y1, bulge) of every segment
+    vertices = contour.vertices().tolist()
+    for (x0, y0, bulge), (x1, y1, _) in zip(vertices, vertices[1:] + vertices[:1]):
+        yield x0, y0, x1, y1, bulge
+
+
+def _arc(x0, y0, x1, y1, bulge):
+    """
+    Center, radius, start angle and signed sweep of a bulged segment.
+    """
+    dx, dy = x1 - x0, y1 - y0
+    chord = math.hypot(dx, dy)
+    offset = chord * (1 - bulge**2) / (4 * bulge)
+    cx = (x0 + x1) / 2 - dy / chord * offset
+    cy = (y0 + y1) / 2 + dx / chord * offset
+    radius = chord * (1 + bulge**2) / (4 * abs(bulge))
+    return cx, cy, radius, math.atan2(y0 - cy, x0 - cx), 4 * math.atan(bulge)
+
+
+def _add_segments(msp, contour):
+    # LINE and ARC entities of one contour, colored as add_contours() does;
+    # the arcs come from the bulges, so no spec is needed
+    attribs = {"layer": contour.layer}
+    if contour.color is not None:
+        attribs["color"] = contour.color
+    arc_attribs = {"layer": contour.layer,
+                   "color": colors.BLACK if contour.color is None else contour.color}
+    for x0, y0, x1, y1, bulge in _segments(contour):
+        if not bulge:
+            msp.add_line((x0, y0), (x1, y1), dxfattribs=attribs)
+            continue
+        cx, cy, radius, start, sweep = _arc(x0, y0, x1, y1, bulge)
+        # DXF arcs run counterclockwise from start to end angle
+        start, end = sorted((start, start + sweep))
+        msp.add_arc((cx, cy), radius, math.degrees(start), math.degrees(end),
+                    dxfattribs=arc_attribs)
+
+
+def to_dxf(drawing, filename, polyline=True):
+    """
+    DXF with one closed LWPOLYLINE per contour, or with polyline False,
+    separate LINE and ARC entities.
+    """
+    doc = tbg.new_document()
+    msp = doc.modelspace()
+    if polyline:
+        tbg.add_contours(None, msp, drawing.contours)
+    else:
+        for contour in drawing.contours:
+            _add_segments(msp, contour)
+    for t in drawing.texts:
+        msp.add_text(t.text, height=t.height,
+                     dxfattribs={"style": "LiberationSerif", "layer": t.layer}
+                     ).set_placement(t.position, align=TextEntityAlignment.LEFT)
+    doc.saveas(filename)
+    return filename
+
+
+def to_svg(drawing, filename):
+    """
+    Full-size SVG in inches, y pointing down, one group per layer.
+    """
+    x0, y0, x1, y1 = drawing.bounds()
+    left, top = x0 - MARGIN, y1 + MARGIN
+    width, height = x1 - x0 + 2 * MARGIN, y1 - y0 + 2 * MARGIN
+    groups = {}
+    for contour in drawing.contours:
+        path = []
+        for k, (ax, ay, bx, by, bulge) in enumerate(_segments(contour)):
+            if k == 0:
+                path.append("M{:.6g} {:.6g}".format(ax - left, top - ay))
+            if bulge:
+                _, _, r, _, _ = _arc(ax, ay, bx, by, bulge)
+                # flipping y turns CCW (positive bulge) into the SVG sweep direction
+                path.append("A{:.6g} {:.6g} 0 {:d} {:d} {:.6g} {:.6g}".format(
+                    r, r, abs(bulge) > 1, bulge > 0, bx - left, top - by))
+            else:
+                path.append("L{:.6g} {:.6g}".format(bx - left, top - by))
+        key = (contour.layer, color_of(contour.layer, contour.color))
+        groups.setdefault(key, []).append('<path d="{}Z"/>'.format("".join(path)))
+    out = ['<svg xmlns="http://www.w3.org/2000/svg" width="{0:.6g}in" height="{1:.6g}in" '
+           'viewBox="0 0 {0:.6g} {1:.6g}">'.format(width, height)]
+    for (layer, stroke), paths in groups.items():
+        out.append('<g id="{}" fill="none" stroke="{}" stroke-width="{}">'.format(
+            escape(layer), stroke, STROKE))
+        out.extend(paths)
+        out.append("</g>")
+    for t in drawing.texts:
+        x, y = t.position[0] - left, top - t.position[1]
+        out.append('<text x="{:.6g}" y="{:.6g}" font-family="serif" font-size="{}" '
+                   'fill="{}">'.format(x, y, t.height, color_of(t.layer)))
+        for k, line in enumerate(t.text.split("\n")):
+            out.append('<tspan x="{:.6g}" dy="{}">{}</tspan>'.format(
+                x, 1.2 * t.height if k else 0, escape(line)))
+        out.append("</text>")
+    out.append("</svg>\n")
+    with open(filename, "w") as f:
+        f.write("\n".join(out))
+    return filename
+
+
+def _pdf_string(text):
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def to_pdf(drawing, filename):
+    """
+    One-page PDF at full size, scaled down only past the 200 inch page limit.
+    Arcs become cubic Beziers of at most 90 degrees each.
+    """
+    x0, y0, x1, y1 = drawing.bounds()
+    width, height = x1 - x0 + 2 * MARGIN, y1 - y0 + 2 * MARGIN
+    scale = min(72.0, PDF_MAX / max(width, height))
+    ops = ["{0:.6g} 0 0 {0:.6g} {1:.6g} {2:.6g} cm".format(
+               scale, (MARGIN - x0) * scale, (MARGIN - y0) * scale),
+           "{:.6g} w 1 J 1 j".format(STROKE)]
+    strokes = {}
+    for contour in drawing.contours:
+        path = []
+        for k, (ax, ay, bx, by, bulge) in enumerate(_segments(contour)):
+            if k == 0:
+                path.append("{:.6f} {:.6f} m".format(ax, ay))
+            if not bulge:
+                path.append("{:.6f} {:.6f} l".format(bx, by))
+                continue
+            cx, cy, r, a, sweep = _arc(ax, ay, bx, by, bulge)
+            pieces = max(1, int(math.ceil(abs(sweep) / (math.pi / 2) - 1e-9)))
+            step = sweep / pieces
+            h = 4 / 3 * math.tan(step / 4) * r
+            for _ in range(pieces):
+                b = a + step
+                path.append("{:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} c".format(
+                    cx + r * math.cos(a) - h * math.sin(a), cy + r * math.sin(a) + h * math.cos(a),
+                    cx + r * math.cos(b) + h * math.sin(b), cy + r * math.sin(b) - h * math.cos(b),
+                    cx + r * math.cos(b), cy + r * math.sin(b)))
+                a = b
+        path.append("h")
+        strokes.setdefault(color_of(contour.layer, contour.color), []).extend(path)
+    for stroke, path in strokes.items():
+        rgb = [int(stroke[i:i + 2], 16) / 255 for i in (1, 3, 5)]
+        ops.append("{:.3g} {:.3g} {:.3g} RG".format(*rgb))
+        ops.extend(path)
+        ops.append("S")
+    for t in drawing.texts:
+        rgb = [int(color_of(t.layer)[i:i + 2], 16) / 255 for i in (1, 3, 5)]
+        ops.append("BT {:.3g} {:.3g} {:.3g} rg /F1 {} Tf {} TL {:.6g} {:.6g} Td".format(
+            *rgb, t.height, 1.2 * t.height, *t.position))
+        ops.append(" T* ".join(_pdf_string(line) + " Tj" for line in t.text.split("\n")))
+        ops.append("ET")
+    stream = zlib.compress("\n".join(ops).encode("latin-1", "replace"))
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {:.2f} {:.2f}] "
+        "/Resources << /Font << /F1 5 0 R >> >> /Contents 4 0 R >>".format(
+            width * scale, height * scale).encode(),
+        b"<< /Length " + str(len(stream)).encode() + b" /Filter /FlateDecode >>\nstream\n"
+        + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Times-Roman >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for k, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % k + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, xref)
+    with open(filename, "wb") as f:
+        f.write(out)
+    return filename
+
+
+EXPORTERS = {".dxf": to_dxf, ".svg": to_svg, ".pdf": to_pdf}
+
+
+def _export_one(job):
+    drawing, filename, polyline = job
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".dxf":
+        return to_dxf(drawing, filename, polyline)
+    return EXPORTERS[ext](drawing, filename)
+
+
+def export(drawing, filenames, processes=None, polyline=True):
+    """
+    Write the drawing to every filename, the format chosen by extension.
+    The exporters run side by side in worker processes unless processes
+    is 1 or there is a single core. polyline=False writes the DXF as
+    separate LINE and ARC entities.
+    """
+    for filename in filenames:
+        if os.path.splitext(filename)[1].lower() not in EXPORTERS:
+            raise ValueError("no exporter for {}; use one of {}".format(
+                filename, ", ".join(EXPORTERS)))
+    jobs = [(drawing, filename, polyline) for filename in filenames]
+    workers = min(len(jobs), processes or os.cpu_count() or 1)
+    if workers <= 1:
+        return [_export_one(job) for job in jobs]
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(_export_one, jobs))
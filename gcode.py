@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+"""
+Cut a torsion box straight from the generated geometry, one G-code file per
+plywood sheet.
+
+Pockets are cut before outer profiles so parts are still held by the sheet
+while their pockets are machined. Within each group the contours are
+ordered with a nearest-neighbour tour over a KD-tree of their entry points,
+then improved with 2-opt moves limited to each point's nearest neighbours.
+"""
+import heapq
+import math
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+import torsion_box_generator as tbg
+
+EPS = 1e-6
+# nodes of the KD-tree hold at most this many points
+LEAF_SIZE = 8
+# 2-opt only tries to reconnect a point with this many nearest neighbours
+NEIGHBOURS = 8
+
+
+@dataclass(frozen=True)
+class Machine:
+    """
+    Router settings. Rates are in inches per minute.
+    """
+    feed: float = 100.0
+    plunge: float = 30.0
+    rapid: float = 400.0
+    safe_z: float = 0.25
+    stepdown: float = 0.25
+    # cut this far below the bottom of the plywood
+    overcut: float = 0.02
+    spindle: int = 18000
+    # G41/G42 so the controller offsets the tool off the drawn outline
+    compensation: bool = True
+    # straight approach onto the outline from the tool side when compensating
+    lead_in: float = 0.2
+
+
+class KDTree:
+    """
+    Static 2-d tree over a set of points that supports removing points, for
+    nearest-unvisited and k-nearest queries.
+    """
+
+    class _Node:
+        __slots__ = ("axis", "split", "left", "right", "items", "count", "parent")
+
+    def __init__(self, points):
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.alive = np.ones(len(self.points), dtype=bool)
+        self._leaf = [None] * len(self.points)
+        self.root = self._build(np.arange(len(self.points)), 0, None)
+
+    def _build(self, items, depth, parent):
+        node = self._Node()
+        node.parent = parent
+        node.count = len(items)
+        if len(items) <= LEAF_SIZE:
+            node.items = items.tolist()
+            node.axis = node.split = node.left = node.right = None
+            for i in node.items:
+                self._leaf[i] = node
+            return node
+        node.items = None
+        node.axis = depth % 2
+        items = items[np.argsort(self.points[items, node.axis], kind="stable")]
+        mid = len(items) // 2
+        node.split = self.points[items[mid], node.axis]
+        node.left = self._build(items[:mid], depth + 1, node)
+        node.right = self._build(items[mid:], depth + 1, node)
+        return node
+
+    def remove(self, i):
+        if not self.alive[i]:
+            return
+        self.alive[i] = False
+        node = self._leaf[i]
+        while node is not None:
+            node.count -= 1
+            node = node.parent
+
+    def nearest(self, q, k=1):
+        """
+        Indices of the k nearest points still in the tree, closest first.
+        """
+        q = (float(q[0]), float(q[1]))
+        best = []  # max-heap of (-distance squared, index)
+        points = self.points
+
+        def visit(node):
+            if node.count == 0:
+                return
+            if node.items is not None:
+                for i in node.items:
+                    if not self.alive[i]:
+                        continue
+                    d = (points[i, 0] - q[0])**2 + (points[i, 1] - q[1])**2
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, i))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, i))
+                return
+            diff = q[node.axis] - node.split
+            near, far = (node.left, node.right) if diff < 0 else (node.right, node.left)
+            visit(near)
+            if len(best) < k or diff * diff < -best[0][0]:
+                visit(far)
+
+        visit(self.root)
+        return [i for _, i in sorted(best, reverse=True)]
+
+
+def _distance(a, b):
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+
+def nearest_neighbour_tour(points, start=(0, 0)):
+    """
+    Visit every point, always moving to the closest one not yet visited.
+    """
+    tree = KDTree(points)
+    tour = []
+    here = start
+    for _ in range(len(points)):
+        i = tree.nearest(here)[0]
+        tree.remove(i)
+        tour.append(i)
+        here = points[i]
+    return tour
+
+
+def two_opt(points, tour, start=(0, 0), max_rounds=50):
+    """
+    Improve an open tour from start by reversing stretches of it, trying
+    only reconnections to each point's nearest neighbours.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    n = len(tour)
+    if n < 3:
+        return list(tour)
+    tree = KDTree(points)
+    neighbours = [tree.nearest(p, NEIGHBOURS + 1)[1:] for p in points]
+    tour = list(tour)
+    position = [0] * n
+    for k, i in enumerate(tour):
+        position[i] = k
+
+    def point(k):
+        return start if k < 0 else points[tour[k]]
+
+    for _ in range(max_rounds):
+        improved = False
+        for k in range(n):
+            # make point(k - 1) adjacent to one of its neighbours c by
+            # reversing tour[k:j+1], where c = tour[j]
+            prev = point(k - 1)
+            before = _distance(prev, point(k))
+            for c in (neighbours[tour[k - 1]] if k > 0 else []):
+                j = position[c]
+                if j <= k:
+                    continue
+                delta = _distance(prev, point(j)) - before
+                if j + 1 < n:
+                    delta += (_distance(point(k), point(j + 1))
+                              - _distance(point(j), point(j + 1)))
+                if delta < -EPS:
+                    tour[k:j + 1] = tour[k:j + 1][::-1]
+                    for m in range(k, j + 1):
+                        position[tour[m]] = m
+                    improved = True
+                    prev = point(k - 1)
+                    before = _distance(prev, point(k))
+        if not improved:
+            break
+    return tour
+
+
+def order_contours(contours, start=(0, 0), optimize=True):
+    """
+    Pockets first, then profiles, each group in travel-minimising order
+    unless optimize is False (then in the order they were drawn). Returns
+    (contour, entry vertex) pairs; the entry is the vertex closest to where
+    the tool comes from that starts a straight segment, since cutter
+    compensation cannot start on an arc.
+    """
+    ordered = []
+    here = start
+    for group in ([c for c in contours if c.layer == "Pocket"],
+                  [c for c in contours if c.layer != "Pocket"]):
+        if not group:
+            continue
+        if optimize:
+            points = np.array([c.start for c in group])
+            tour = two_opt(points, nearest_neighbour_tour(points, here), here)
+            group = [group[i] for i in tour]
+        for contour in group:
+            vertices = contour.vertices()
+            xy = vertices[:, :2]
+            distance = np.hypot(xy[:, 0] - here[0], xy[:, 1] - here[1])
+            distance[vertices[:, 2] != 0] = np.inf
+            entry = int(np.argmin(distance))
+            ordered.append((contour, entry))
+            here = tuple(xy[entry])
+    return ordered
+
+
+def _segments(contour, entry):
+    # (start, end, center or None, length, bulge) of every segment, from the entry
+    vertices = np.roll(contour.vertices(), -entry, axis=0)
+    out = []
+    for k in range(len(vertices)):
+        x0, y0, bulge = vertices[k]
+        x1, y1 = vertices[(k + 1) % len(vertices), :2]
+        chord = math.hypot(x1 - x0, y1 - y0)
+        if bulge == 0:
+            out.append(((x0, y0), (x1, y1), None, chord, 0.0))
+            continue
+        theta = 4 * math.atan(bulge)
+        radius = chord * (1 + bulge**2) / (4 * abs(bulge))
+        # the center lies left of the chord for a CCW arc under 180 degrees
+        offset = chord * (1 - bulge**2) / (4 * bulge)
+        nx, ny = -(y1 - y0) / chord, (x1 - x0) / chord
+        center = ((x0 + x1) / 2 + nx * offset, (y0 + y1) / 2 + ny * offset)
+        out.append(((x0, y0), (x1, y1), center, radius * abs(theta), bulge))
+    return out
+
+
+def toolpath_stats(ordered, depth, machine=Machine(), start=(0, 0)):
+    """
+    Cut length, rapid travel and estimated machine time of an ordered job.
+    """
+    passes = max(1, math.ceil(depth / machine.stepdown - EPS))
+    cut = rapid = 0.0
+    here = start
+    for contour, entry in ordered:
+        entry_point = tuple(contour.vertices()[entry, :2])
+        rapid += _distance(here, entry_point)
+        cut += sum(s[3] for s in _segments(contour, entry))
+        here = entry_point
+    rapid += _distance(here, start)
+    n = len(ordered)
+    minutes = (cut * passes / machine.feed
+               + n * depth / machine.plunge
+               + rapid / machine.rapid
+               + n * 2 * (machine.safe_z + depth) / machine.rapid)
+    return {
+        "contours": n,
+        "passes": passes,
+        "cut_length": round(cut * passes, 3),
+        "rapid_distance": round(rapid, 3),
+        "estimated_minutes": round(minutes, 2),
+    }
+
+
+def _fmt(v):
+    text = "{:.4f}".format(v).rstrip("0").rstrip(".")
+    return "0" if text in ("", "-0") else text
+
+
+def gcode_lines(ordered, depth, machine=Machine(), origin=(0, 0)):
+    """
+    G-code for an ordered job, with coordinates relative to origin (the
+    corner of the sheet).
+    """
+    ox, oy = origin
+    passes = max(1, math.ceil(depth / machine.stepdown - EPS))
+    lines = ["G20 G90 G17 G40", "M3 S{}".format(machine.spindle),
+             "G0 Z{}".format(_fmt(machine.safe_z))]
+    for contour, entry in ordered:
+        hole = contour.layer == "Pocket"
+        ccw = contour.area() > 0
+        lines.append("({} contour)".format("pocket" if hole else "profile"))
+        segments = _segments(contour, entry)
+        x0, y0 = segments[0][0]
+        if machine.compensation:
+            # the tool stays inside holes and outside profiles; plunge one
+            # lead-in away on that side, then feed onto the outline
+            left = hole == ccw
+            (x1, y1), length = segments[0][1], segments[0][3]
+            nx, ny = -(y1 - y0) / length, (x1 - x0) / length
+            if not left:
+                nx, ny = -nx, -ny
+            lx, ly = x0 + nx * machine.lead_in, y0 + ny * machine.lead_in
+            lines.append("G0 X{} Y{}".format(_fmt(lx - ox), _fmt(ly - oy)))
+            lines.append("G41 D1" if left else "G42 D1")
+        else:
+            lines.append("G0 X{} Y{}".format(_fmt(x0 - ox), _fmt(y0 - oy)))
+        for p in range(1, passes + 1):
+            z = -min(depth, p * machine.stepdown)
+            lines.append("G1 Z{} F{}".format(_fmt(z), _fmt(machine.plunge)))
+            if p == 1 and machine.compensation:
+                lines.append("G1 X{} Y{} F{}".format(_fmt(x0 - ox), _fmt(y0 - oy),
+                                                     _fmt(machine.feed)))
+            for k, (sp, ep, center, _, bulge) in enumerate(segments):
+                feed = " F{}".format(_fmt(machine.feed)) if k == 0 else ""
+                if center is None:
+                    lines.append("G1 X{} Y{}{}".format(_fmt(ep[0] - ox), _fmt(ep[1] - oy), feed))
+                else:
+                    lines.append("{} X{} Y{} I{} J{}{}".format(
+                        "G3" if bulge > 0 else "G2", _fmt(ep[0] - ox), _fmt(ep[1] - oy),
+                        _fmt(center[0] - sp[0]), _fmt(center[1] - sp[1]), feed))
+        lines.append("G0 Z{}".format(_fmt(machine.safe_z)))
+        if machine.compensation:
+            lines.append("G40")
+    lines += ["M5", "G0 X0 Y0", "M30"]
+    return lines
+
+
+def sheet_jobs(contours):
+    """
+    Split a drawing into (sheet, contours on that sheet) pairs.
+    """
+    sheets = [c for c in contours if c.layer == "Plywood"]
+    jobs = [(sheet, []) for sheet in sheets]
+    bounds = [sheet.bounds() for sheet in sheets]
+    for contour in contours:
+        if contour.layer == "Plywood":
+            continue
+        x0, y0, x1, y1 = contour.bounds()
+        for (sheet, on_sheet), (a0, b0, a1, b1) in zip(jobs, bounds):
+            if a0 - EPS <= x0 and b0 - EPS <= y0 and x1 <= a1 + EPS and y1 <= b1 + EPS:
+                on_sheet.append(contour)
+                break
+        else:
+            raise ValueError("contour at ({:g}, {:g}) is not on any sheet; the fixed "
+                             "layout overflows its sheets, use --nest".format(x0, y0))
+    return jobs
+
+
+def write_gcode(specs, filename, nested=False, machine=Machine(), optimize=True):
+    """
+    Write one G-code file per sheet, named after filename with _sheetN.nc
+    in place of its extension, and return a report per sheet.
+    """
+    depth = max(spec.plywood_thickness for spec in specs) + machine.overcut
+    stem = os.path.splitext(filename)[0]
+    reports = []
+    for k, (sheet, contours) in enumerate(sheet_jobs(tbg.layout_contours(specs, nested))):
+        origin = sheet.bounds()[:2]
+        ordered = order_contours(contours, origin, optimize)
+        path = "{}_sheet{}.nc".format(stem, k + 1)
+        with open(path, "w") as f:
+            f.write("\n".join(gcode_lines(ordered, depth, machine, origin)) + "\n")
+        report = toolpath_stats(ordered, depth, machine, origin)
+        report["file"] = path
+        reports.append(report)
+    return reports
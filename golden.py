@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+Check generated DXFs against stored golden files.
+
+Every case below is generated afresh with each output variant (polylines,
+--lines, --blocks, --stream) and compared with its golden file in
+golden/ by dxfdiff. The variants hold the same cuts, so they all compare
+against one file. Any added, removed or moved segment or changed note
+fails the run:
+
+    python golden.py              # exits 1 on a difference
+    python golden.py --update     # rewrite the golden files after an intended change
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import torsion_box_generator as tbg
+from dxfdiff import diff_files
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+
+# name -> (boxes of the job, nested)
+CASES = {
+    "default": ([tbg.BoxSpec()], False),
+    "small": ([tbg.BoxSpec(box_length=48, box_width=24, box_height=4,
+                           nbraces=4, ntabs=1)], False),
+    "dense": ([tbg.BoxSpec(box_length=180, nbraces=16, ntabs=6)], False),
+    "fine_tool": ([tbg.BoxSpec(endmill_diameter=0.125, notch_length=3,
+                               padding=0.05)], False),
+    "thick": ([tbg.BoxSpec(plywood_thickness=0.75, box_height=5, nbraces=6,
+                           ntabs=2)], False),
+    "stacked": ([tbg.BoxSpec(), tbg.BoxSpec(nbraces=10, box_height=8)], False),
+    "nested": ([tbg.BoxSpec(), tbg.BoxSpec(box_length=72, box_width=36,
+                                           nbraces=6, ntabs=2)], True),
+    "tiled": ([tbg.BoxSpec(box_length=240, nbraces=21)], True),
+}
+# output options every case is written with
+VARIANTS = {
+    "polyline": {},
+    "lines": {"polyline": False},
+    "blocks": {"instance": True},
+    "stream": {"streaming": True},
+}
+# golden files are stored with blocks, the smallest output
+GOLDEN_OPTIONS = VARIANTS["blocks"]
+
+
+def golden_filename(case):
+    return os.path.join(GOLDEN_DIR, case + ".dxf")
+
+
+def write_case(case, filename, **options):
+    specs, nested = CASES[case]
+    if nested:
+        from nesting import write_nested
+        write_nested(specs, filename, **options)
+    else:
+        tbg.write_job(specs, filename, **options)
+    return filename
+
+
+def _check(job):
+    case, variant = job
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "{}_{}.dxf".format(case, variant))
+        start = time.perf_counter()
+        write_case(case, filename, **VARIANTS[variant])
+        generated = time.perf_counter() - start
+        report = diff_files(golden_filename(case), filename)
+    report["case"], report["variant"] = case, variant
+    report["generate_s"] = round(generated, 4)
+    report["files"][1]["file"] = "{}/{}".format(case, variant)
+    return report
+
+
+def check(cases=None, variants=None, processes=None):
+    """
+    Diff every case and variant against its golden file. Returns the
+    dxfdiff reports, each with its case and variant.
+    """
+    cases = cases or list(CASES)
+    variants = variants or list(VARIANTS)
+    missing = [case for case in cases if not os.path.exists(golden_filename(case))]
+    if missing:
+        raise FileNotFoundError("no golden file for {}; run golden.py --update"
+                                .format(", ".join(missing)))
+    jobs = [(case, variant) for case in cases for variant in variants]
+    workers = min(len(jobs), processes or os.cpu_count() or 1)
+    if workers <= 1:
+        return [_check(job) for job in jobs]
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(_check, jobs))
+
+
+def update(cases=None):
+    """
+    Rewrite the golden file of every case. Returns the filenames.
+    """
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    return [write_case(case, golden_filename(case), **GOLDEN_OPTIONS)
+            for case in cases or CASES]
+
+
+def _summary(report):
+    changes = {layer: {k: e[k] for k in ("moved", "added", "removed") if e[k]}
+               for layer, e in report["layers"].items()}
+    changes = {layer: c for layer, c in changes.items() if c}
+    texts = len(report["texts"]["added"]) + len(report["texts"]["removed"])
+    if texts:
+        changes["notes"] = texts
+    return changes
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--update", action="store_true",
+                        help="rewrite the golden files instead of checking")
+    parser.add_argument("--case", action="append", choices=list(CASES),
+                        help="only this case (may be repeated)")
+    parser.add_argument("--variant", action="append", choices=list(VARIANTS),
+                        help="only this output variant (may be repeated)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="worker processes (default: all cores)")
+    parser.add_argument("-o", "--output", metavar="JSON",
+                        help="write the full diff reports to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.update:
+        for filename in update(args.case):
+            print(filename)
+        return
+    reports = check(args.case, args.variant, args.jobs)
+    for report in reports:
+        print("{:4} {:10} {:8} generate {:6.3f} s, diff {:6.3f} s  {}".format(
+            "ok" if report["same"] else "FAIL", report["case"], report["variant"],
+            report["generate_s"], report["seconds"],
+            "" if report["same"] else json.dumps(_summary(report))))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=2)
+    if not all(report["same"] for report in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
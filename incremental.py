@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""
+Regenerate only what a parameter change affects.
+
+Each part is drawn through a stand-in spec that records which fields and
+derived quantities (x_spacing, corner_finger_length, ...) it reads. That
+gives the dependency graph from inputs to parts. An IncrementalLayout keeps
+the document and the entities of every placed part between updates. On an
+update, parts that read a changed field are drawn again; parts whose
+inputs are unchanged are kept, and translated if their place on the sheet
+moved.
+
+    session = IncrementalLayout(BoxSpec())
+    session.update(replace(spec, box_height=8))   # braces only
+    session.saveas("torsion_box.dxf")
+"""
+from dataclasses import dataclass, field, fields
+
+import torsion_box_generator as tbg
+
+
+class _Tracer:
+    """
+    Read-only stand-in for a BoxSpec that records the fields and derived
+    properties read through it.
+    """
+
+    def __init__(self, spec, used, derived):
+        self._spec = spec
+        self._used = used
+        self._derived = derived
+
+    def __getattr__(self, name):
+        attr = getattr(type(self._spec), name, None)
+        if isinstance(attr, property):
+            self._derived.add(name)
+            # evaluated against the tracer so the fields it reads are recorded
+            return attr.fget(self)
+        self._used.add(name)
+        return getattr(self._spec, name)
+
+
+def trace(fn, spec):
+    """
+    Call fn(tracer) and return (result, fields read, derived properties read).
+    """
+    used, derived = set(), set()
+    result = fn(_Tracer(spec, used, derived))
+    return result, used, derived
+
+
+def derived_dependencies(spec=None):
+    """
+    Field names every BoxSpec property reads, e.g. corner_finger_length ->
+    {box_height, plywood_thickness}.
+    """
+    spec = spec or tbg.BoxSpec()
+    graph = {}
+    for name, attr in vars(tbg.BoxSpec).items():
+        if isinstance(attr, property):
+            _, used, _ = trace(lambda s: getattr(s, name), spec)
+            graph[name] = used
+    return graph
+
+
+def dependency_graph(spec=None, polyline=True):
+    """
+    Which inputs each derived quantity and each part depends on, plus the
+    reverse: the parts each input invalidates.
+    """
+    spec = spec or tbg.BoxSpec()
+    parts = {}
+    msp = tbg.new_document().modelspace()
+    for name, sp in tbg.layout_plan(spec).placements:
+        _, used, derived = trace(
+            lambda s: tbg.EMITTERS[name](s, msp, sp, polyline, False), spec)
+        entry = parts.setdefault(name, {"fields": set(), "derived": set()})
+        entry["fields"] |= used
+        entry["derived"] |= derived
+    invalidates = {f.name: sorted(n for n, e in parts.items() if f.name in e["fields"])
+                   for f in fields(tbg.BoxSpec)}
+    return {
+        "derived": {n: sorted(u) for n, u in derived_dependencies(spec).items()},
+        "parts": {n: {k: sorted(v) for k, v in e.items()} for n, e in parts.items()},
+        "invalidates": invalidates,
+    }
+
+
+class _Capture:
+    """
+    Forward add_* calls to a layout and keep the entities they create.
+    """
+
+    def __init__(self, msp):
+        self.msp = msp
+        self.doc = msp.doc
+        self.entities = []
+
+    def __getattr__(self, name):
+        method = getattr(self.msp, name)
+
+        def add(*args, **kwargs):
+            entity = method(*args, **kwargs)
+            self.entities.append(entity)
+            return entity
+        return add
+
+
+@dataclass
+class _Slot:
+    position: tuple
+    entities: list = field(default_factory=list)
+
+
+@dataclass
+class _Part:
+    # fields the part read when it was last drawn
+    used: set
+    slots: list
+
+
+class IncrementalLayout:
+    """
+    A document holding one or more boxes, stacked BOX_PITCH apart like
+    write_job(), that is updated in place as the specs change.
+    """
+
+    def __init__(self, specs, polyline=True, instance=False):
+        self.doc = tbg.new_document()
+        self.msp = self.doc.modelspace()
+        self.polyline = polyline
+        self.instance = instance
+        self.specs = []
+        # (box index, part name) -> _Part
+        self.parts = {}
+        self.update(specs)
+
+    def _draw(self, spec, name, position):
+        capture = _Capture(self.msp)
+        _, used, _ = trace(lambda s: tbg.EMITTERS[name](
+            s, capture, position, self.polyline, self.instance), spec)
+        return _Slot(position, capture.entities), used
+
+    def _delete(self, part):
+        for slot in part.slots:
+            for entity in slot.entities:
+                self.msp.delete_entity(entity)
+
+    def update(self, specs):
+        """
+        Bring the document in line with specs (one BoxSpec or a list).
+        Returns the (box, part) keys that were drawn again and moved.
+        """
+        if isinstance(specs, tbg.BoxSpec):
+            specs = [specs]
+        drawn, moved = [], []
+        placed = {}
+        for k, spec in enumerate(specs):
+            old = self.specs[k] if k < len(self.specs) else None
+            changed = {f.name for f in fields(spec)
+                       if old is None or getattr(old, f.name) != getattr(spec, f.name)}
+            positions = {}
+            for name, sp in tbg.layout_plan(spec, (0, k * tbg.BOX_PITCH)).placements:
+                positions.setdefault(name, []).append(sp)
+            for name, sps in positions.items():
+                key = (k, name)
+                placed[key] = True
+                part = self.parts.get(key)
+                if part is None or part.used & changed or len(part.slots) != len(sps):
+                    if part is not None:
+                        self._delete(part)
+                    used, slots = set(), []
+                    for sp in sps:
+                        slot, reads = self._draw(spec, name, sp)
+                        slots.append(slot)
+                        used |= reads
+                    self.parts[key] = _Part(used, slots)
+                    drawn.append(key)
+                    continue
+                if any(slot.position != sp for slot, sp in zip(part.slots, sps)):
+                    for slot, sp in zip(part.slots, sps):
+                        dx, dy = sp[0] - slot.position[0], sp[1] - slot.position[1]
+                        if dx or dy:
+                            for entity in slot.entities:
+                                entity.translate(dx, dy, 0)
+                            slot.position = sp
+                    moved.append(key)
+        for key in [key for key in self.parts if key not in placed]:
+            self._delete(self.parts.pop(key))
+        self.specs = list(specs)
+        return {"drawn": drawn, "moved": moved}
+
+    def _purge_blocks(self):
+        # blocks of parts that were drawn again are no longer referenced
+        used = set()
+        todo = [self.msp]
+        while todo:
+            for insert in todo.pop().query("INSERT"):
+                if insert.dxf.name not in used:
+                    used.add(insert.dxf.name)
+                    todo.append(self.doc.blocks.get(insert.dxf.name))
+        for block in list(self.doc.blocks):
+            if (not block.is_any_layout and not block.name.startswith("*")
+                    and block.name not in used):
+                self.doc.blocks.delete_block(block.name, safe=False)
+
+    def saveas(self, filename):
+        if self.instance:
+            self._purge_blocks()
+        self.doc.saveas(filename)
+        return filename
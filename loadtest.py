@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""
+Compare the warm generation server against one cold process per request.
+
+    python loadtest.py -n 200 -c 4 --cold 10
+
+Starts server.py on a free port unless --url or --socket points at a
+running one, sends n /generate requests c at a time, then runs the
+command line generator --cold times in fresh processes, and prints the
+latency and throughput of both as JSON.
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# the requests cycle through these boxes
+NBRACES = [4, 6, 8, 10, 12]
+NTABS = [2, 3]
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=60):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def connect(url=None, socket_path=None):
+    if socket_path:
+        return UnixHTTPConnection(socket_path)
+    parts = urlsplit(url)
+    return http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+
+
+def request(target, method, path, body=None):
+    conn = connect(**target)
+    try:
+        conn.request(method, path, body,
+                     {"Content-Type": "application/json"} if body else {})
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def box(k):
+    return {"nbraces": NBRACES[k % len(NBRACES)], "ntabs": NTABS[k // len(NBRACES) % len(NTABS)]}
+
+
+def summary(latencies, wall):
+    latencies = sorted(latencies)
+
+    def pick(q):
+        return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1e3, 2)
+    return {
+        "requests": len(latencies),
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "p50_ms": pick(0.5), "p90_ms": pick(0.9), "p99_ms": pick(0.99),
+        "mean_ms": round(statistics.mean(latencies) * 1e3, 2),
+    }
+
+
+def warm(target, n, concurrency):
+    def one(k):
+        body = json.dumps({"spec": box(k)}).encode()
+        t = time.perf_counter()
+        status, reply = request(target, "POST", "/generate", body)
+        if status != 200:
+            raise RuntimeError("request {} failed with {}: {}".format(k, status, reply[:200]))
+        return time.perf_counter() - t
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = list(pool.map(one, range(n)))
+    return summary(latencies, time.perf_counter() - start)
+
+
+def cold(n):
+    latencies = []
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        for k in range(n):
+            spec = box(k)
+            t = time.perf_counter()
+            subprocess.run([sys.executable, os.path.join(HERE, "torsion_box_generator.py"),
+                            "--nbraces", str(spec["nbraces"]), "--ntabs", str(spec["ntabs"]),
+                            "-o", os.path.join(tmp, "box.dxf")], check=True)
+            latencies.append(time.perf_counter() - t)
+        return summary(latencies, time.perf_counter() - start)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(concurrency):
+    port = _free_port()
+    process = subprocess.Popen([sys.executable, os.path.join(HERE, "server.py"),
+                                "--port", str(port), "--max-concurrent", str(concurrency)],
+                               stdout=subprocess.PIPE, text=True)
+    # the server prints its address once it is warm and listening
+    process.stdout.readline()
+    return process, {"url": "http://127.0.0.1:{}".format(port)}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="running server, e.g. http://127.0.0.1:8765")
+    parser.add_argument("--socket", metavar="PATH", help="running server's Unix socket")
+    parser.add_argument("-n", "--requests", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=4)
+    parser.add_argument("--cold", type=int, default=10,
+                        help="cold command line runs to compare against")
+    parser.add_argument("-o", "--output", help="also write the results to this JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    process = None
+    if args.url or args.socket:
+        target = {"url": args.url, "socket_path": args.socket}
+    else:
+        process, target = start_server(args.concurrency)
+    try:
+        results = {"warm": warm(target, args.requests, args.concurrency)}
+        results["server"] = json.loads(request(target, "GET", "/metrics")[1])
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+    if args.cold:
+        results["cold"] = cold(args.cold)
+        results["speedup_p50"] = round(results["cold"]["p50_ms"] / results["warm"]["p50_ms"], 1)
+        results["speedup_throughput"] = round(
+            results["warm"]["throughput_rps"] / results["cold"]["throughput_rps"], 1)
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
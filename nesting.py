@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+"""
+Pack the plates and braces of one or more boxes onto as few plywood sheets
+as possible. Boxes longer than a sheet are nested as tiled pieces.
+
+Parts are placed bottom-left first, largest first, on their bounding boxes,
+keeping one endmill diameter between parts. Placed parts are kept in a
+uniform grid per sheet so each overlap test only looks at its neighbours,
+which keeps jobs with hundreds of parts fast.
+"""
+import bisect
+import itertools
+from dataclasses import dataclass, field
+from functools import cached_property
+
+from ezdxf.enums import TextEntityAlignment
+
+import torsion_box_generator as tbg
+
+# grid cell of the per-sheet spatial index, in inches
+CELL = 12.0
+# vertical gap between sheets in the output drawing
+SHEET_GAP = 8
+EPS = 1e-9
+
+
+@dataclass
+class Part:
+    name: str
+    spec: tbg.BoxSpec
+    contours: list
+    bounds: tuple = None
+
+    def __post_init__(self):
+        if self.bounds is None:
+            # the pockets lie inside the outline
+            self.bounds = self.contours[0].bounds()
+
+    @property
+    def size(self):
+        return (self.bounds[2] - self.bounds[0], self.bounds[3] - self.bounds[1])
+
+    @cached_property
+    def area(self):
+        """
+        Material area: the outline less its pockets.
+        """
+        outline, *holes = self.contours
+        return abs(outline.area()) - sum(abs(h.area()) for h in holes)
+
+
+@dataclass
+class Placement:
+    part: Part
+    sheet: int
+    x: float
+    y: float
+    rotated: bool = False
+
+    @property
+    def size(self):
+        w, h = self.part.size
+        return (h, w) if self.rotated else (w, h)
+
+    def contours(self, origin=(0, 0)):
+        """
+        The part's contours moved to this placement on a sheet at origin.
+        """
+        contours = self.part.contours
+        x0, y0 = self.part.bounds[:2]
+        if self.rotated:
+            contours = [c.rotated90() for c in contours]
+            # turning CCW maps the old top edge onto the new left edge
+            x0, y0 = -self.part.bounds[3], self.part.bounds[0]
+        dx = origin[0] + self.x - x0
+        dy = origin[1] + self.y - y0
+        return [c.moved(dx, dy) for c in contours]
+
+
+@dataclass
+class Nesting:
+    placements: list
+    sheets: int
+    sheet_size: tuple
+    spacing: float
+    parts: list = field(default_factory=list)
+
+    @property
+    def utilization(self):
+        """
+        Share of the sheet area that ends up as parts.
+        """
+        if not self.sheets:
+            return 0.0
+        w, h = self.sheet_size
+        return sum(p.part.area for p in self.placements) / (self.sheets * w * h)
+
+    def report(self):
+        return {
+            "sheets": self.sheets,
+            "parts": len(self.placements),
+            "sheet_size": list(self.sheet_size),
+            "spacing": self.spacing,
+            "utilization": round(self.utilization, 4),
+        }
+
+
+class _Sheet:
+    """
+    Placed rectangles of one sheet, bucketed in a uniform grid, plus the
+    bottom-left candidate corners for the next part.
+    """
+
+    def __init__(self, size, spacing):
+        self.size = size
+        self.spacing = spacing
+        self.rects = []
+        self.grid = {}
+        self.candidates = [(0.0, 0.0)]
+        self.area_left = size[0] * size[1]
+
+    def _cells(self, x0, y0, x1, y1):
+        for i in range(int(x0 // CELL), int(x1 // CELL) + 1):
+            for j in range(int(y0 // CELL), int(y1 // CELL) + 1):
+                yield i, j
+
+    def free(self, x0, y0, x1, y1):
+        if x1 > self.size[0] + EPS or y1 > self.size[1] + EPS:
+            return False
+        s = self.spacing
+        seen = set()
+        for cell in self._cells(x0 - s, y0 - s, x1 + s, y1 + s):
+            for k in self.grid.get(cell, ()):
+                if k in seen:
+                    continue
+                seen.add(k)
+                a0, b0, a1, b1 = self.rects[k]
+                if (x0 < a1 + s - EPS and a0 < x1 + s - EPS and
+                        y0 < b1 + s - EPS and b0 < y1 + s - EPS):
+                    return False
+        return True
+
+    def find(self, w, h):
+        """
+        Lowest, then leftmost, free candidate corner for a w x h part.
+        """
+        # parts within EPS of the sheet size may exceed its area by a hair
+        if w * h > self.area_left + EPS * (w + h):
+            return None
+        for y, x in self.candidates:
+            if self.free(x, y, x + w, y + h):
+                return x, y
+        return None
+
+    def add(self, x, y, w, h):
+        k = len(self.rects)
+        self.rects.append((x, y, x + w, y + h))
+        self.area_left -= w * h
+        for cell in self._cells(x, y, x + w, y + h):
+            self.grid.setdefault(cell, []).append(k)
+        self.candidates.remove((y, x))
+        for corner in ((y, x + w + self.spacing), (y + h + self.spacing, x)):
+            bisect.insort(self.candidates, corner)
+
+
+def nest(parts, sheet_size=tbg.SHEET_SIZE, spacing=0.25):
+    """
+    Place parts on as few sheet_size sheets as possible, spacing apart.
+    Parts may be turned 90 degrees.
+    """
+    sheets = []
+    placements = []
+    order = sorted(parts, key=lambda p: (max(p.size), p.size[0] * p.size[1]),
+                   reverse=True)
+    # smallest bounding box area of the parts still to come; sheets with
+    # less area left are closed so long jobs do not rescan full sheets
+    smallest = list(itertools.accumulate(
+        (p.size[0] * p.size[1] for p in reversed(order)), min))[::-1]
+    open_sheets = []
+    for k, part in enumerate(order):
+        open_sheets = [(i, s) for i, s in open_sheets if s.area_left >= smallest[k]]
+        w, h = part.size
+        orientations = [(False, w, h), (True, h, w)]
+        if not any(a <= sheet_size[0] + EPS and b <= sheet_size[1] + EPS
+                   for _, a, b in orientations):
+            raise ValueError("{} ({:g} x {:g}) does not fit on a {:g} x {:g} sheet"
+                             .format(part.name, w, h, *sheet_size))
+        best = None
+        for index, sheet in open_sheets + [(len(sheets), _Sheet(sheet_size, spacing))]:
+            for rotated, a, b in orientations:
+                corner = sheet.find(a, b)
+                if corner and (best is None or (corner[1], corner[0]) < best[0]):
+                    best = ((corner[1], corner[0]), index, sheet, rotated, a, b)
+            if best:
+                break
+        if best is None:
+            raise ValueError("{} ({:g} x {:g}) does not fit on an empty {:g} x {:g} sheet"
+                             .format(part.name, w, h, *sheet_size))
+        (y, x), index, sheet, rotated, a, b = best
+        if index == len(sheets):
+            sheets.append(sheet)
+            open_sheets.append((index, sheet))
+        sheet.add(x, y, a, b)
+        placements.append(Placement(part, index, x, y, rotated))
+    placements.sort(key=lambda p: (p.sheet, p.y, p.x))
+    return Nesting(placements, len(sheets), tuple(sheet_size), spacing, list(parts))
+
+
+def box_parts(spec, max_length=None):
+    """
+    Every part of one box: two plates (the bottom one with leg holes), a
+    short brace per brace and two long braces. With max_length, plates and
+    long braces longer than that are split at brace lines (see tiling.py)
+    into pieces named like TOP_PLATE_1, TOP_PLATE_2, ...
+    """
+    if max_length is not None and spec.box_length > max_length:
+        from tiling import long_brace_pieces, plate_pieces
+
+        parts = []
+        for name, pieces in (("TOP_PLATE", plate_pieces(spec, max_length)),
+                             ("BOTTOM_PLATE", plate_pieces(spec, max_length, True))):
+            parts += [Part("{}_{}".format(name, k), spec, contours)
+                      for k, contours in enumerate(pieces, 1)]
+        longs = [Part("LONG_BRACE_{}".format(k), spec, contours)
+                 for k, contours in enumerate(long_brace_pieces(spec, max_length), 1)]
+    else:
+        parts = [Part("TOP_PLATE", spec, tbg.top_plate_contours(spec)),
+                 Part("BOTTOM_PLATE", spec, tbg.top_plate_contours(spec)
+                      + tbg.leg_hole_contours(spec, (0, 0)))]
+        longs = [Part("LONG_BRACE", spec, tbg.long_brace_contours(spec, (0, 0)))]
+    # copies share their contours and bounds
+    short = Part("SHORT_BRACE", spec, tbg.short_brace_contours(spec, (0, 0)))
+    parts += [Part(short.name, spec, short.contours, short.bounds)
+              for _ in range(spec.nbraces)]
+    parts += [Part(long.name, spec, long.contours, long.bounds)
+              for long in longs for _ in range(2)]
+    return parts
+
+
+def nest_job(specs, sheet_size=tbg.SHEET_SIZE, spacing=None):
+    """
+    Nest every part of every box. spacing defaults to the largest endmill
+    diameter in the job. Plates and long braces longer than the sheet are
+    split into pieces that fit.
+    """
+    if spacing is None:
+        spacing = max(spec.endmill_diameter for spec in specs)
+    parts = [part for spec in specs for part in box_parts(spec, max(sheet_size))]
+    return nest(parts, sheet_size, spacing)
+
+
+def draw_nesting(nesting, msp, origin=(0, 0), polyline=True, instance=False):
+    """
+    Draw the sheets one above the other, starting at origin, with their parts.
+    """
+    w, h = nesting.sheet_size
+    corners = [(origin[0], origin[1] + k * (h + SHEET_GAP))
+               for k in range(nesting.sheets)]
+    for corner in corners:
+        tbg.plywood(msp, corner, polyline, instance, nesting.sheet_size)
+    for placement in nesting.placements:
+        corner = corners[placement.sheet]
+        contours = placement.contours(corner)
+        bounds = contours[0].bounds()
+        tbg.add_part(placement.part.spec, msp, placement.part.name, contours,
+                     bounds[:2], polyline, instance)
+
+    report = nesting.report()
+    note = "Sheets: {}, Utilization: {:.1%}, Spacing: {}".format(
+        report["sheets"], nesting.utilization, nesting.spacing)
+    msp.add_text(
+        note,
+        height=1,
+        dxfattribs={"style": "LiberationSerif", "layer": "Notes"}
+    ).set_placement((origin[0], origin[1] - 2), align=TextEntityAlignment.LEFT)
+
+
+def write_nested(specs, filename, sheet_size=tbg.SHEET_SIZE, spacing=None,
+                 streaming=False, **options):
+    """
+    Nest the boxes and save the sheets to filename. Returns the Nesting.
+    """
+    with tbg.span("nest"):
+        nesting = nest_job(specs, sheet_size, spacing)
+    tbg.write_dxf(filename, lambda msp: draw_nesting(nesting, msp, **options),
+                  streaming)
+    return nesting
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+"""
+Choose the brace count, tab count and notch length for a box of given
+outer dimensions.
+
+Candidates are scored with a closed-form model instead of being drawn:
+part sizes, the sheets the nested parts need, the total cut length and
+the narrowest finger left between two notches. Each score is a numpy
+expression over the whole grid of candidates at once. Candidates that
+keep the braces and tabs within the spacing limit are reduced to their
+Pareto front: fewer sheets, a shorter cut, closer braces, wider
+plywood between the notches and longer fingers in them. Only the
+configuration picked from that front is drawn:
+
+    front = optimize(BoxSpec(box_length=72, box_width=36))
+    generate(front[0].spec, "bench.dxf")
+
+The cut length is exactly that of the parts nest_job() cuts, tiled pieces
+included. The sheet count is an area estimate of what nest_job() needs.
+Over the fronts of 48-240" by 24-48" boxes it matched on 77% of the
+options, was one sheet high on 16% and two on 1%, and one sheet low on
+6%. Since sheets come first, the EXACT options at the head of the front
+are nested for real before they are ranked; over the same boxes that
+always found the fewest sheets of the whole front, with a cut within
+0.1% of the shortest.
+"""
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, replace
+
+import numpy as np
+
+import torsion_box_generator as tbg
+
+# values searched; fingers shorter than 2" hold a brace poorly
+NBRACES = range(3, 65)
+NTABS = range(1, 25)
+NOTCH_LENGTHS = np.arange(2.0, 6.01, 0.25)
+# the largest distance between two brace or two tab centre lines, in inches
+MAX_SPACING = 16.0
+# the narrowest plywood allowed between two notches of an edge
+MIN_FINGER = 1.0
+# candidates compared with each other at a time when finding the front
+BLOCK = 512
+# share of its sheets that nest_job() fills, over boxes of many sizes;
+# 0.85 and 0.95 miss more often
+UTILIZATION = 0.9
+# options at the head of the front whose sheets are counted by nest_job()
+EXACT = 32
+# estimated minus nested sheets -> share of the options, measured as above
+SHEETS_ERROR = {-1: 0.056, 0: 0.775, 1: 0.157, 2: 0.013}
+# side of the leg holes, as drawn by leg_hole_contours()
+LEG_HOLE = 3.5
+
+
+@dataclass(frozen=True)
+class Option:
+    spec: tbg.BoxSpec
+    sheets: int
+    cut_length: float
+    spacing: float
+    min_finger: float
+    # sheets counted by nest_job() rather than estimated
+    exact: bool = False
+
+    def to_dict(self):
+        return {
+            "nbraces": self.spec.nbraces,
+            "ntabs": self.spec.ntabs,
+            "notch_length": self.spec.notch_length,
+            "sheets": self.sheets,
+            "sheets_exact": self.exact,
+            "cut_length": round(self.cut_length, 3),
+            "spacing": round(self.spacing, 3),
+            "min_finger": round(self.min_finger, 3),
+        }
+
+
+def candidates(nbraces=NBRACES, ntabs=NTABS, notch_lengths=NOTCH_LENGTHS):
+    """
+    nbraces, ntabs and notch_length arrays of every combination.
+    """
+    nb, nt, nl = np.meshgrid(np.asarray(nbraces, dtype=float),
+                             np.asarray(ntabs, dtype=float),
+                             np.asarray(notch_lengths, dtype=float), indexing="ij")
+    return nb.ravel(), nt.ravel(), nl.ravel()
+
+
+def _pocket(spec, width, height):
+    # perimeter of a pocket_contours() pocket; each corner relief is a half
+    # circle of the endmill radius
+    c = spec.chord_length
+    return (2 * (width + 2*spec.padding - 2*c) + 2 * (height + 2*spec.padding - 2*c)
+            + 4 * math.pi * spec.endmill_radius)
+
+
+def _tiles(L, nb, pitch, offset, max_length):
+    """
+    Number of pieces tiling.spans() cuts a part into, their longest length
+    and whether every piece fits, for arrays of brace counts and pitches.
+    The inner brace lines of a part lie at i * pitch - offset.
+    """
+    def x(i):
+        return np.where(i == 0, 0.0, np.where(i >= nb - 1, L, i * pitch - offset))
+
+    a = np.zeros_like(nb)
+    pieces = np.ones_like(nb)
+    longest = np.zeros_like(nb)
+    fits = np.ones(nb.shape, dtype=bool)
+    todo = L - x(a) > max_length + 1e-9
+    while todo.any():
+        # the furthest line within max_length of a, as spans() picks it
+        reach = x(a) + max_length + 1e-9
+        b = np.minimum(np.floor((reach + offset) / pitch), nb - 2)
+        fits &= ~todo | (b > a)
+        todo &= b > a
+        longest = np.where(todo, np.maximum(longest, x(b) - x(a)), longest)
+        pieces += todo
+        a = np.where(todo, b, a)
+        todo &= L - x(a) > max_length + 1e-9
+    longest = np.maximum(longest, L - x(a))
+    return pieces, longest, fits
+
+
+def model(base, nb, nt, nl, sheet_size=tbg.SHEET_SIZE, spacing=None):
+    """
+    Scores of every candidate (arrays nb, nt, nl) for the box dimensions of
+    base, as arrays: x_spacing, y_spacing, spacing (the wider brace or tab
+    pitch), min_finger, pieces (per plate and long brace), sheets,
+    cut_length and valid.
+    """
+    L, W, H = base.box_length, base.box_width, base.box_height
+    p, nw, c = base.padding, base.notch_width, base.chord_length
+    arc = math.pi * base.endmill_radius
+    cfl = base.corner_finger_length
+    gap = base.endmill_diameter if spacing is None else spacing
+
+    # the same expressions as the BoxSpec properties, over arrays
+    xs = (L - (nl + 2*p) * (nb - 2)) / (nb - 1)
+    ys = (W - (nl + 2*p) * nt) / (nt + 1)
+    depth = nw + p - c
+    span = nl + 2*p - 2*c
+
+    # outlines, following the moves of the *_contours() functions
+    plate = 2 * ((nb - 2) * (xs + 2*depth + span + 2*arc) + xs
+                 + nt * (ys + 2*depth + span + 2*arc) + ys)
+    run = ys - nw - c + p
+    short_end = 2 * (cfl/2 - c) + cfl + 2 * (nw - c) + 2*arc
+    short = 2 * (run + (nt - 1) * (run + nw - c + p)
+                 + nt * (2*arc + 2 * (nw - c) + nl) + run + short_end)
+    run = xs + p - c
+    side = 2*cfl - 2*c + 2 * (nw - c) + 2*arc
+    long = 2 * (run + (nb - 3) * (run - c + p)
+                + (nb - 2) * (2*arc + 2 * (nw - c) + nl) + run + side)
+    plate_pockets = (nb - 2) * nt * _pocket(base, nw, nl)
+    long_pockets = (nb - 2) * _pocket(base, nw, cfl)
+
+    # long parts are tiled at brace lines. A seam adds both its sides to
+    # the two plates and two long braces; the pockets it runs through
+    # become two halves of the same length
+    length, height = max(sheet_size), min(sheet_size)
+    pieces, longest, fits = _tiles(L, nb, xs + nl + 2*p, nl/2 + p, length)
+    seams = (pieces - 1) * (4 * ((nt + 1) * ys - 2 * (depth + c))
+                            + 8 * (nw + cfl/2 - p))
+    cut = (2*plate + 2*plate_pockets + 4 * _pocket(base, LEG_HOLE, LEG_HOLE)
+           + nb*short + 2*long + 2*long_pockets + seams)
+
+    # the area of every part with its spacing, over what nesting fills of a
+    # sheet, and never fewer sheets than the plate pieces need on their own
+    area = ((2 * (W + gap) + 2 * (H + gap)) * (L + pieces * gap)
+            + nb * (W + gap) * (H + gap))
+    # plates laid along the sheet, or across it when they are short enough
+    plates_per_sheet = np.maximum(
+        np.floor((length + gap) / (longest + gap)) * math.floor((height + gap) / (W + gap)),
+        np.floor((height + gap) / (longest + gap)) * math.floor((length + gap) / (W + gap)))
+    sheets = np.maximum(np.ceil(area / (length * height * UTILIZATION)),
+                        np.ceil(2 * pieces / np.maximum(plates_per_sheet, 1)))
+
+    # and plate pieces, long brace pieces and short braces each have to fit
+    # on a sheet one way or the other, as nest() places them
+    def on_sheet(a, b):
+        return (((a <= length + 1e-9) & (b <= height + 1e-9))
+                | ((a <= height + 1e-9) & (b <= length + 1e-9)))
+
+    valid = ((xs > 0) & (ys > 0) & (cfl/2 > c) & (span > 0) & fits
+             & on_sheet(longest, W) & on_sheet(longest, H) & on_sheet(np.full_like(nb, W), H))
+    return {
+        "x_spacing": xs,
+        "y_spacing": ys,
+        "spacing": np.maximum(xs, ys) + nl + 2*p,
+        "min_finger": np.minimum(xs, ys),
+        "pieces": pieces,
+        "sheets": sheets,
+        "cut_length": cut,
+        "valid": valid,
+    }
+
+
+def pareto(costs):
+    """
+    Indices of the rows of costs (to be minimised) that no other row is at
+    least as good as in every column and better in one.
+    """
+    costs = np.asarray(costs, dtype=float)
+    # a row can only be dominated by rows before it in this order
+    order = np.lexsort(costs.T[::-1])
+    front = np.zeros((0, costs.shape[1]))
+    keep = []
+    for start in range(0, len(order), BLOCK):
+        index = order[start:start + BLOCK]
+        block = costs[index]
+        # [i, j]: row j of the front (then of the block) dominates row i
+        dominated = ((front[None] <= block[:, None]).all(-1)
+                     & (front[None] < block[:, None]).any(-1)).any(1)
+        dominated |= ((block[None] <= block[:, None]).all(-1)
+                      & (block[None] < block[:, None]).any(-1)).any(1)
+        keep.append(index[~dominated])
+        front = np.concatenate([front, block[~dominated]])
+    return np.concatenate(keep) if keep else np.zeros(0, dtype=int)
+
+
+def _costs(rows):
+    # fewer sheets, a shorter cut, closer braces, wider fingers between the
+    # notches and longer fingers into them
+    return np.stack([rows[:, 3], rows[:, 4], rows[:, 5], -rows[:, 6], -rows[:, 2]], axis=1)
+
+
+def _front(job):
+    # Pareto front of one slice of the grid, as rows of
+    # (nb, nt, nl, sheets, cut_length, spacing, min_finger)
+    base, nbraces, ntabs, notch_lengths, max_spacing, min_finger = job
+    nb, nt, nl = candidates(nbraces, ntabs, notch_lengths)
+    m = model(base, nb, nt, nl)
+    ok = m["valid"] & (m["spacing"] <= max_spacing) & (m["min_finger"] >= min_finger)
+    rows = np.stack([nb, nt, nl, m["sheets"], m["cut_length"], m["spacing"],
+                     m["min_finger"]], axis=1)[ok]
+    return rows[pareto(_costs(rows))]
+
+
+def _rows(options):
+    return np.array([(o.spec.nbraces, o.spec.ntabs, o.spec.notch_length, o.sheets,
+                      o.cut_length, o.spacing, o.min_finger) for o in options])
+
+
+def nest_head(options, exact=EXACT):
+    """
+    options with the sheets of the first exact ones counted by nest_job(),
+    those that are still Pareto-best among themselves moved to the front
+    in order of fewest sheets and then shortest cut.
+    """
+    from nesting import nest_job
+
+    head = [replace(o, sheets=nest_job([o.spec]).sheets, exact=True)
+            for o in options[:exact]]
+    if not head:
+        return options
+    rows = _rows(head)
+    keep = pareto(_costs(rows))
+    keep = keep[np.lexsort((rows[keep, 4], rows[keep, 3]))]
+    return [head[k] for k in keep] + options[exact:]
+
+
+def optimize(base=None, nbraces=NBRACES, ntabs=NTABS, notch_lengths=NOTCH_LENGTHS,
+             max_spacing=MAX_SPACING, min_finger=MIN_FINGER, processes=1, exact=EXACT):
+    """
+    Pareto-best Options for the box dimensions of base, fewest sheets and
+    then shortest cut first. With processes other than 1, slices of the
+    brace counts are scored in worker processes (None: all cores). The
+    sheets of the first exact options are re-counted by nest_job() and
+    those options re-ranked (see nest_head()); the rest keep the estimate.
+    """
+    base = base or tbg.BoxSpec()
+    nbraces = list(nbraces)
+    workers = min(len(nbraces), processes or os.cpu_count() or 1)
+    jobs = [(base, nbraces[k::workers], ntabs, notch_lengths, max_spacing, min_finger)
+            for k in range(workers)]
+    if workers <= 1:
+        fronts = [_front(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            fronts = list(pool.map(_front, jobs))
+    rows = np.concatenate(fronts)
+    rows = rows[pareto(_costs(rows))]
+    rows = rows[np.lexsort((rows[:, 4], rows[:, 3]))]
+    options = [Option(replace(base, nbraces=int(nb), ntabs=int(nt), notch_length=float(nl)),
+                      int(sheets), float(cut), float(spacing), float(finger))
+               for nb, nt, nl, sheets, cut, spacing, finger in rows.tolist()]
+    return nest_head(options, exact)
+
+
+def report(front, top=20):
+    """
+    The first top options of the front as JSON-ready dicts, with the box
+    dimensions searched for, the size of the whole front, how many of its
+    options have nested sheet counts and the measured error of the
+    estimate (estimated minus nested sheets -> share of options).
+    """
+    if not front:
+        return {"front": 0, "options": []}
+    spec = asdict(front[0].spec)
+    for name in ("nbraces", "ntabs", "notch_length"):
+        del spec[name]
+    return {"box": spec, "front": len(front),
+            "sheets_exact": sum(option.exact for option in front),
+            "sheets_error": {str(k): v for k, v in SHEETS_ERROR.items()},
+            "options": [option.to_dict() for option in front[:top]]}
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+"""
+Long-running generator: keeps Python, ezdxf and the part caches warm and
+answers JSON requests over localhost HTTP or a Unix socket.
+
+    python server.py --port 8765
+    curl -d '{"spec": {"nbraces": 10}}' localhost:8765/generate > box.dxf
+
+POST /generate takes {"spec": {...}} or {"specs": [{...}, ...]} with BoxSpec
+fields, optional "options" (polyline, instance, streaming) and "return":
+"dxf" (the default, the file in the response body) or "path" (the file is
+written under --out-dir and its path returned as JSON). GET /metrics
+reports request counts, latency percentiles (waiting for a slot included)
+and throughput.
+
+Requests are served by threads of one process, and generating a box is
+Python code that holds the GIL, so --max-concurrent bounds how many
+requests are admitted at once rather than adding CPU parallelism. Run
+one server per core behind a balancer to use more cores.
+"""
+import argparse
+import json
+import os
+import signal
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from dataclasses import fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import torsion_box_generator as tbg
+
+OPTIONS = ("polyline", "instance", "streaming")
+# latencies kept for the percentiles in /metrics
+WINDOW = 1000
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.latencies = deque(maxlen=WINDOW)
+
+    def record(self, seconds, ok=True):
+        with self.lock:
+            self.requests += 1
+            self.errors += not ok
+            self.latencies.append(seconds)
+
+    def snapshot(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            uptime = time.monotonic() - self.started
+            snapshot = {
+                "requests": self.requests,
+                "errors": self.errors,
+                "rejected": self.rejected,
+                "in_flight": self.in_flight,
+                "uptime_s": round(uptime, 3),
+                "throughput_rps": round(self.requests / uptime, 3) if uptime else 0.0,
+            }
+        if latencies:
+            def pick(q):
+                return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1e3, 3)
+            snapshot["latency_ms"] = {
+                "p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99),
+                "mean": round(sum(latencies) / len(latencies) * 1e3, 3),
+                "max": round(latencies[-1] * 1e3, 3),
+            }
+        return snapshot
+
+
+def parse_spec(values):
+    """
+    BoxSpec of one JSON spec object. Raises ValueError on anything a
+    client could have sent wrong.
+    """
+    if not isinstance(values, dict):
+        raise ValueError("a spec must be a JSON object")
+    types = {f.name: f.type for f in fields(tbg.BoxSpec)}
+    unknown = set(values) - set(types)
+    if unknown:
+        raise ValueError("unknown spec fields: {}".format(", ".join(sorted(unknown))))
+    for name, value in values.items():
+        whole = types[name] in (int, "int")
+        if isinstance(value, bool) or not isinstance(value, int if whole else (int, float)):
+            raise ValueError("{} must be {}".format(name, "an integer" if whole else "a number"))
+    return tbg.BoxSpec(**values)
+
+
+def parse_request(body):
+    """
+    BoxSpecs and writer options of a /generate request body.
+    """
+    request = json.loads(body or b"{}")
+    if not isinstance(request, dict):
+        raise ValueError("the request body must be a JSON object")
+    if "specs" in request:
+        if not isinstance(request["specs"], list):
+            raise ValueError('"specs" must be a list of spec objects')
+        specs = [parse_spec(spec) for spec in request["specs"]]
+    else:
+        specs = [parse_spec(request.get("spec", {}))]
+    if not specs:
+        raise ValueError("no specs given")
+    options = request.get("options", {})
+    if not isinstance(options, dict):
+        raise ValueError('"options" must be a JSON object')
+    unknown = set(options) - set(OPTIONS)
+    if unknown:
+        raise ValueError("unknown options: {}".format(", ".join(sorted(unknown))))
+    mode = request.get("return", "dxf")
+    if mode not in ("dxf", "path"):
+        raise ValueError('"return" must be "dxf" or "path"')
+    return specs, options, mode
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "TorsionBox/" + tbg.__version__
+
+    def _send(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = (json.dumps(body) + "\n").encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send(200, self.server.metrics.snapshot())
+        elif self.path == "/health":
+            self._send(200, {"ok": True, "version": tbg.__version__})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/generate":
+            self._send(404, {"error": "not found"})
+            return
+        metrics = self.server.metrics
+        # latencies include the wait for a slot, so they show queueing
+        start = time.perf_counter()
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length < 0:
+                raise ValueError
+        except ValueError:
+            metrics.record(time.perf_counter() - start, False)
+            self._send(400, {"error": "bad Content-Length: {!r}"
+                             .format(self.headers.get("Content-Length"))})
+            return
+        body = self.rfile.read(length)
+        if not self.server.slots.acquire(timeout=self.server.queue_timeout):
+            with metrics.lock:
+                metrics.rejected += 1
+            self._send(503, {"error": "busy"})
+            return
+        with metrics.lock:
+            metrics.in_flight += 1
+        try:
+            status, reply, content_type = self.server.generate(body)
+        finally:
+            with metrics.lock:
+                metrics.in_flight -= 1
+            self.server.slots.release()
+        metrics.record(time.perf_counter() - start, status == 200)
+        self._send(status, reply, content_type)
+
+    def address_string(self):
+        # Unix socket peers have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class _Generator:
+    """
+    What the HTTP and Unix socket servers share.
+    """
+    daemon_threads = True
+
+    def setup_generator(self, max_concurrent=4, queue_timeout=30.0, out_dir=".",
+                        cache=None, verbose=False):
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.queue_timeout = queue_timeout
+        self.out_dir = out_dir
+        self.cache = cache
+        self.verbose = verbose
+        self.metrics = Metrics()
+        self.counter = 0
+        self.counter_lock = threading.Lock()
+        os.makedirs(out_dir, exist_ok=True)
+        # one throwaway box loads the lazy parts of ezdxf and fills the
+        # geometry caches before the first request
+        tbg.build_document(tbg.BoxSpec())
+
+    def generate(self, body):
+        """
+        (status, reply, content type) for a /generate request body.
+        """
+        try:
+            specs, options, mode = parse_request(body)
+            if mode == "path":
+                with self.counter_lock:
+                    self.counter += 1
+                    index = self.counter
+                filename = os.path.join(self.out_dir, tbg.spec_filename(specs[0], index))
+                tbg.write_job(specs, filename, cache=self.cache, **options)
+                return 200, {"path": os.path.abspath(filename)}, "application/json"
+            return 200, self._dxf_bytes(specs, options), "application/dxf"
+        except (ValueError, TypeError) as e:
+            return 400, {"error": str(e)}, "application/json"
+        except Exception as e:
+            return 500, {"error": "{}: {}".format(type(e).__name__, e)}, "application/json"
+
+    def _dxf_bytes(self, specs, options):
+        fd, filename = tempfile.mkstemp(suffix=".dxf")
+        os.close(fd)
+        try:
+            tbg.write_job(specs, filename, cache=self.cache, **options)
+            with open(filename, "rb") as f:
+                return f.read()
+        finally:
+            os.remove(filename)
+
+
+class HTTPServer(_Generator, ThreadingHTTPServer):
+    pass
+
+
+class UnixHTTPServer(_Generator, socketserver.ThreadingUnixStreamServer):
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        super().server_bind()
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+def make_server(host="127.0.0.1", port=8765, socket_path=None, **settings):
+    if socket_path:
+        server = UnixHTTPServer(socket_path, Handler)
+    else:
+        server = HTTPServer((host, port), Handler)
+    server.setup_generator(**settings)
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", metavar="PATH",
+                        help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--max-concurrent", type=int, default=4,
+                        help="requests admitted at the same time; they share "
+                        "one core under the GIL, the rest wait for a slot")
+    parser.add_argument("--queue-timeout", type=float, default=30.0,
+                        help="seconds a request waits for a slot before a 503")
+    parser.add_argument("--out-dir", default=".",
+                        help='where "return": "path" requests are written')
+    parser.add_argument("--cache", nargs="?", const="", metavar="DIR",
+                        help="reuse identical outputs, as in torsion_box_generator.py")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cache = None
+    if args.cache is not None:
+        from cache import DEFAULT_DIR, OutputCache
+        cache = OutputCache(args.cache or DEFAULT_DIR)
+    server = make_server(args.host, args.port, args.socket,
+                         max_concurrent=args.max_concurrent,
+                         queue_timeout=args.queue_timeout, out_dir=args.out_dir,
+                         cache=cache, verbose=args.verbose)
+    # shut down the same way on kill as on Ctrl-C, removing the socket file
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    where = args.socket or "http://{}:{}".format(args.host, args.port)
+    print("serving on {}".format(where), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""
+Write each plywood sheet of a job to its own DXF, for routers that load
+one sheet at a time.
+
+The job is first planned: which parts go on which sheet, and where. Worker
+processes then draw and save the sheets side by side. Each file has its
+sheet's corner at (0, 0). A JSON manifest lists the file, the parts and
+their bounding boxes for every sheet:
+
+    write_sheets([BoxSpec()], "torsion_box.dxf")
+    # torsion_box_sheet1.dxf ... torsion_box_sheet3.dxf, torsion_box_sheets.json
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from ezdxf.enums import TextEntityAlignment
+
+import torsion_box_generator as tbg
+
+
+@dataclass
+class SheetPart:
+    name: str
+    spec: tbg.BoxSpec
+    # index of the box in the job
+    box: int
+    # start point on the sheet, for parts drawn by their emitter
+    start: tuple = None
+    # or the contours already placed on the sheet, for nested parts
+    contours: list = None
+
+
+@dataclass
+class Sheet:
+    index: int
+    # lower left corner in the single-file drawing
+    origin: tuple
+    size: tuple = tbg.SHEET_SIZE
+    parts: list = field(default_factory=list)
+
+
+def plan_sheets(specs, nested=False):
+    """
+    The sheets of a job as write_job() lays them out, or nested.
+    """
+    if nested:
+        from nesting import SHEET_GAP, nest_job
+
+        nesting = nest_job(specs)
+        w, h = nesting.sheet_size
+        boxes = {}
+        for k, spec in enumerate(specs):
+            boxes.setdefault(id(spec), k)
+        sheets = [Sheet(k, (0, k * (h + SHEET_GAP)), nesting.sheet_size)
+                  for k in range(nesting.sheets)]
+        for placement in nesting.placements:
+            part = placement.part
+            sheets[placement.sheet].parts.append(SheetPart(
+                part.name, part.spec, boxes.get(id(part.spec), 0),
+                contours=placement.contours()))
+        return sheets
+    sheets = []
+    for k, spec in enumerate(specs):
+        # every part follows the sheet it is laid out on
+        for name, sp in tbg.layout_plan(spec, (0, k * tbg.BOX_PITCH)).placements:
+            if name == "PLYWOOD":
+                sheets.append(Sheet(len(sheets), sp))
+            elif name != "NOTES":
+                sheet = sheets[-1]
+                start = (sp[0] - sheet.origin[0], sp[1] - sheet.origin[1])
+                sheet.parts.append(SheetPart(name, spec, k, start=start))
+    return sheets
+
+
+def _bounds(boxes):
+    return [min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes)]
+
+
+def draw_sheet(sheet, msp, count=1, polyline=True, instance=False):
+    """
+    Draw one sheet with its corner at (0, 0) and return its manifest entry.
+    """
+    tbg.plywood(msp, (0, 0), polyline, instance, sheet.size)
+    parts = []
+    for part in sheet.parts:
+        contours, origin = part.contours, part.start
+        if contours is None:
+            recorder = tbg.RecordingLayout()
+            tbg.EMITTERS[part.name](part.spec, recorder, part.start, True, False)
+            contours = recorder.contours
+        bounds = _bounds([c.bounds() for c in contours])
+        if part.contours is not None:
+            # blocks are anchored at the outline's corner, as in draw_nesting
+            origin = contours[0].bounds()[:2]
+        tbg.add_part(part.spec, msp, part.name, contours, origin, polyline, instance)
+        parts.append({"name": part.name, "box": part.box, "bounds": bounds})
+    names = sorted({p["name"] for p in parts})
+    msp.add_text(
+        "Sheet {} of {}: {}".format(sheet.index + 1, count, ", ".join(names)),
+        height=1,
+        dxfattribs={"style": "LiberationSerif", "layer": "Notes"}
+    ).set_placement((0, -2), align=TextEntityAlignment.LEFT)
+    return {
+        "sheet": sheet.index + 1,
+        "size": list(sheet.size),
+        "origin": list(sheet.origin),
+        "bounds": _bounds([p["bounds"] for p in parts]) if parts else None,
+        "parts": parts,
+    }
+
+
+def _write_one(job):
+    sheet, filename, count, options = job
+    doc = tbg.new_document()
+    entry = draw_sheet(sheet, doc.modelspace(), count, **options)
+    with tbg.span("save"):
+        doc.saveas(filename)
+    entry["file"] = filename
+    return entry
+
+
+def write_sheets(specs, filename, nested=False, processes=None, **options):
+    """
+    Write every sheet of the job to its own DXF, named after filename with
+    _sheetN.dxf in place of its extension, plus a _sheets.json manifest.
+    The sheets are drawn and saved in worker processes unless processes is
+    1 or there is a single core. Returns the manifest. Raises ValueError,
+    before anything is written, if a part of the fixed layout overflows
+    its sheet.
+    """
+    stem = os.path.splitext(filename)[0]
+    if not nested:
+        from gcode import sheet_jobs
+        sheet_jobs(tbg.layout_contours(specs))
+    sheets = plan_sheets(specs, nested)
+    jobs = [(sheet, "{}_sheet{}.dxf".format(stem, sheet.index + 1), len(sheets), options)
+            for sheet in sheets]
+    workers = min(len(jobs), processes or os.cpu_count() or 1)
+    if workers <= 1:
+        entries = [_write_one(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            # a few sheets per task keeps the pickling round trips down
+            chunk = max(1, len(jobs) // (workers * 4))
+            entries = list(pool.map(_write_one, jobs, chunksize=chunk))
+    manifest = {
+        "version": tbg.__version__,
+        "boxes": len(specs),
+        "nested": nested,
+        "sheets": entries,
+    }
+    with open(stem + "_sheets.json", "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
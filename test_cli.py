@@ -0,0 +1,123 @@
+"""
+Command line runs that used to end in a traceback.
+"""
+import json
+from dataclasses import fields
+
+import ezdxf
+import pytest
+
+import torsion_box_generator as tbg
+
+
+def run(tmp_path, *argv):
+    with pytest.raises(SystemExit) as raised:
+        tbg.main(list(argv) + ["-o", str(tmp_path / "box.dxf")])
+    return raised.value.code
+
+
+@pytest.mark.parametrize("argv", [["--nbraces", "10"],
+                                  ["--box-length", "240", "--nbraces", "21"]])
+def test_gcode_off_sheet_layout(tmp_path, capsys, argv):
+    assert run(tmp_path, "--gcode", *argv) == 1
+    assert "use --nest" in capsys.readouterr().err
+    assert not list(tmp_path.glob("*.nc"))
+
+
+def test_gcode_nested_long_box(tmp_path, capsys):
+    tbg.main(["--gcode", "--nest", "--box-length", "240", "--nbraces", "21",
+              "-o", str(tmp_path / "box.dxf")])
+    assert list(tmp_path.glob("box_sheet*.nc"))
+
+
+def test_sheets_off_sheet_layout(tmp_path, capsys):
+    assert run(tmp_path, "--sheets", "--nbraces", "10") == 1
+    assert "use --nest" in capsys.readouterr().err
+    assert not list(tmp_path.glob("box_sheet*"))
+
+
+def test_sheets_manifest_bounds(tmp_path):
+    from gcode import EPS
+    from sheets import write_sheets
+    manifest = write_sheets([tbg.BoxSpec()], str(tmp_path / "box.dxf"), processes=1)
+    for entry in manifest["sheets"]:
+        w, h = entry["size"]
+        for part in entry["parts"]:
+            x0, y0, x1, y1 = part["bounds"]
+            assert -EPS <= x0 and -EPS <= y0 and x1 <= w + EPS and y1 <= h + EPS
+
+
+def test_tools_off_sheet_layout(tmp_path, capsys):
+    assert run(tmp_path, "--tools", "0.125,0.25", "--nbraces", "10") == 1
+    report = json.loads(capsys.readouterr().out)
+    for tool in report["tools"]:
+        assert "use --nest" in tool["error"]
+        assert tool["file"] is None and tool["cut_length"] is None
+    assert not list(tmp_path.glob("*.dxf"))
+
+
+def test_nest_sheet_sized_plate(tmp_path):
+    # the plate is a hair longer than the sheet in floating point
+    tbg.main(["--nest", "--box-length", "96", "--box-width", "48", "--nbraces", "8",
+              "--ntabs", "3", "--notch-length", "2.25", "-o", str(tmp_path / "box.dxf")])
+    assert (tmp_path / "box.dxf").exists()
+
+
+def test_validate_notches_longer_than_fingers(tmp_path, capsys):
+    assert run(tmp_path, "--validate", "--notch-length", "20") == 2
+    assert "notch_length 20.0 is too long" in capsys.readouterr().err
+
+
+def test_check_fits_without_finger_tips():
+    from validate import Report, check_fits
+    # BoxSpec refuses these notches now, so build one the way older code could
+    spec = object.__new__(tbg.BoxSpec)
+    for f in fields(tbg.BoxSpec):
+        object.__setattr__(spec, f.name, f.default)
+    object.__setattr__(spec, "notch_length", 20)
+    report = Report()
+    check_fits(report, spec)
+    assert not report.ok
+    assert any("no finger tips" in issue["message"] for issue in report.to_dict()["issues"])
+
+
+@pytest.mark.parametrize("argv, field", [(["--box-height", "1"], "box_height"),
+                                         (["--nbraces", "30"], "notch_length"),
+                                         (["--notch-length", "0.2"], "notch_length"),
+                                         (["--tools", "0.25,3"], "box_height")])
+def test_unbuildable_spec(tmp_path, capsys, argv, field):
+    assert run(tmp_path, *argv) == 2
+    assert field in capsys.readouterr().err
+    assert not (tmp_path / "box.dxf").exists()
+
+
+@pytest.mark.parametrize("command", [["--nest"], ["--validate", "--nest"]])
+@pytest.mark.parametrize("argv, message", [
+    (["--box-width", "60"], "does not fit on a 96 x 48 sheet"),
+    (["--box-length", "200", "--nbraces", "2"], "do not fit in a 96 piece"),
+])
+def test_nest_parts_too_large(tmp_path, capsys, command, argv, message):
+    assert run(tmp_path, *command, *argv) == 1
+    err = capsys.readouterr().err
+    assert message in err and "Traceback" not in err
+    assert not (tmp_path / "box.dxf").exists()
+
+
+@pytest.mark.parametrize("argv, message", [
+    (["--formats", "dxf,png"], "unknown format png"),
+    (["--formats", "dxf,svg", "--blocks"], "not --blocks or --stream"),
+    (["--formats", "dxf", "--stream"], "not --blocks or --stream"),
+])
+def test_formats_refused(tmp_path, capsys, argv, message):
+    assert run(tmp_path, *argv) == 2
+    assert message in capsys.readouterr().err
+    assert not list(tmp_path.iterdir())
+
+
+def test_formats_lines(tmp_path, capsys):
+    from dxfdiff import diff_files
+    tbg.main(["--formats", "dxf,svg", "--lines", "-o", str(tmp_path / "box.dxf")])
+    tbg.write_job([tbg.BoxSpec()], str(tmp_path / "direct.dxf"), polyline=False)
+    assert diff_files(str(tmp_path / "direct.dxf"), str(tmp_path / "box.dxf"))["same"]
+    types = {e.dxftype() for e in ezdxf.readfile(str(tmp_path / "box.dxf")).modelspace()}
+    assert "LWPOLYLINE" not in types and {"LINE", "ARC"} <= types
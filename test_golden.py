@@ -0,0 +1,12 @@
+"""
+Every case and output variant still draws its golden file.
+"""
+import golden
+
+
+def test_golden():
+    reports = golden.check(processes=1)
+    assert len(reports) == len(golden.CASES) * len(golden.VARIANTS)
+    failed = ["{}/{}: {}".format(r["case"], r["variant"], golden._summary(r))
+              for r in reports if not r["same"]]
+    assert not failed, failed
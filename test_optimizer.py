@@ -0,0 +1,22 @@
+"""
+The recommended box needs as many sheets as the optimizer says.
+"""
+import pytest
+
+import optimizer
+import torsion_box_generator as tbg
+from nesting import nest_job
+
+
+@pytest.mark.parametrize("base, sheets", [(tbg.BoxSpec(), 3),
+                                          (tbg.BoxSpec(box_length=240), 8)])
+def test_recommended_sheets(base, sheets):
+    best = optimizer.optimize(base)[0]
+    assert best.exact and best.sheets == sheets
+    assert nest_job([best.spec]).sheets == sheets
+
+
+@pytest.mark.parametrize("base", [tbg.BoxSpec(box_width=60), tbg.BoxSpec(box_height=50)])
+def test_parts_larger_than_a_sheet(base):
+    # plates or braces wider than the sheet leave no option to nest
+    assert optimizer.optimize(base) == []
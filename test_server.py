@@ -0,0 +1,41 @@
+"""
+Bad /generate bodies are the client's fault and get a 400, not a 500.
+"""
+import socket
+import threading
+
+import pytest
+
+import server
+
+
+@pytest.mark.parametrize("body", [b"[]", b'"x"', b"{bad",
+                                  b'{"spec": {"nbraces": 1}}',
+                                  b'{"spec": {"nbraces": "x"}}',
+                                  b'{"spec": {"box_height": -2}}',
+                                  b'{"spec": {"foo": 1}}',
+                                  b'{"specs": {}}', b'{"specs": [1]}',
+                                  b'{"options": []}'])
+def test_bad_request(body):
+    with pytest.raises(ValueError):
+        server.parse_request(body)
+
+
+def test_good_request():
+    specs, options, mode = server.parse_request(b'{"spec": {"nbraces": 6, "box_length": 72}}')
+    assert specs[0].nbraces == 6 and specs[0].box_length == 72
+
+
+@pytest.mark.parametrize("length", [b"abc", b"-5"])
+def test_bad_content_length(tmp_path, length):
+    srv = server.make_server(port=0, out_dir=str(tmp_path))
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    try:
+        with socket.create_connection(srv.server_address[:2]) as s:
+            s.sendall(b"POST /generate HTTP/1.1\r\nHost: x\r\nContent-Length: " + length
+                      + b"\r\nConnection: close\r\n\r\n{}")
+            assert s.recv(4096).startswith(b"HTTP/1.0 400")
+        assert srv.metrics.snapshot()["errors"] == 1
+    finally:
+        srv.shutdown()
+        srv.server_close()
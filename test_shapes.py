@@ -0,0 +1,49 @@
+"""
+Parts reused by translation and built from half an outline turned through
+180 degrees have the geometry of parts drawn where they are placed.
+"""
+import numpy as np
+import pytest
+
+import torsion_box_generator as tbg
+
+SPECS = [tbg.BoxSpec(), tbg.BoxSpec(nbraces=4, ntabs=1, box_length=48, box_width=24),
+         tbg.BoxSpec(nbraces=16, ntabs=6, box_length=180),
+         tbg.BoxSpec(endmill_diameter=0.125, plywood_thickness=0.75, box_height=5)]
+PARTS = ["TOP_PLATE", "SHORT_BRACE", "LONG_BRACE", "LEG_HOLES"]
+# part name -> outline size for a spec
+SIZES = {
+    "TOP_PLATE": lambda spec: (spec.box_length, spec.box_width),
+    "SHORT_BRACE": lambda spec: (spec.box_width, spec.box_height),
+    "LONG_BRACE": lambda spec: (spec.box_length, spec.box_height),
+}
+TOLERANCE = 1e-9
+
+
+@pytest.mark.parametrize("spec", SPECS)
+@pytest.mark.parametrize("name", PARTS)
+def test_translated_matches_direct(spec, name):
+    contours_at = tbg.PART_CONTOURS[name]
+    tbg.clear_shape_caches()
+    for start in [(0, 0), (12.5, -3.25), (0, 2 * tbg.BOX_PITCH)]:
+        moved = contours_at(spec, start)
+        direct = contours_at.__wrapped__(spec, start)
+        assert [(c.layer, c.color) for c in moved] == [(c.layer, c.color) for c in direct]
+        for a, b in zip(moved, direct):
+            np.testing.assert_allclose(a.vertices(), b.vertices(), rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize("spec", SPECS)
+@pytest.mark.parametrize("name", list(SIZES))
+def test_outline_turned_through_180(spec, name):
+    outline = tbg.PART_CONTOURS[name](spec, (3, 7))[0]
+    vertices = outline.vertices()
+    # closed, as large as the part, and symmetric about its centre
+    np.testing.assert_allclose(outline.end(), outline.start, atol=TOLERANCE)
+    x0, y0, x1, y1 = outline.bounds()
+    width, height = SIZES[name](spec)
+    assert abs(x1 - x0 - width) < TOLERANCE and abs(y1 - y0 - height) < TOLERANCE
+    n = len(vertices) // 2
+    first, second = vertices[:n], vertices[n:2 * n]
+    turned = np.column_stack([x0 + x1 - first[:, 0], y0 + y1 - first[:, 1], first[:, 2]])
+    np.testing.assert_allclose(second, turned, rtol=0, atol=TOLERANCE)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""
+Split plates and long braces that are longer than a plywood sheet into
+pieces that fit.
+
+Pieces are cut at brace lines, straight through the centre of the pockets
+and edge notches on that line. Each side of the seam keeps half of every
+pocket and notch as an open slot. The short brace on that line then sits
+in both halves and splices the pieces together, and the long braces'
+fingers bridge the split plate notches the same way.
+
+Every piece is built from tiled runs of the same moves as the whole
+part, so the work grows linearly with the box length:
+
+    plate_pieces(BoxSpec(box_length=240, nbraces=21), 96)
+"""
+import bisect
+
+import numpy as np
+
+import torsion_box_generator as tbg
+from torsion_box_generator import CW, ROTATE_180, Contour
+
+EPS = 1e-9
+
+
+def brace_x(spec, i):
+    """
+    x of brace line i from the left end of a plate or long brace: the ends
+    for 0 and nbraces - 1, else the centre of that line's pockets.
+    """
+    if i == 0:
+        return 0.0
+    if i == spec.nbraces - 1:
+        return float(spec.box_length)
+    return spec.x_spacing * i + (spec.notch_length / 2 + spec.padding) * (2 * i - 1)
+
+
+def spans(spec, max_length):
+    """
+    (a, b) brace lines of each piece, left to right, so that no piece is
+    longer than max_length. Seams are placed as far right as they fit.
+    """
+    last = spec.nbraces - 1
+    xs = [brace_x(spec, i) for i in range(spec.nbraces)]
+    pieces, a = [], 0
+    while xs[last] - xs[a] > max_length + EPS:
+        b = bisect.bisect_right(xs, xs[a] + max_length + EPS, a + 1, last) - 1
+        if b <= a:
+            raise ValueError("braces {:g} apart do not fit in a {:g} piece"
+                             .format(xs[a + 1] - xs[a], max_length))
+        pieces.append((a, b))
+        a = b
+    pieces.append((a, last))
+    return pieces
+
+
+def _edge(gap, end_delta, cut, count, head, tail):
+    """
+    Moves along one edge: gap, cut, gap, ..., cut, gap with count whole
+    cuts. A seam at either end splits the cut on that line at its middle
+    row; head starts with the second half and tail ends with the first.
+    Gaps next to a part end are end_delta longer.
+    """
+    cut = np.asarray(cut, dtype=float)
+    middle = cut[2] / 2
+    rows = np.tile(np.vstack([(gap, 0, 0), cut]), (count + 1, 1))[:-len(cut)]
+    if not head:
+        rows[0, 0] += end_delta
+    if not tail:
+        rows[-1, 0] += end_delta
+    runs = [rows]
+    if head:
+        runs.insert(0, np.vstack([middle, cut[3:]]))
+    if tail:
+        runs.append(np.vstack([cut[:2], middle]))
+    return np.concatenate(runs)
+
+
+def _half_pocket(spec, width, height):
+    # the side of a pocket_contours() pocket left of its centre, walked CW
+    # from the seam
+    c = spec.chord_length
+    w = width + 2*spec.padding - 2*c
+    h = height + 2*spec.padding - 2*c
+    return [(-w/2, 0, 0), (-c, c, CW), (0, h, 0), (c, c, CW), (w/2, 0, 0)]
+
+
+def _outline(start, bottom, right, a, b, last):
+    """
+    Closed CCW outline of the piece from line a to b of a part that is the
+    same when turned through 180 degrees, from its bottom edge moves
+    bottom(a, b) and its right side moves right(seam).
+    """
+    return (Contour(start)
+            .add(bottom(a, b)).add(right(b < last))
+            .add(bottom(last - b, last - a) * ROTATE_180)
+            .add(np.asarray(right(a > 0)) * ROTATE_180))
+
+
+def _pocket_starts(spec, lines, ys):
+    # pocket_contours() start points of a row of pockets on each brace line
+    c = spec.chord_length
+    w = spec.notch_width + 2*spec.padding - 2*c
+    x = [brace_x(spec, i) - w/2 for i in lines]
+    return [(xi, y) for xi in x for y in ys]
+
+
+def plate_pieces(spec, max_length, leg_holes=False, start_point=(0, 0)):
+    """
+    Contours of each piece of a top plate, or with leg_holes the bottom
+    plate, in the place they take on the whole plate at start_point.
+    """
+    c = spec.chord_length
+    padding = spec.padding
+    last = spec.nbraces - 1
+    x_spacing = spec.x_spacing
+    y_spacing = spec.y_spacing
+    depth = spec.notch_width + padding - c
+    span = spec.notch_length + padding*2 - c*2
+    ox, oy = start_point
+
+    def bottom(a, b):
+        notch = [(0, depth, 0), (c, c, CW), (span, 0, 0), (c, -c, CW), (0, -depth, 0)]
+        return _edge(x_spacing, 0, notch, b - a - 1, a > 0, b < last)
+
+    def right(seam):
+        if not seam:
+            notch = [(0, y_spacing, 0), (-depth, 0, 0), (-c, c, CW),
+                     (0, span, 0), (c, c, CW), (depth, 0, 0)]
+            return np.concatenate([np.tile(notch, (spec.ntabs, 1)), [(0, y_spacing, 0)]])
+        pocket = [(0, y_spacing, 0)] + _half_pocket(spec, spec.notch_width,
+                                                     spec.notch_length)
+        rows = np.tile(pocket, (spec.ntabs, 1))
+        rows[0, 1] -= depth + c
+        return np.concatenate([rows, [(0, y_spacing - depth - c, 0)]])
+
+    ys = [oy + y_spacing * (j+1) + (spec.notch_length + 2*padding) * j
+          for j in range(spec.ntabs)]
+    holes = tbg.leg_hole_contours(spec, start_point) if leg_holes else []
+    pieces = []
+    for a, b in spans(spec, max_length):
+        start = (ox + brace_x(spec, a), oy + (depth + c if a > 0 else 0))
+        starts = [(x + ox, y) for x, y in _pocket_starts(spec, range(a + 1, b), ys)]
+        x0, x1 = ox + brace_x(spec, a), ox + brace_x(spec, b)
+        pieces.append([_outline(start, bottom, right, a, b, last)]
+                      + tbg.pocket_contours(spec, starts, spec.notch_width,
+                                            spec.notch_length)
+                      + [h for h in holes if x0 <= h.start[0] < x1])
+    return pieces
+
+
+def long_brace_pieces(spec, max_length, start_point=(0, 0)):
+    """
+    Contours of each piece of a long brace, in the place they take on the
+    whole brace at start_point.
+    """
+    c = spec.chord_length
+    padding = spec.padding
+    notch_width = spec.notch_width
+    corner_finger_length = spec.corner_finger_length
+    last = spec.nbraces - 1
+    ox, oy = start_point
+
+    def bottom(a, b):
+        finger = [(c, -c, CW), (0, -(notch_width - c), 0), (spec.notch_length, 0, 0),
+                  (0, notch_width - c, 0), (c, c, CW)]
+        return _edge(spec.x_spacing + 2*(padding - c), -(padding - c), finger,
+                     b - a - 1, a > 0, b < last)
+
+    def right(seam):
+        if not seam:
+            return [(0, corner_finger_length/2 - padding, 0), (-notch_width + c, 0, 0),
+                    (-c, c, CW), (0, corner_finger_length - 2*c + 2*padding, 0),
+                    (c, c, CW), (notch_width - c, 0, 0),
+                    (0, corner_finger_length/2 - padding, 0)]
+        rise = (0, notch_width + corner_finger_length/2 - padding, 0)
+        return ([rise] + _half_pocket(spec, notch_width, corner_finger_length)
+                + [rise])
+
+    pieces = []
+    for a, b in spans(spec, max_length):
+        start = (ox + brace_x(spec, a), oy - (notch_width if a > 0 else 0))
+        starts = [(x + ox, y) for x, y in _pocket_starts(
+            spec, range(a + 1, b), [oy + corner_finger_length/2 - padding])]
+        pieces.append([_outline(start, bottom, right, a, b, last)]
+                      + tbg.pocket_contours(spec, starts, notch_width,
+                                            corner_finger_length))
+    return pieces
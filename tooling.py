@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+"""
+Draw one job for several endmill diameters at once and compare them.
+
+The tool only enters the geometry through the corner reliefs and the
+clearances next to them, and each of those is a multiple of the diameter
+(chord_length is the diameter over sqrt(2)). Every start point and move of
+a job is therefore base + diameter * slope. The job is recorded at the
+smallest and largest diameter, which gives base and slope for every
+coordinate, and the geometry of all the tools in between is one numpy
+expression. The cut order is worked out once and shared too. Nested jobs
+pack differently for each tool, so they are recorded tool by tool.
+
+    report = write_variants([BoxSpec()], [0.125, 0.25, 0.375], "torsion_box.dxf")
+    # torsion_box_d0.125.dxf, torsion_box_d0.25.dxf, torsion_box_d0.375.dxf
+"""
+import os
+from dataclasses import dataclass, replace
+
+import numpy as np
+from ezdxf.enums import TextEntityAlignment
+
+import torsion_box_generator as tbg
+from gcode import Machine, order_contours, sheet_jobs, toolpath_stats
+from validate import TOLERANCE, Report, check_fits
+
+# 1/8", 1/4" and 3/8" bits
+DIAMETERS = (0.125, 0.25, 0.375)
+
+
+@dataclass
+class ToolModel:
+    """
+    Contours of a job as a function of the endmill diameter d: every start
+    point and move is base + d * slope.
+    """
+    # (layer, color) of each contour
+    styles: list
+    # index of each contour's first move in the move arrays
+    offsets: np.ndarray
+    start_base: np.ndarray
+    start_slope: np.ndarray
+    move_base: np.ndarray
+    move_slope: np.ndarray
+
+    def contours(self, diameters):
+        """
+        Contour list of the job for each diameter.
+        """
+        d = np.asarray(diameters, dtype=float)[:, None, None]
+        starts = self.start_base + d * self.start_slope
+        moves = self.move_base + d * self.move_slope
+        out = []
+        for t in range(len(d)):
+            tool = []
+            for k, (layer, color) in enumerate(self.styles):
+                tool.append(tbg.Contour(starts[t, k], layer, color)
+                            .add(moves[t, self.offsets[k]:self.offsets[k + 1]]))
+            out.append(tool)
+        return out
+
+
+def _stack(contours):
+    starts = np.array([c.start for c in contours]).reshape(-1, 2)
+    moves = np.concatenate([c.moves() for c in contours])
+    return starts, moves
+
+
+def fit_model(a, b, da, db):
+    """
+    ToolModel through the contours a drawn with diameter da and b drawn
+    with db, or None if the two drawings differ by more than their
+    coordinates.
+    """
+    if len(a) != len(b) or da == db:
+        return None
+    for p, q in zip(a, b):
+        if ((p.layer, p.color) != (q.layer, q.color) or len(p.moves()) != len(q.moves())
+                or not np.array_equal(p.moves()[:, 2], q.moves()[:, 2])):
+            return None
+    (sa, ma), (sb, mb) = _stack(a), _stack(b)
+    start_slope = (sb - sa) / (db - da)
+    move_slope = (mb - ma) / (db - da)
+    move_slope[:, 2] = 0
+    return ToolModel([(c.layer, c.color) for c in a],
+                     np.cumsum([0] + [len(c.moves()) for c in a]),
+                     sa - da * start_slope, start_slope,
+                     ma - da * move_slope, move_slope)
+
+
+def tool_specs(specs, diameter):
+    return [replace(spec, endmill_diameter=diameter) for spec in specs]
+
+
+def _notes(specs):
+    # the notes of a stacked job, which name the tool
+    recorder = tbg.RecordingLayout()
+    for k, spec in enumerate(specs):
+        for sp in tbg.layout_plan(spec, (0, k * tbg.BOX_PITCH)).positions("NOTES"):
+            tbg.notes(spec, recorder, sp)
+    return recorder.texts
+
+
+def cut_order(contours, optimize=True):
+    """
+    (sheet origin, [(contour index, entry vertex), ...]) of every sheet, in
+    cutting order.
+    """
+    index = {id(c): k for k, c in enumerate(contours)}
+    order = []
+    for sheet, on_sheet in sheet_jobs(contours):
+        origin = sheet.bounds()[:2]
+        order.append((origin, [(index[id(c)], entry)
+                               for c, entry in order_contours(on_sheet, origin, optimize)]))
+    return order
+
+
+def sheet_split(contours):
+    """
+    Indices of the contours on each sheet, as sheet_jobs() splits them.
+    """
+    index = {id(c): k for k, c in enumerate(contours)}
+    return [[index[id(c)] for c in on_sheet] for _, on_sheet in sheet_jobs(contours)]
+
+
+def _cut_order(contours):
+    # (order, None), or (None, why) for a layout that overflows its sheets
+    try:
+        return cut_order(contours), None
+    except ValueError as e:
+        return None, str(e)
+
+
+def compare(specs, contours, order, machine=Machine()):
+    """
+    Fillets, path length, estimated machine time and joint fit of one tool's
+    job, cut in the given order. Without an order the toolpath figures are
+    None. A min_clearance of 0 is an exact fit, opening and finger of the
+    same width; exact_fits counts those joints.
+    """
+    depth = max(spec.plywood_thickness for spec in specs) + machine.overcut
+    cut = [c for c in contours if c.layer != "Plywood"]
+    fillets = sum(int(np.count_nonzero(c.moves()[:, 2])) for c in cut)
+    fits = Report()
+    for spec in dict.fromkeys(specs):
+        check_fits(fits, spec)
+    toolpath = dict.fromkeys(("path_length", "cut_length", "rapid_distance",
+                              "estimated_minutes"))
+    if order is not None:
+        stats = [toolpath_stats([(contours[k], entry) for k, entry in sheet], depth,
+                                machine, origin)
+                 for origin, sheet in order]
+
+        def total(key):
+            return float(sum(s[key] for s in stats))
+
+        toolpath.update({
+            "path_length": round(float(sum(s["cut_length"] / s["passes"] for s in stats)), 3),
+            "cut_length": round(total("cut_length"), 3),
+            "rapid_distance": round(total("rapid_distance"), 3),
+            "estimated_minutes": round(total("estimated_minutes"), 2),
+        })
+    return {
+        "fillets": fillets,
+        **toolpath,
+        "fit_ok": fits.ok,
+        "min_clearance": min(f["clearance"] for f in fits.fits),
+        "exact_fits": sum(abs(f["clearance"]) <= TOLERANCE for f in fits.fits),
+    }
+
+
+def variants(specs, diameters, nested=False, shared=True):
+    """
+    (contours, texts) of the job for each diameter, and whether they came
+    from one shared ToolModel.
+    """
+    def record(d):
+        recorder = tbg.record_layout(tool_specs(specs, d), nested)
+        return recorder.contours, recorder.texts
+
+    lo, hi = min(diameters), max(diameters)
+    if shared and not nested and len(diameters) > 2:
+        drawn = {lo: record(lo), hi: record(hi)}
+        model = fit_model(drawn[lo][0], drawn[hi][0], lo, hi)
+        if model is not None:
+            rest = [d for d in diameters if d not in drawn]
+            for d, contours in zip(rest, model.contours(rest)):
+                drawn[d] = contours, _notes(tool_specs(specs, d))
+            return [drawn[d] for d in diameters], True
+    return [record(d) for d in diameters], False
+
+
+def variant_filename(filename, diameter):
+    return "{}_d{:g}.dxf".format(os.path.splitext(filename)[0], diameter)
+
+
+def write_variants(specs, diameters, filename, nested=False, machine=Machine(),
+                   polyline=True, shared=True):
+    """
+    Write the job once per endmill diameter, named after filename with
+    _dDIAMETER.dxf in place of its extension, and return the comparison.
+    With shared, the geometry and the cut order come from one pass;
+    otherwise every tool is drawn and ordered on its own. A tool whose
+    layout cannot be split into sheets is not written and gets an error
+    instead of a file and the toolpath figures.
+    """
+    diameters = list(dict.fromkeys(float(d) for d in diameters))
+    drawn, from_model = variants(specs, diameters, nested, shared)
+    shared_order = None
+    if from_model:
+        # a contour's bounds are a min (concave) or max (convex) of linear
+        # functions of the diameter, so the same sheet split for the
+        # smallest and largest tool holds for every tool in between
+        lo, hi = (drawn[diameters.index(pick(diameters))][0] for pick in (min, max))
+        try:
+            if sheet_split(lo) == sheet_split(hi):
+                shared_order = cut_order(lo)
+        except ValueError:
+            pass
+    tools = []
+    for d, (contours, texts) in zip(diameters, drawn):
+        tool = tool_specs(specs, d)
+        if shared_order is not None:
+            order, error = shared_order, None
+        else:
+            order, error = _cut_order(contours)
+        entry = {"diameter": d, "file": None}
+        if error is None:
+            doc = tbg.new_document()
+            msp = doc.modelspace()
+            tbg.add_contours(tool[0], msp, contours, polyline)
+            for t in texts:
+                msp.add_text(t.text, height=t.height,
+                             dxfattribs={"style": "LiberationSerif", "layer": t.layer}
+                             ).set_placement(t.position, align=TextEntityAlignment.LEFT)
+            entry["file"] = variant_filename(filename, d)
+            with tbg.span("save"):
+                doc.saveas(entry["file"])
+        entry.update(compare(tool, contours, order, machine))
+        if error:
+            entry["error"] = error
+        tools.append(entry)
+    return {"shared": from_model, "tools": tools}
@@ -1,579 +1,1462 @@
 #!/usr/bin/env python
 # additional padding space is added to the pockets, not to the fingers
-import ezdxf
+import argparse
+import cProfile
+import hashlib
+import itertools
+import json
 import math
+import os
+import pstats
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, fields, replace
+from functools import lru_cache, wraps
+from multiprocessing import Pool
+
+import ezdxf
 from ezdxf import colors
 from ezdxf.enums import TextEntityAlignment
-from ezdxf.math import ConstructionArc
+from ezdxf.layouts import BaseLayout
 from ezdxf import units
+from ezdxf.addons.r12writer import r12writer
+import numpy as np
 
-endmill_diameter = 0.25
-endmill_radius = endmill_diameter / 2
-chord_length = math.sqrt(2 * endmill_radius ** 2)
-
-plywood_thickness = 0.7
-padding = 1/32
-# padding = 0.111 # oversize of the holes. Does not apply to critical dimensions
-notch_width = plywood_thickness
-notch_length = 4
-
-box_width = 47.5
-box_length = 95.5
-box_height = 7.5
-nbraces = 8
-ntabs = 3
-
-finger_spacing = (box_length - (notch_length*(nbraces-2))) / (nbraces - 1)
-y_finger_spacing = (box_width - ((notch_length + 2*padding) * ntabs))  / (ntabs + 1)
-corner_finger_length = (box_height - 2*notch_width) / 2
-
-# Create a new DXF document.
-doc = ezdxf.new(dxfversion="R2010")
-doc.header.custom_vars.append("Author", "Adam Spontarelli")
-doc.units = units.IN
-doc.header['$INSUNITS'] = units.CM
-
-
-# Create new table entries (layers, linetypes, text styles, ...).
-doc.layers.add("Pocket", color=colors.BLUE)
-doc.layers.add("Plywood", color=colors.YELLOW)
-doc.layers.add("Notes", color=colors.GREEN)
-
-# DXF entities (LINE, TEXT, ...) reside in a layout (modelspace,
-# paperspace layout or block definition).
-msp = doc.modelspace()
-
-def ccw_arc(sp, ep, color=colors.BLACK, layer="0"):
-    if sp[0] > ep[0]:
-        if sp[1] > ep[1]:
-            dp =(sp[0] - chord_length, sp[1])
-        else:
-            dp =(sp[0], sp[1] + chord_length)
-    else:
-        if sp[1] > ep[1]:
-            dp =(sp[0], sp[1] - chord_length)
-        else:
-            dp =(sp[0]+chord_length, sp[1])
-    arc = ConstructionArc.from_3p(start_point=sp, end_point=ep, def_point=dp)
-    arc.add_to_layout(msp, dxfattribs={"color": color, "layer": layer})
-
-def cw_arc(sp, ep, color=colors.BLACK, layer="0"):
-    if sp[0] > ep[0]:
-        if sp[1] > ep[1]:
-            dp =(sp[0], sp[1] - chord_length)
-        else:
-            dp =(sp[0] - chord_length, sp[1])
-    else:
-        if sp[1] > ep[1]:
-            dp =(sp[0] + chord_length, sp[1])
-        else:
-            dp =(sp[0], sp[1] + chord_length)
-    arc = ConstructionArc.from_3p(start_point=sp, end_point=ep, def_point=dp, ccw=False)
-    arc.add_to_layout(msp, dxfattribs={"color": color, "layer": layer})
+# bump when the generated geometry or file layout changes; cached outputs
+# are keyed on it
+__version__ = "0.2.0"
 
-
-def pocket(start_point, width, height):
+@dataclass(frozen=True)
+class BoxSpec:
     """
-    Starts bottom left and moves CCW.
+    Every dimension of one torsion box. All lengths are in inches.
     """
-    end_point = (start_point[0] + width + 2*padding - 2*chord_length, start_point[1])
-    msp.add_line(start_point, end_point, dxfattribs={"color": colors.BLUE, "layer": "Pocket"})
-
-    start_point = end_point
-    end_point = (start_point[0] + chord_length, start_point[1] + chord_length)
-    ccw_arc(start_point, end_point, color=colors.BLUE, layer="Pocket")
+    endmill_diameter: float = 0.25
+    plywood_thickness: float = 0.7
+    padding: float = 1/32
+    # padding = 0.111 # oversize of the holes. Does not apply to critical dimensions
+    notch_length: float = 4
+    box_width: float = 47.5
+    box_length: float = 95.5
+    box_height: float = 7.5
+    nbraces: int = 8
+    ntabs: int = 3
+
+    def __post_init__(self):
+        for name in ("endmill_diameter", "plywood_thickness", "notch_length",
+                     "box_width", "box_length", "box_height"):
+            if not getattr(self, name) > 0:
+                raise ValueError("{} must be positive, got {!r}".format(name, getattr(self, name)))
+        if not self.padding >= 0:
+            raise ValueError("padding must not be negative, got {!r}".format(self.padding))
+        # the end braces and one tab are always drawn
+        if self.nbraces < 2:
+            raise ValueError("nbraces must be at least 2, got {!r}".format(self.nbraces))
+        if self.ntabs < 1:
+            raise ValueError("ntabs must be at least 1, got {!r}".format(self.ntabs))
+        # the parts are only drawn right with plywood between the notches,
+        # corner fingers wider than their reliefs and notches wider than
+        # two of them; optimizer.model() screens candidates the same way
+        if not self.x_spacing > 0:
+            raise ValueError("notch_length {!r} is too long for nbraces {!r} in box_length {!r} "
+                             "(x_spacing {:.4g})".format(self.notch_length, self.nbraces,
+                                                         self.box_length, self.x_spacing))
+        if not self.y_spacing > 0:
+            raise ValueError("notch_length {!r} is too long for ntabs {!r} in box_width {!r} "
+                             "(y_spacing {:.4g})".format(self.notch_length, self.ntabs,
+                                                         self.box_width, self.y_spacing))
+        if not self.corner_finger_length / 2 > self.chord_length:
+            raise ValueError("box_height {!r} is too low for plywood_thickness {!r} and "
+                             "endmill_diameter {!r} (corner_finger_length {:.4g})"
+                             .format(self.box_height, self.plywood_thickness,
+                                     self.endmill_diameter, self.corner_finger_length))
+        if not self.notch_length + 2*self.padding > 2*self.chord_length:
+            raise ValueError("notch_length {!r} is too short for endmill_diameter {!r}"
+                             .format(self.notch_length, self.endmill_diameter))
+
+    @property
+    def endmill_radius(self):
+        return self.endmill_diameter / 2
+
+    @property
+    def chord_length(self):
+        return math.sqrt(2 * self.endmill_radius ** 2)
+
+    @property
+    def notch_width(self):
+        return self.plywood_thickness
+
+    @property
+    def finger_spacing(self):
+        # older name of x_spacing; it used to leave out the notch padding
+        return self.x_spacing
+
+    @property
+    def y_finger_spacing(self):
+        # older name of y_spacing
+        return self.y_spacing
+
+    @property
+    def corner_finger_length(self):
+        return (self.box_height - 2*self.notch_width) / 2
+
+    @property
+    def x_spacing(self):
+        return (self.box_length - ((self.notch_length + 2 * self.padding) * (self.nbraces - 2))) / (self.nbraces - 1)
+
+    @property
+    def y_spacing(self):
+        return (self.box_width - ((self.notch_length + 2 * self.padding) * self.ntabs)) / (self.ntabs + 1)
+
+
+# drawing layers and their colors
+LAYERS = {"Pocket": colors.BLUE, "Plywood": colors.YELLOW, "Notes": colors.GREEN}
+
+
+def new_document():
+    """
+    Create an empty DXF document with the layers used by the part generators.
+    """
+    doc = ezdxf.new(dxfversion="R2010")
+    doc.header.custom_vars.append("Author", "Adam Spontarelli")
+    doc.units = units.IN
+    doc.header['$INSUNITS'] = units.CM
 
-    # right vert
-    start_point = end_point
-    end_point = (end_point[0], end_point[1]+height+2*padding - 2*chord_length)
-    msp.add_line(start_point, end_point, dxfattribs={"color": colors.BLUE, "layer": "Pocket"})
+    # Create new table entries (layers, linetypes, text styles, ...).
+    for name, color in LAYERS.items():
+        doc.layers.add(name, color=color)
+    return doc
 
-    start_point = end_point
-    end_point = (start_point[0] - chord_length, start_point[1] + chord_length)
-    ccw_arc(start_point, end_point, color=colors.BLUE, layer="Pocket")
 
-    # top horiz
-    start_point = end_point
-    end_point = (end_point[0]-width-2*padding+2*chord_length, end_point[1])
-    msp.add_line(start_point, end_point, dxfattribs={"color": colors.BLUE, "layer": "Pocket"})
+# Stats being collected by instrumented(), or None. span() and count() do
+# nothing while it is None, so the hooks cost one global lookup when off.
+_stats = None
+_NO_SPAN = nullcontext()
 
-    start_point = end_point
-    end_point = (start_point[0] - chord_length, start_point[1] - chord_length)
-    ccw_arc(start_point, end_point, color=colors.BLUE, layer="Pocket")
 
-    # left side
-    start_point = end_point
-    end_point = (end_point[0], end_point[1]-height-2*padding+2*chord_length)
-    msp.add_line(start_point, end_point, dxfattribs={"color": colors.BLUE, "layer": "Pocket"})
+class Stats:
+    """
+    Wall time of named spans (calls, total and longest) and event counters
+    collected while instrumented.
+    """
 
-    start_point = end_point
-    end_point = (start_point[0] + chord_length, start_point[1] - chord_length)
-    ccw_arc(start_point, end_point, color=colors.BLUE, layer="Pocket")
+    def __init__(self):
+        self.spans = {}
+        self.counters = {}
+        self.wall_s = 0.0
+        self.profile = None
+
+    def add_span(self, name, seconds):
+        entry = self.spans.setdefault(name, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] = max(entry[2], seconds)
+
+    def merge(self, other):
+        """
+        Add the spans and counters of another Stats, e.g. a worker's.
+        """
+        for name, (calls, total, longest) in other.spans.items():
+            entry = self.spans.setdefault(name, [0, 0.0, 0.0])
+            entry[0] += calls
+            entry[1] += total
+            entry[2] = max(entry[2], longest)
+        for name, n in other.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self, top=25):
+        """
+        JSON-ready summary, slowest spans first. With a profile, the top
+        functions by cumulative time are included.
+        """
+        report = {
+            "version": __version__,
+            "wall_s": round(self.wall_s, 6),
+            "spans": {name: {"calls": calls, "total_s": round(total, 6),
+                             "max_s": round(longest, 6)}
+                      for name, (calls, total, longest)
+                      in sorted(self.spans.items(), key=lambda kv: -kv[1][1])},
+            "counters": dict(sorted(self.counters.items())),
+        }
+        if self.profile is not None:
+            rows = sorted(pstats.Stats(self.profile).stats.items(),
+                          key=lambda kv: -kv[1][3])[:top]
+            report["profile"] = [
+                {"function": "{}:{}({})".format(os.path.basename(path), line, func),
+                 "calls": calls, "tottime_s": round(tottime, 6),
+                 "cumtime_s": round(cumtime, 6)}
+                for (path, line, func), (_, calls, tottime, cumtime, _) in rows]
+        return report
+
+
+class _Span:
+    __slots__ = ("stats", "name", "start")
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.stats.add_span(self.name, time.perf_counter() - self.start)
+
+
+def span(name):
+    """
+    Context manager timing its block as the named span while instrumented.
+    """
+    if _stats is None:
+        return _NO_SPAN
+    return _Span(_stats, name)
 
 
+def count(name, n=1):
+    if _stats is not None:
+        _stats.counters[name] = _stats.counters.get(name, 0) + n
 
 
-def top_plate(start_point = (0,0)):
+@contextmanager
+def instrumented(profile=False):
     """
-    Start bottom left move CCW
+    Collect the spans and counters of everything run inside the with block
+    into the Stats it yields. With profile, cProfile runs as well and the
+    profiler is kept as stats.profile. Collection is per process.
     """
-    origin = start_point
-    # horizontal line
-    end_point = start_point
-    x_spacing = (box_length - ((notch_length + 2 * padding) * (nbraces - 2))) / (nbraces - 1)
-    for i in range(nbraces-2):
-        start_point = end_point
-        end_point = (end_point[0] + x_spacing, start_point[1])
-        msp.add_line(start_point, end_point)
-
-        start_point = end_point
-        end_point = (end_point[0], start_point[1] + notch_width + padding - chord_length)
-        msp.add_line(start_point, end_point)
-
-        start_point = end_point
-        end_point = (start_point[0] + chord_length, start_point[1] + chord_length)
-        cw_arc(start_point, end_point)
-
-        start_point = end_point
-        end_point = (end_point[0] + notch_length+padding*2 - chord_length*2, end_point[1])
-        msp.add_line(start_point, end_point)
-
-        start_point = end_point
-        end_point = (start_point[0] + chord_length, start_point[1] - chord_length)
-        cw_arc(start_point, end_point)
-
-        start_point = end_point
-        end_point = (end_point[0], start_point[1] - notch_width -padding + chord_length)
-        msp.add_line(start_point, end_point)
-
-    start_point = end_point
-    end_point = (end_point[0] + x_spacing, start_point[1])
-    msp.add_line(start_point, end_point)
+    global _stats
+    previous, stats = _stats, Stats()
+    profiler = cProfile.Profile() if profile else None
+    _stats = stats
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield stats
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        stats.wall_s = time.perf_counter() - start
+        stats.profile = profiler
+        _stats = previous
+
+
+@lru_cache(maxsize=64)
+def fillet_geometry(x_sign, y_sign, ccw, radius):
+    """
+    Center offset from the start point and DXF start/end angles of a corner
+    relief heading (x_sign, y_sign). The end points are a diameter apart,
+    so the center is their midpoint and the angles follow from the heading.
+    """
+    half_chord = radius * math.sqrt(2) / 2
+    dx, dy = x_sign * half_chord, y_sign * half_chord
+    start = math.degrees(math.atan2(-dy, -dx)) % 360
+    end = (start + 180) % 360
+    if not ccw:
+        start, end = end, start
+    return dx, dy, start, end
 
 
-    # vertical line
-    # end_point = (box_length,0)
-    y_spacing = (box_width - ((notch_length + 2 * padding) * ntabs)) / (ntabs + 1)
-    for j in range(3):
-        start_point = end_point
-        end_point = (end_point[0], end_point[1]+y_spacing)
-        msp.add_line(start_point, end_point)
+def fillet(msp, sp, ep, radius, ccw, color=colors.BLACK, layer="0"):
+    dx, dy, start, end = fillet_geometry(1 if ep[0] > sp[0] else -1,
+                                         1 if ep[1] > sp[1] else -1,
+                                         ccw, radius)
+    msp.add_arc((sp[0] + dx, sp[1] + dy), radius, start, end,
+                dxfattribs={"color": color, "layer": layer})
 
-        start_point = end_point
-        end_point = (end_point[0] - notch_width - padding + chord_length, end_point[1])
-        msp.add_line(start_point, end_point)
 
-        start_point = end_point
-        end_point = (start_point[0] - chord_length, start_point[1] + chord_length)
-        cw_arc(start_point, end_point)
+def ccw_arc(spec, msp, sp, ep, color=colors.BLACK, layer="0"):
+    fillet(msp, sp, ep, spec.endmill_radius, True, color, layer)
 
-        start_point = end_point
-        end_point = (end_point[0], end_point[1] + notch_length + padding*2 - chord_length*2)
-        msp.add_line(start_point, end_point)
+def cw_arc(spec, msp, sp, ep, color=colors.BLACK, layer="0"):
+    fillet(msp, sp, ep, spec.endmill_radius, False, color, layer)
 
-        start_point = end_point
-        end_point = (start_point[0] + chord_length, start_point[1] + chord_length)
-        cw_arc(start_point, end_point)
 
-        start_point = end_point
-        end_point = (end_point[0]+notch_width + padding - chord_length, end_point[1])
-        msp.add_line(start_point, end_point)
+# Every corner relief is a half circle of endmill_radius whose end points
+# are chord_length apart in x and in y, so it is a bulge of +1 (CCW) or -1 (CW).
+CCW = 1.0
+CW = -1.0
 
-    start_point = end_point
-    end_point = (end_point[0], end_point[1]+y_spacing)
-    msp.add_line(start_point, end_point)
 
+class Contour:
+    """
+    Closed outline stored as relative moves, one (dx, dy, bulge) row per
+    segment. Runs of identical fingers are tiled as arrays instead of being
+    stepped through one point at a time.
+    """
 
-    # top horizontal. start top left, move right
-    end_point = (origin[0], origin[1] + box_width)
-    for i in range(nbraces-2):
-        start_point = end_point
-        end_point = (end_point[0] + x_spacing, end_point[1])
-        msp.add_line(start_point, end_point)
+    def __init__(self, start, layer="0", color=None):
+        self.start = (float(start[0]), float(start[1]))
+        self.layer = layer
+        self.color = color
+        self._runs = []
+
+    def add(self, moves):
+        self._runs.append(np.asarray(moves, dtype=float).reshape(-1, 3))
+        return self
+
+    def repeat(self, period, n, first=None):
+        """
+        Append period n times. first, if given, replaces the first row of
+        the first period (the brace fingers start with a shorter run).
+        """
+        if n <= 0:
+            return self
+        run = np.tile(np.asarray(period, dtype=float), (n, 1))
+        if first is not None:
+            run[0] = first
+        self._runs.append(run)
+        return self
+
+    def moves(self):
+        if not self._runs:
+            return np.zeros((0, 3))
+        if len(self._runs) > 1:
+            self._runs = [np.concatenate(self._runs)]
+        return self._runs[0]
+
+    def vertices(self):
+        """
+        (n, 3) array of x, y and the bulge of the segment leaving each vertex.
+        """
+        moves = self.moves()
+        out = np.empty_like(moves)
+        out[0, :2] = self.start
+        np.cumsum(moves[:-1, :2], axis=0, out=out[1:, :2])
+        out[1:, :2] += self.start
+        out[:, 2] = moves[:, 2]
+        return out
+
+    @classmethod
+    def from_vertices(cls, vertices, layer="0", color=None):
+        """
+        Closed contour from (x, y, bulge) rows as returned by vertices().
+        """
+        vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+        moves = np.empty_like(vertices)
+        moves[:-1, :2] = np.diff(vertices[:, :2], axis=0)
+        moves[-1, :2] = vertices[0, :2] - vertices[-1, :2]
+        moves[:, 2] = vertices[:, 2]
+        return cls(vertices[0, :2], layer, color).add(moves)
+
+    def end(self):
+        return tuple(np.add(self.start, self.moves()[:, :2].sum(axis=0)))
+
+    def moved(self, dx, dy):
+        """
+        The same outline translated by (dx, dy). The moves are shared.
+        """
+        out = Contour((self.start[0] + dx, self.start[1] + dy), self.layer, self.color)
+        out._runs = [self.moves()]
+        return out
+
+    def rotated90(self):
+        """
+        The same outline turned 90 degrees CCW about (0, 0).
+        """
+        out = Contour((-self.start[1], self.start[0]), self.layer, self.color)
+        moves = self.moves()
+        return out.add(np.stack([-moves[:, 1], moves[:, 0], moves[:, 2]], axis=1))
+
+    def _arcs(self):
+        # chord start, chord vector, bulge, center and radius of every arc
+        vertices = self.vertices()
+        arcs = vertices[:, 2] != 0
+        p0 = vertices[arcs, :2]
+        chord = self.moves()[arcs, :2]
+        bulge = vertices[arcs, 2]
+        d = np.hypot(chord[:, 0], chord[:, 1])
+        normal = np.stack([-chord[:, 1], chord[:, 0]], axis=1) / d[:, None]
+        center = p0 + chord / 2 + normal * (d * (1 - bulge**2) / (4 * bulge))[:, None]
+        radius = d * (1 + bulge**2) / (4 * np.abs(bulge))
+        return p0, bulge, center, radius
+
+    def bounds(self):
+        """
+        (xmin, ymin, xmax, ymax) including the arcs.
+        """
+        points = [self.vertices()[:, :2]]
+        p0, bulge, center, radius = self._arcs()
+        if len(bulge):
+            start = np.arctan2(p0[:, 1] - center[:, 1], p0[:, 0] - center[:, 0])
+            sweep = 4 * np.arctan(bulge)
+            for k in range(4):
+                axis = k * np.pi / 2
+                # how far along the arc's direction of travel the axis lies
+                along = np.where(sweep > 0, axis - start, start - axis) % (2 * np.pi)
+                hit = along <= np.abs(sweep)
+                points.append(center[hit] + radius[hit, None] * [np.cos(axis), np.sin(axis)])
+        points = np.concatenate(points)
+        return (*points.min(axis=0).tolist(), *points.max(axis=0).tolist())
+
+    def area(self):
+        """
+        Signed area, positive for a CCW outline, arcs included.
+        """
+        vertices = self.vertices()
+        x, y = vertices[:, 0], vertices[:, 1]
+        area = (np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2
+        p0, bulge, center, radius = self._arcs()
+        theta = 4 * np.arctan(bulge)
+        return float(area + np.sum(radius**2 * (theta - np.sin(theta)) / 2))
+
+
+# turning a run through 180 degrees flips its direction but not its arcs
+ROTATE_180 = np.array([-1.0, -1.0, 1.0])
+
+
+def reverse(moves):
+    """
+    The same path walked backwards.
+    """
+    return -np.asarray(moves, dtype=float)[::-1]
 
-        start_point = end_point
-        end_point = (end_point[0], start_point[1] - notch_width - padding + chord_length)
-        msp.add_line(start_point, end_point)
 
-        start_point = end_point
-        end_point = (start_point[0] + chord_length, start_point[1] - chord_length)
-        ccw_arc(start_point, end_point)
+# lru caches of the part shapes reused by translated(), and of the layout
+# plans
+_SHAPE_CACHES = []
 
-        start_point = end_point
-        end_point = (end_point[0] + notch_length+padding*2 - chord_length*2, end_point[1])
-        msp.add_line(start_point, end_point)
 
-        start_point = end_point
-        end_point = (start_point[0] + chord_length, start_point[1] + chord_length)
-        ccw_arc(start_point, end_point)
+def translated(contours_at):
+    """
+    Decorate contours_at(spec, start_point) for a part whose shape does not
+    depend on where it is placed. The contours are built once per spec at
+    (0, 0); each call returns copies moved to start_point that share the
+    cached moves, so the bottom plate, the repeated braces and every box of
+    the same spec in a job are translations of one computed part.
+    """
+    @lru_cache(maxsize=64)
+    def shape(spec):
+        contours = contours_at(spec, (0, 0))
+        for contour in contours:
+            # join the runs now; cached contours are shared read-only
+            contour.moves()
+        return contours
+
+    _SHAPE_CACHES.append(shape)
+
+    @wraps(contours_at)
+    def at(spec, start_point=(0, 0)):
+        if not isinstance(spec, BoxSpec):
+            # stand-ins such as incremental's tracer must see every read
+            # and would only evict real shapes from the cache
+            return contours_at(spec, start_point)
+        return [c.moved(start_point[0], start_point[1]) for c in shape(spec)]
+    return at
+
+
+def clear_shape_caches():
+    """
+    Forget every part shape cached by translated() and every layout plan.
+    """
+    for shape in _SHAPE_CACHES:
+        shape.cache_clear()
 
-        start_point = end_point
-        end_point = (end_point[0], start_point[1]+notch_width + padding - chord_length)
-        msp.add_line(start_point, end_point)
 
-    start_point = end_point
-    end_point = (end_point[0] + x_spacing, end_point[1])
-    msp.add_line(start_point, end_point)
+class VertexStore:
+    """
+    Vertices of many contours packed into one float64 block in the row
+    layout of an ezdxf LWPOLYLINE (x, y, start width, end width, bulge),
+    with the first row of every contour. Filled in one numpy pass instead of
+    one tuple per vertex.
+    """
+    __slots__ = ("values", "offsets")
+    WIDTH = 5
+
+    def __init__(self, contours):
+        vertices = [c.vertices() for c in contours]
+        rows = np.concatenate(vertices) if vertices else np.zeros((0, 3))
+        self.values = np.zeros((len(rows), self.WIDTH))
+        self.values[:, :2] = rows[:, :2]
+        self.values[:, 4] = rows[:, 2]
+        self.offsets = np.cumsum([0] + [len(v) for v in vertices]).tolist()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def rows(self, k):
+        """
+        View of the packed rows of contour k.
+        """
+        return self.values[self.offsets[k]:self.offsets[k + 1]]
+
+
+def _count_contours(contours, polyline):
+    # segments are counted as lines and arcs whether or not they end up in
+    # one polyline
+    for contour in contours:
+        bulges = contour.moves()[:, 2]
+        arcs = int(np.count_nonzero(bulges))
+        count("arcs", arcs)
+        count("lines", len(bulges) - arcs)
+        if contour.layer == "Pocket":
+            count("pockets")
+    if polyline:
+        count("polylines", len(contours))
+
+
+def add_contours(spec, msp, contours, polyline=True):
+    """
+    Emit each contour as one closed LWPOLYLINE, or as separate LINE and ARC
+    entities when polyline is False.
+    """
+    if _stats is not None:
+        _count_contours(contours, polyline)
+    if polyline and isinstance(msp, BaseLayout):
+        store = VertexStore(contours)
+        for k, contour in enumerate(contours):
+            attribs = {"layer": contour.layer}
+            if contour.color is not None:
+                attribs["color"] = contour.color
+            entity = msp.add_lwpolyline((), close=True, dxfattribs=attribs)
+            if isinstance(entity.lwpoints.values, np.ndarray):
+                # ezdxf keeps the points in this same (n, 5) layout
+                entity.lwpoints.values = store.rows(k)
+            else:
+                entity.set_points(store.rows(k).tolist())
+        return
+    for contour in contours:
+        attribs = {"layer": contour.layer}
+        if contour.color is not None:
+            attribs["color"] = contour.color
+        vertices = contour.vertices()
+        if polyline:
+            msp.add_lwpolyline(vertices.tolist(), format="xyb", close=True,
+                               dxfattribs=attribs)
+            continue
+        points = vertices[:, :2].tolist()
+        points.append(points[0])
+        arc_color = colors.BLACK if contour.color is None else contour.color
+        for k, bulge in enumerate(vertices[:, 2].tolist()):
+            sp, ep = tuple(points[k]), tuple(points[k + 1])
+            if bulge > 0:
+                ccw_arc(spec, msp, sp, ep, color=arc_color, layer=contour.layer)
+            elif bulge < 0:
+                cw_arc(spec, msp, sp, ep, color=arc_color, layer=contour.layer)
+            else:
+                msp.add_line(sp, ep, dxfattribs=attribs)
+
+
+def shape_key(contours, origin):
+    """
+    Short hash of the contours' geometry relative to origin. Parts with the
+    same key are identical up to translation.
+    """
+    h = hashlib.sha1()
+    for contour in contours:
+        offset = np.subtract(contour.start, origin)
+        # + 0.0 folds -0.0 into 0.0 so equal shapes hash equally
+        h.update(np.round(offset, 6).astype(float) + 0.0)
+        h.update(np.round(contour.moves(), 6) + 0.0)
+        h.update("{}/{}".format(contour.layer, contour.color).encode())
+    return h.hexdigest()[:10].upper()
 
 
-    #left edge. start bot left, move upward
-    end_point = origin
-    for j in range(3):
-        start_point = end_point
-        end_point = (end_point[0], end_point[1] + y_spacing)
-        msp.add_line(start_point, end_point)
+def part_block(spec, doc, name, contours, origin, polyline=True):
+    """
+    Define the part once as a BLOCK whose base point is origin and return
+    its name. Shapes repeated inside the part (pockets) are nested blocks.
+    """
+    block_name = "{}_{}".format(name, shape_key(contours, origin))
+    if block_name in doc.blocks:
+        return block_name
+    block = doc.blocks.new(block_name)
+    count("blocks")
+    shapes = {}
+    for contour in contours:
+        shapes.setdefault(shape_key([contour], contour.start), []).append(contour)
+    for group in shapes.values():
+        first = group[0]
+        if len(group) == 1:
+            add_contours(spec, block, [first.moved(-origin[0], -origin[1])], polyline)
+            continue
+        inner = part_block(spec, doc, first.layer.upper(), [first], first.start, polyline)
+        for contour in group:
+            block.add_blockref(inner, (contour.start[0] - origin[0],
+                                       contour.start[1] - origin[1]),
+                               dxfattribs={"layer": contour.layer})
+        count("inserts", len(group))
+    return block_name
+
+
+def add_part(spec, msp, name, contours, origin, polyline=True, instance=False):
+    """
+    Emit the contours of one part, or with instance, an INSERT of the
+    part's block at origin.
+    """
+    if not instance:
+        add_contours(spec, msp, contours, polyline)
+        return
+    msp.add_blockref(part_block(spec, msp.doc, name, contours, origin, polyline),
+                     origin)
+    count("inserts")
 
-        start_point = end_point
-        end_point = (end_point[0] + notch_width + padding - chord_length, end_point[1])
-        msp.add_line(start_point, end_point)
 
-        start_point = end_point
-        end_point = (start_point[0] + chord_length, start_point[1] + chord_length)
-        ccw_arc(start_point, end_point)
+def explode_inserts(doc):
+    """
+    Replace every INSERT in the modelspace with the entities of its block,
+    nested blocks included, and drop the block definitions. For CAM tools
+    that do not read blocks.
+    """
+    msp = doc.modelspace()
+    inserts = msp.query("INSERT")
+    while len(inserts):
+        for insert in inserts:
+            insert.explode()
+        inserts = msp.query("INSERT")
+    for name in [block.name for block in doc.blocks
+                 if not block.is_any_layout and not block.name.startswith("*")]:
+        doc.blocks.delete_block(name, safe=False)
+    return doc
+
+
+def pocket_contours(spec, start_points, width, height):
+    """
+    Starts bottom left and moves CCW.
+    """
+    c = spec.chord_length
+    w = width + 2*spec.padding - 2*c
+    h = height + 2*spec.padding - 2*c
+    moves = np.array([
+        (w, 0, 0), (c, c, CCW),      # bottom, right vert
+        (0, h, 0), (-c, c, CCW),
+        (-w, 0, 0), (-c, -c, CCW),   # top horiz, left side
+        (0, -h, 0), (c, -c, CCW),
+    ])
+    return [Contour(sp, "Pocket", colors.BLUE).add(moves) for sp in start_points]
 
-        start_point = end_point
-        end_point = (end_point[0], end_point[1] + notch_length + padding*2 - chord_length * 2)
-        msp.add_line(start_point, end_point)
 
-        start_point = end_point
-        end_point = (start_point[0] - chord_length, start_point[1] + chord_length)
-        ccw_arc(start_point, end_point)
+def pocket(spec, msp, start_point, width, height, polyline=True, instance=False):
+    add_part(spec, msp, "POCKET", pocket_contours(spec, [start_point], width, height),
+             start_point, polyline, instance)
 
-        start_point = end_point
-        end_point = (end_point[0]- notch_width - padding + chord_length, end_point[1])
-        msp.add_line(start_point, end_point)
 
-    start_point = end_point
-    end_point = (end_point[0], end_point[1]+y_spacing)
-    msp.add_line(start_point, end_point)
+@translated
+def top_plate_contours(spec, start_point=(0,0)):
+    """
+    Start bottom left move CCW
+    """
+    c = spec.chord_length
+    padding = spec.padding
+    notch_length = spec.notch_length
+    nbraces = spec.nbraces
+    ntabs = spec.ntabs
+    x_spacing = spec.x_spacing
+    y_spacing = spec.y_spacing
+    depth = spec.notch_width + padding - c
+    span = notch_length + padding*2 - c*2
 
+    origin = start_point
+    # one brace notch along the bottom edge, heading right
+    bottom = [(x_spacing, 0, 0), (0, depth, 0), (c, c, CW),
+              (span, 0, 0), (c, -c, CW), (0, -depth, 0)]
+    # one short brace notch up the right edge
+    right = [(0, y_spacing, 0), (-depth, 0, 0), (-c, c, CW),
+             (0, span, 0), (c, c, CW), (depth, 0, 0)]
+
+    half = Contour(origin)
+    half.repeat(bottom, nbraces-2).add((x_spacing, 0, 0))
+    half.repeat(right, ntabs).add((0, y_spacing, 0))
+    # the top and left edges are the bottom and right turned through 180
+    # degrees
+    moves = half.moves()
+    outline = Contour(origin).add(moves).add(moves * ROTATE_180)
 
     # interior pockets
-    for i in range(nbraces-2):
-        for j in range(3):
-            start_point = (origin[0] + x_spacing * (i+1)
-                           + (notch_length/2 + padding)*(2*(i+1) - 1)
-                           - (notch_width + 2*padding - 2*chord_length)/2,
-                           origin[1] +
-                           y_spacing * (j+1) + (notch_length+2*padding)*j)
+    i, j = np.meshgrid(np.arange(1, nbraces-1), np.arange(ntabs), indexing="ij")
+    x = (origin[0] + x_spacing * i
+         + (notch_length/2 + padding)*(2*i - 1)
+         - (spec.notch_width + 2*padding - 2*c)/2)
+    y = origin[1] + y_spacing * (j+1) + (notch_length+2*padding)*j
+    starts = np.stack([x.ravel(), y.ravel()], axis=1).tolist()
+    return [outline] + pocket_contours(spec, starts, spec.notch_width, notch_length)
+
 
-            pocket(start_point, notch_width, notch_length)
+def top_plate(spec, msp, start_point = (0,0), polyline=True, instance=False):
+    add_part(spec, msp, "TOP_PLATE", top_plate_contours(spec, start_point),
+             start_point, polyline, instance)
 
-# short brace
-def short_brace(start_point):
+
+@translated
+def short_brace_contours(spec, start_point):
     """
     Start at bottom left, go clockwise
     """
-    # start_point = [-20,100]
-    y_spacing = (box_width - ((notch_length + 2 * padding) * ntabs)) / (ntabs + 1)
-
-    for i in range(ntabs):
-        end_point = (start_point[0]+ y_spacing -
-                     notch_width - chord_length + padding, start_point[1])
-        if i >0:
-            end_point = (end_point[0]+notch_width -chord_length + padding, end_point[1])
-        msp.add_line(start_point, end_point)
-
-        start_point = end_point
-        end_point = (start_point[0] + chord_length, start_point[1] + chord_length)
-        ccw_arc(start_point, end_point)
-
-        start_point = end_point
-        end_point = (end_point[0], start_point[1]+notch_width - chord_length)
-        msp.add_line(start_point, end_point)
+    c = spec.chord_length
+    padding = spec.padding
+    notch_width = spec.notch_width
+    notch_length = spec.notch_length
+    corner_finger_length = spec.corner_finger_length
+    run = spec.y_spacing - notch_width - c + padding
+
+    finger = [(run + notch_width - c + padding, 0, 0), (c, c, CCW),
+              (0, notch_width - c, 0), (notch_length, 0, 0),
+              (0, -notch_width + c, 0), (c, -c, CCW)]
+    # short end. always one finger
+    short_end = [(0, -corner_finger_length / 2 + c, 0), (c, -c, CCW),
+                 (notch_width - c, 0, 0), (0, -corner_finger_length, 0),
+                 (-notch_width + c, 0, 0), (-c, -c, CCW),
+                 (0, -corner_finger_length / 2 + c, 0)]
+
+    half = Contour(start_point)
+    half.repeat(finger, spec.ntabs, first=(run, 0, 0)).add((run, 0, 0))
+    half.add(short_end)
+    # the way back is the same half turned through 180 degrees
+    moves = half.moves()
+    return [Contour(start_point).add(moves).add(moves * ROTATE_180)]
+
+
+def short_brace(spec, msp, start_point, polyline=True, instance=False):
+    add_part(spec, msp, "SHORT_BRACE", short_brace_contours(spec, start_point),
+             start_point, polyline, instance)
+
+
+@translated
+def long_brace_contours(spec, start_point):
+    c = spec.chord_length
+    padding = spec.padding
+    notch_width = spec.notch_width
+    notch_length = spec.notch_length
+    corner_finger_length = spec.corner_finger_length
+    nbraces = spec.nbraces
+    x_spacing = spec.x_spacing
+    run = x_spacing + padding - c
 
-        start_point = end_point
-        end_point = (end_point[0]+notch_length, start_point[1])
-        msp.add_line(start_point, end_point)
+    origin = start_point
+    # start bottom left, go CCW
+    finger = [(run - c + padding, 0, 0), (c, -c, CW),
+              (0, -(notch_width - c), 0), (notch_length, 0, 0),
+              (0, notch_width - c, 0), (c, c, CW)]
+    # right side vertical, always one finger
+    side = [(0, corner_finger_length/2 - padding, 0), (-notch_width + c, 0, 0),
+            (-c, c, CW), (0, corner_finger_length - 2*c + 2*padding, 0),
+            (c, c, CW), (notch_width - c, 0, 0),
+            (0, corner_finger_length/2 - padding, 0)]
+
+    half = Contour(origin)
+    half.repeat(finger, nbraces-2, first=(run, 0, 0)).add((run, 0, 0))
+    half.add(side)
+    # top horizontal and left vertical mirror the first half
+    moves = half.moves()
+    outline = Contour(origin).add(moves).add(moves * ROTATE_180)
 
-        start_point = end_point
-        end_point = (end_point[0],start_point[1]-notch_width+chord_length)
-        msp.add_line(start_point, end_point)
+    # pockets. Start bottom left, go CCW
+    pocket_height = origin[1] + corner_finger_length/2 - padding
+    i = np.arange(1, nbraces-1)
+    x = (origin[0] + i * x_spacing
+         + (i-1) * 2 * padding
+         + notch_length / 2
+         + (i - 1) * notch_length
+         - ((notch_width - 2*c) / 2))
+    starts = [(xi, pocket_height) for xi in x.tolist()]
+    return [outline] + pocket_contours(spec, starts, notch_width, corner_finger_length)
 
-        start_point = end_point
-        end_point = (start_point[0] + chord_length, start_point[1] - chord_length)
-        ccw_arc(start_point, end_point)
 
-        start_point = end_point
+def long_brace(spec, msp, start_point, polyline=True, instance=False):
+    add_part(spec, msp, "LONG_BRACE", long_brace_contours(spec, start_point),
+             start_point, polyline, instance)
 
-    start_point = end_point
-    end_point = (start_point[0]+ y_spacing - notch_width
-                 - chord_length + padding, start_point[1])
-    msp.add_line(start_point, end_point)
 
-    # short end. always one finger
-    start_point = end_point
-    end_point = (start_point[0], start_point[1]- corner_finger_length / 2 + chord_length)
-    msp.add_line(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0] + chord_length, start_point[1] - chord_length)
-    ccw_arc(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0]+notch_width-chord_length, start_point[1])
-    msp.add_line(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0], start_point[1] - corner_finger_length)
-    msp.add_line(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0] - notch_width + chord_length, start_point[1])
-    msp.add_line(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0] - chord_length, start_point[1] - chord_length)
-    ccw_arc(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0], start_point[1] - corner_finger_length / 2 + chord_length)
-    msp.add_line(start_point, end_point)
-
-    # return back down
-    start_point = end_point
-    for i in range(ntabs):
-        end_point = (start_point[0]- y_spacing +
-                     notch_width + chord_length - padding, start_point[1])
-        if i >0:
-            end_point = (end_point[0]-notch_width + chord_length - padding, end_point[1])
-        msp.add_line(start_point, end_point)
-
-        start_point = end_point
-        end_point = (start_point[0] - chord_length, start_point[1] - chord_length)
-        ccw_arc(start_point, end_point)
-
-        start_point = end_point
-        end_point = (end_point[0], start_point[1]-notch_width + chord_length)
-        msp.add_line(start_point, end_point)
-
-        start_point = end_point
-        end_point = (end_point[0]-notch_length, start_point[1])
-        msp.add_line(start_point, end_point)
-
-        start_point = end_point
-        end_point = (end_point[0], start_point[1]+notch_width-chord_length)
-        msp.add_line(start_point, end_point)
-
-        start_point = end_point
-        end_point = (start_point[0] - chord_length, start_point[1] + chord_length)
-        ccw_arc(start_point, end_point)
-
-        start_point = end_point
-
-    start_point = end_point
-    end_point = (start_point[0]- y_spacing + notch_width
-                 + chord_length - padding, start_point[1])
-    msp.add_line(start_point, end_point)
-
-    # bottom horizontal. Head left
-    start_point = end_point
-    end_point = (start_point[0], start_point[1]+ corner_finger_length / 2 - chord_length)
-    msp.add_line(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0] - chord_length, start_point[1] + chord_length)
-    ccw_arc(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0]-notch_width+chord_length, start_point[1])
-    msp.add_line(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0], start_point[1] + corner_finger_length)
-    msp.add_line(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0] + notch_width - chord_length, start_point[1])
-    msp.add_line(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0] + chord_length, start_point[1] + chord_length)
-    ccw_arc(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0], start_point[1] + corner_finger_length / 2 - chord_length)
-    msp.add_line(start_point, end_point)
-
-
-def long_brace(start_point):
-    x_spacing = (box_length - ((notch_length + 2 * padding) * (nbraces - 2))) / (nbraces - 1)
-    # start bottom left, go CCW
-    for i in range(nbraces-2):
-        end_point = (start_point[0] + x_spacing + padding - chord_length, start_point[1])
-        if i > 0:
-            end_point = (end_point[0] -chord_length + padding, end_point[1])
-        msp.add_line(start_point, end_point)
-
-        start_point = end_point
-        end_point = (start_point[0] + chord_length, start_point[1] - chord_length)
-        cw_arc(start_point, end_point)
-
-        start_point = end_point
-        end_point = (start_point[0], end_point[1] - (notch_width - chord_length))
-        msp.add_line(start_point, end_point)
-        start_point = end_point
-        end_point = (start_point[0]+notch_length, end_point[1])
-        msp.add_line(start_point, end_point)
-        start_point = end_point
-        end_point = (start_point[0], end_point[1]+notch_width -chord_length)
-        msp.add_line(start_point, end_point)
-
-        start_point = end_point
-        end_point = (start_point[0] + chord_length, start_point[1] + chord_length)
-        cw_arc(start_point, end_point)
-        start_point = end_point
-
-    end_point = (start_point[0]+x_spacing - chord_length + padding, end_point[1])
-    msp.add_line(start_point, end_point)
+# width and height of a plywood sheet
+SHEET_SIZE = (96, 48)
 
-    # right side vertical, always one finger
-    start_point = end_point
-    end_point = (start_point[0], end_point[1]+ corner_finger_length/2 - padding)
-    msp.add_line(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0]-notch_width + chord_length, end_point[1])
-    msp.add_line(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0] - chord_length, start_point[1] + chord_length)
-    cw_arc(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0], end_point[1]+corner_finger_length - 2*chord_length + 2*padding)
-    msp.add_line(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0] + chord_length, start_point[1] + chord_length)
-    cw_arc(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0]+notch_width - chord_length, end_point[1])
-    msp.add_line(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0], end_point[1]+corner_finger_length/2 - padding)
-    msp.add_line(start_point, end_point)
-
-    # top horizontal, head left
-    start_point = end_point
-    for i in range(nbraces-2):
-        end_point = (start_point[0]-(x_spacing - chord_length + padding), start_point[1])
-        if i > 0:
-            end_point = (end_point[0] + chord_length - padding, end_point[1])
-        msp.add_line(start_point, end_point)
-
-        start_point = end_point
-        end_point = (start_point[0] - chord_length, start_point[1] + chord_length)
-        cw_arc(start_point, end_point)
-
-        start_point = end_point
-        end_point = (start_point[0], end_point[1] + notch_width - chord_length)
-        msp.add_line(start_point, end_point)
-        start_point = end_point
-        end_point = (start_point[0]-notch_length, end_point[1])
-        msp.add_line(start_point, end_point)
-        start_point = end_point
-        end_point = (start_point[0], end_point[1]-notch_width + chord_length)
-        msp.add_line(start_point, end_point)
-
-        start_point = end_point
-        end_point = (start_point[0] - chord_length, start_point[1] - chord_length)
-        cw_arc(start_point, end_point)
-
-        start_point = end_point
-    end_point = (start_point[0]- x_spacing+ chord_length - padding, end_point[1])
-    msp.add_line(start_point, end_point)
-
-    # left vertical, heading down
-    start_point = end_point
-    end_point = (start_point[0], end_point[1]-corner_finger_length/2 + padding)
-    msp.add_line(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0]+notch_width-chord_length, end_point[1])
-    msp.add_line(start_point, end_point)
-
-    start_point = end_point
-    end_point = (start_point[0] + chord_length, start_point[1] - chord_length)
-    cw_arc(start_point, end_point)
-
-    start_point = end_point
-    end_point = (start_point[0], end_point[1]-corner_finger_length + 2*chord_length - 2*padding)
-    msp.add_line(start_point, end_point)
-
-    start_point = end_point
-    end_point = (start_point[0] - chord_length, start_point[1] - chord_length)
-    cw_arc(start_point, end_point)
-
-    start_point = end_point
-    end_point = (start_point[0]-notch_width+chord_length, end_point[1])
-    msp.add_line(start_point, end_point)
-    start_point = end_point
-    end_point = (start_point[0], end_point[1]-corner_finger_length/2 + padding)
-    msp.add_line(start_point, end_point)
 
-    # pockets. Start bottom left, go CCW
-    pocket_height = end_point[1]+ corner_finger_length/2 - padding
-    for i in range(1,nbraces-1):
-        start_point = (i* x_spacing
-                       + (i-1) * 2 * padding
-                       + notch_length / 2
-                       + (i - 1) * notch_length
-                       - ((notch_width - 2*chord_length) / 2), pocket_height)
-        pocket(start_point, notch_width, corner_finger_length)
+def plywood_contours(sp, size=SHEET_SIZE):
+    """
+    Plywood sheet at the starting point given.
+    """
+    w, h = size
+    sheet = Contour(sp, "Plywood", colors.YELLOW)
+    return [sheet.add([(w, 0, 0), (0, h, 0), (-w, 0, 0), (0, -h, 0)])]
 
 
-def plywood(sp):
+def plywood(msp, sp, polyline=True, instance=False, size=SHEET_SIZE):
     """
     Draw plywood sheet at the starting point given.
     """
-    msp.add_line((sp[0],sp[1]), (sp[0]+96,sp[1]+0),
-                 dxfattribs={"color": colors.YELLOW, "layer": "Plywood"})
-    msp.add_line((sp[0]+96,sp[1]+0), (sp[0]+96, sp[1]+48),
-                 dxfattribs={"color": colors.YELLOW, "layer": "Plywood"})
-    msp.add_line((sp[0]+96,sp[1]+ 48), (sp[0]+0, sp[1]+48),
-                 dxfattribs={"color": colors.YELLOW, "layer": "Plywood"})
-    msp.add_line((sp[0]+0,sp[1]+48), (sp[0]+0, sp[1]+0),
-                 dxfattribs={"color": colors.YELLOW, "layer": "Plywood"})
+    add_part(None, msp, "PLYWOOD", plywood_contours(sp, size), sp, polyline, instance)
+
 
-def leg_holes(sp):
+@translated
+def leg_hole_contours(spec, sp):
     """
     Add holes for 4x4 legs.
     Start bottom left, go CW.
     """
+    padding = spec.padding
+    plywood_thickness = spec.plywood_thickness
     width = 3.5
     height = 3.5
 
-    sp = (sp[0] + plywood_thickness + chord_length, sp[1] + plywood_thickness)
-    pocket(sp, width, height)
-    sp = (sp[0], sp[1] + box_width - height - 2*plywood_thickness - 2*padding)
-    pocket(sp, width, height)
-    sp = (sp[0] + box_length - width - 2*(plywood_thickness +padding), sp[1])
-    pocket(sp, width, height)
-    sp = (sp[0], sp[1] - box_width + height + 2*(plywood_thickness + padding))
-    pocket(sp, width, height)
+    sp = (sp[0] + plywood_thickness + spec.chord_length, sp[1] + plywood_thickness)
+    starts = [sp]
+    sp = (sp[0], sp[1] + spec.box_width - height - 2*plywood_thickness - 2*padding)
+    starts.append(sp)
+    sp = (sp[0] + spec.box_length - width - 2*(plywood_thickness +padding), sp[1])
+    starts.append(sp)
+    sp = (sp[0], sp[1] - spec.box_width + height + 2*(plywood_thickness + padding))
+    starts.append(sp)
+    return pocket_contours(spec, starts, width, height)
 
 
+def leg_holes(spec, msp, sp, polyline=True, instance=False):
+    add_part(spec, msp, "LEG_HOLES", leg_hole_contours(spec, sp), sp, polyline, instance)
+
+
+def notes(spec, msp, sp, polyline=True, instance=False):
+    """
+    Write the main dimensions of the box at sp.
+    """
+    note = "Endmill Diameter: {}, \nPlywood Thickness: {}, Box Width: {}, Box Length: {}, Box Height: {}".format(str(spec.endmill_diameter),str(spec.plywood_thickness), str(spec.box_width), str(spec.box_length), str(spec.box_height))
+    msp.add_text(
+        note,
+        height=1,
+        dxfattribs={"style": "LiberationSerif", "layer":"Notes"}
+    ).set_placement(sp, align=TextEntityAlignment.LEFT)
+    count("texts")
+
+
+# how each entry of layout_positions() is drawn:
+# part -> draw(spec, msp, start_point, polyline, instance)
+EMITTERS = {
+    "PLYWOOD": lambda spec, msp, sp, polyline, instance: plywood(msp, sp, polyline, instance),
+    "TOP_PLATE": top_plate,
+    "SHORT_BRACE": short_brace,
+    "LONG_BRACE": long_brace,
+    "LEG_HOLES": leg_holes,
+    "NOTES": notes,
+}
+
+
+# the contours of each part of layout_positions() but the notes:
+# part -> contours(spec, start_point)
+PART_CONTOURS = {
+    "PLYWOOD": lambda spec, sp: plywood_contours(sp),
+    "TOP_PLATE": top_plate_contours,
+    "SHORT_BRACE": short_brace_contours,
+    "LONG_BRACE": long_brace_contours,
+    "LEG_HOLES": leg_hole_contours,
+}
+
+
+@dataclass(frozen=True)
+class LayoutPlan:
+    """
+    Every derived dimension and part placement of one box, computed once
+    and touching no DXF document. emit() turns a plan into geometry.
+    """
+    spec: BoxSpec
+    # lower left corner of the top plate's sheet
+    origin: tuple
+    chord_length: float
+    x_spacing: float
+    y_spacing: float
+    # depth and length of an edge notch, corner reliefs included
+    notch_depth: float
+    notch_span: float
+    corner_finger_length: float
+    # (part, start point) of every sheet, part and note in drawing order
+    placements: tuple
+
+    def positions(self, part):
+        """
+        Start points of every copy of one part.
+        """
+        return [sp for name, sp in self.placements if name == part]
+
+    @property
+    def sheets(self):
+        return len(self.positions("PLYWOOD"))
+
+
+def _placements(spec, ox, oy):
+    notch_width = spec.notch_width
+    endmill_diameter = spec.endmill_diameter
+    padding = spec.padding
+    box_height = spec.box_height
 
-def main():
     # Top plate
-    plywood((0,0))
-    top_plate()
+    placed = [("PLYWOOD", (ox, oy)), ("TOP_PLATE", (ox, oy))]
 
     # short braces
-    plywood((0,48))
+    placed.append(("PLYWOOD", (ox, oy+48)))
     for j in range(0,2):
-        for i in range(1, int(nbraces / 2) + 1):
-            start_point = (notch_width +
-                           (box_width+ endmill_diameter + padding)*j ,
-                           notch_width + i * (endmill_diameter+padding) +
+        for i in range(1, int(spec.nbraces / 2) + 1):
+            start_point = (ox + notch_width +
+                           (spec.box_width+ endmill_diameter + padding)*j ,
+                           oy + notch_width + i * (endmill_diameter+padding) +
                            i * box_height + 62
                            ) # 62 is fudge factor to get these in the right place
-            short_brace(start_point)
+            placed.append(("SHORT_BRACE", start_point))
 
     # long braces
     for i in range(2):
-        sp = (0,
-              48 + notch_width + i * (box_height + endmill_diameter + padding))
-        long_brace(sp)
+        sp = (ox,
+              oy + 48 + notch_width + i * (box_height + endmill_diameter + padding))
+        placed.append(("LONG_BRACE", sp))
 
     # bottom plate
-    plywood((0,-48))
-    top_plate((0, -48))
-    leg_holes((0,-48))
+    placed += [("PLYWOOD", (ox, oy-48)), ("TOP_PLATE", (ox, oy-48)),
+               ("LEG_HOLES", (ox, oy-48))]
 
     # Add notes
-    note = "Endmill Diameter: {}, \nPlywood Thickness: {}, Box Width: {}, Box Length: {}, Box Height: {}".format(str(endmill_diameter),str(plywood_thickness), str(box_width), str(box_length), str(box_height))
-    msp.add_text(
-        note,
-        height=1,
-        dxfattribs={"style": "LiberationSerif", "layer":"Notes"}
-    ).set_placement((0, -50), align=TextEntityAlignment.LEFT)
+    placed.append(("NOTES", (ox, oy-50)))
+    return tuple(placed)
 
-    # Save the DXF document.
-    doc.saveas("torsion_box.dxf")
 
-main()
+@lru_cache(maxsize=1024)
+def layout_plan(spec, origin=(0, 0)):
+    """
+    The LayoutPlan of one box with the top plate's sheet at origin. Plans
+    are memoized, so every caller laying out the same box shares one.
+    """
+    c = spec.chord_length
+    ox, oy = origin
+    return LayoutPlan(
+        spec, (ox, oy), c, spec.x_spacing, spec.y_spacing,
+        spec.notch_width + spec.padding - c,
+        spec.notch_length + 2*spec.padding - 2*c,
+        spec.corner_finger_length, _placements(spec, ox, oy))
+
+
+_SHAPE_CACHES.append(layout_plan)
+
+
+def layout_positions(spec, origin=(0, 0)):
+    """
+    (part, start point) of every sheet, part and note of one box in drawing
+    order, with the top plate's sheet at origin.
+    """
+    return list(layout_plan(spec, tuple(origin)).placements)
+
+
+def plan_contours(plan):
+    """
+    (part, start point, contours) of every placement of a plan but the
+    notes, without drawing anything.
+    """
+    return [(name, sp, PART_CONTOURS[name](plan.spec, sp))
+            for name, sp in plan.placements if name in PART_CONTOURS]
+
+
+def emit(plan, msp, polyline=True, instance=False):
+    """
+    Draw every sheet and part of a plan into the given layout. Outlines
+    are closed LWPOLYLINEs unless polyline is False. With instance, each
+    unique part is a BLOCK and its copies are INSERTs.
+    """
+    for name, sp in plan.placements:
+        with span(name.lower()):
+            EMITTERS[name](plan.spec, msp, sp, polyline, instance)
+
+
+def layout(spec, msp, origin=(0, 0), polyline=True, instance=False):
+    """
+    Draw every sheet and part of one box into the given layout, with the
+    top plate's sheet at origin; see emit().
+    """
+    emit(layout_plan(spec, tuple(origin)), msp, polyline, instance)
+
+
+# vertical distance between boxes of a multi-box job: three sheets plus
+# room for the notes
+BOX_PITCH = 3 * 48 + 16
+
+
+class StreamingLayout:
+    """
+    Stand-in for an ezdxf layout that writes each entity straight to an
+    R12 DXF stream as the part generators emit it, so memory stays flat
+    however many boxes go into one file. Blocks are not supported.
+    """
+    doc = None
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def add_lwpolyline(self, points, format="xy", close=False, dxfattribs=None):
+        attribs = dxfattribs or {}
+        self.writer.add_polyline_2d(points, format=format, closed=close,
+                                    layer=attribs.get("layer", "0"),
+                                    color=attribs.get("color"))
+
+    def add_line(self, start, end, dxfattribs=None):
+        attribs = dxfattribs or {}
+        self.writer.add_line(start, end, layer=attribs.get("layer", "0"),
+                             color=attribs.get("color"))
+
+    def add_arc(self, center, radius, start_angle, end_angle, dxfattribs=None):
+        attribs = dxfattribs or {}
+        self.writer.add_arc(center, radius, start_angle, end_angle,
+                            layer=attribs.get("layer", "0"),
+                            color=attribs.get("color"))
+
+    def add_text(self, text, height=1, dxfattribs=None):
+        return _StreamedText(self.writer, text, height, dxfattribs or {})
+
+
+class _StreamedText:
+    # TEXT is written once set_placement() supplies the insertion point
+
+    def __init__(self, writer, text, height, attribs):
+        self.writer = writer
+        self.text = text
+        self.height = height
+        self.attribs = attribs
+
+    def set_placement(self, p1, p2=None, align=None):
+        # DXF caret-encodes control characters; a raw newline breaks the file
+        self.writer.add_text(self.text.replace("\n", "^J"), insert=p1,
+                             height=self.height,
+                             align=align.name if align else "LEFT",
+                             layer=self.attribs.get("layer", "0"),
+                             color=self.attribs.get("color"))
+        return self
+
+
+@dataclass(frozen=True)
+class Text:
+    """
+    Left-aligned note; lines are separated by "\n".
+    """
+    text: str
+    position: tuple
+    height: float = 1
+    layer: str = "0"
+
+
+class RecordingLayout:
+    """
+    Stand-in for an ezdxf layout that keeps every closed polyline as a
+    Contour and every note as a Text instead of writing DXF, for backends
+    and checks that work on the geometry itself.
+    """
+    doc = None
+
+    def __init__(self):
+        self.contours = []
+        self.texts = []
+
+    def add_lwpolyline(self, points, format="xy", close=False, dxfattribs=None):
+        attribs = dxfattribs or {}
+        self.contours.append(Contour.from_vertices(
+            points, attribs.get("layer", "0"), attribs.get("color")))
+
+    def add_text(self, text, height=1, dxfattribs=None):
+        return _RecordedText(self.texts, text, height, dxfattribs or {})
+
+
+class _RecordedText:
+    def __init__(self, texts, text, height, attribs):
+        self.texts = texts
+        self.text = text
+        self.height = height
+        self.layer = attribs.get("layer", "0")
+
+    def set_placement(self, p1, p2=None, align=None):
+        self.texts.append(Text(self.text, (float(p1[0]), float(p1[1])),
+                               self.height, self.layer))
+        return self
+
+
+def record_layout(specs, nested=False):
+    """
+    RecordingLayout of a job: the boxes stacked as write_job() lays them
+    out, or nested.
+    """
+    recorder = RecordingLayout()
+    if nested:
+        from nesting import draw_nesting, nest_job
+        draw_nesting(nest_job(specs), recorder)
+    else:
+        for k, spec in enumerate(specs):
+            layout(spec, recorder, (0, k * BOX_PITCH))
+    return recorder
+
+
+def layout_contours(specs, nested=False):
+    """
+    Every contour of a job, sheets included, in drawing coordinates.
+    """
+    if nested:
+        return record_layout(specs, nested).contours
+    return [contour for k, spec in enumerate(specs)
+            for _, _, contours in plan_contours(layout_plan(spec, (0, k * BOX_PITCH)))
+            for contour in contours]
+
+
+def build_document(spec, **options):
+    """
+    Return a new DXF document holding one complete box. options are passed
+    on to layout().
+    """
+    doc = new_document()
+    layout(spec, doc.modelspace(), **options)
+    return doc
+
+
+def write_dxf(filename, draw, streaming=False):
+    """
+    Call draw(msp) and save the result. With streaming, entities are written
+    to an R12 file as they are drawn instead of building the whole document
+    in memory first; blocks are not available then.
+    """
+    if streaming:
+        with r12writer(filename) as writer:
+            draw(StreamingLayout(writer))
+        return filename
+    doc = new_document()
+    draw(doc.modelspace())
+    with span("save"):
+        doc.saveas(filename)
+    return filename
+
+
+def write_job(specs, filename, streaming=False, cache=None, **options):
+    """
+    Lay out several boxes one above the other in one DXF file. With a
+    cache.OutputCache, an identical earlier job is copied instead.
+    """
+    if streaming and options.get("instance"):
+        raise ValueError("the streaming writer does not support blocks")
+    if cache is not None:
+        key = cache.key("job", specs, streaming=streaming, **options)
+        return cache.fetch(key, filename,
+                           lambda f: write_job(specs, f, streaming, **options))
+
+    def draw(msp):
+        for k, spec in enumerate(specs):
+            layout(spec, msp, (0, k * BOX_PITCH), **options)
+    return write_dxf(filename, draw, streaming)
+
+
+def generate(spec, filename="torsion_box.dxf", **options):
+    """
+    Generate one box and save it. Returns the filename written.
+    """
+    return write_job([spec], filename, **options)
+
+
+def spec_grid(base=None, **axes):
+    """
+    Cartesian product of the given field values, e.g.
+    spec_grid(nbraces=[6, 8], box_length=[72, 95.5])
+    """
+    base = base or BoxSpec()
+    names = list(axes)
+    return [replace(base, **dict(zip(names, values)))
+            for values in itertools.product(*(axes[n] for n in names))]
+
+
+def spec_filename(spec, index):
+    return "torsion_box_{:04d}_{:g}x{:g}x{:g}_{}b{}t.dxf".format(
+        index, spec.box_length, spec.box_width, spec.box_height,
+        spec.nbraces, spec.ntabs)
+
+
+def _generate_job(job):
+    spec, filename, options = job
+    return generate(spec, filename, **options)
+
+
+def _generate_job_instrumented(job):
+    # pool workers collect their own stats for the parent to merge
+    with instrumented() as stats:
+        filename = _generate_job(job)
+    return filename, stats
+
+
+def sweep(specs, out_dir=".", processes=None, cache=None, **options):
+    """
+    Write one DXF per spec into out_dir, spread across a process pool.
+    Returns the filenames in the same order as specs. With a cache, hits
+    are copied here and only the misses go to the pool.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = [(spec, os.path.join(out_dir, spec_filename(spec, i)), options)
+            for i, spec in enumerate(specs)]
+    filenames = [filename for _, filename, _ in jobs]
+    keys = {}
+    if cache is not None:
+        for spec, filename, _ in jobs:
+            keys[filename] = cache.key("job", [spec], **dict({"streaming": False}, **options))
+        jobs = [job for job in jobs if not cache.restore(keys[job[1]], job[1])]
+    if processes == 1 or len(jobs) <= 1:
+        written = [_generate_job(job) for job in jobs]
+    elif _stats is not None:
+        with Pool(processes) as pool:
+            results = pool.map(_generate_job_instrumented, jobs, chunksize=1)
+        written = [filename for filename, _ in results]
+        for _, stats in results:
+            _stats.merge(stats)
+    else:
+        with Pool(processes) as pool:
+            written = pool.map(_generate_job, jobs, chunksize=1)
+    for filename in written:
+        if filename in keys:
+            cache.store(keys[filename], filename)
+    return filenames
+
+
+def _parse_axis(text):
+    name, _, values = text.partition("=")
+    types = {f.name: f.type for f in fields(BoxSpec)}
+    if name not in types or not values:
+        raise argparse.ArgumentTypeError("expected FIELD=V1,V2,... got {!r}".format(text))
+    cast = int if types[name] in (int, "int") else float
+    return name, [cast(v) for v in values.split(",")]
+
+
+def _parse_formats(text):
+    from export import EXPORTERS
+    formats = text.lower().split(",")
+    unknown = [ext for ext in formats if "." + ext not in EXPORTERS]
+    if unknown:
+        raise argparse.ArgumentTypeError("unknown format {}; use {}".format(
+            ", ".join(unknown), ",".join(ext[1:] for ext in EXPORTERS)))
+    return formats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    for f in fields(BoxSpec):
+        parser.add_argument("--" + f.name.replace("_", "-"),
+                            type=int if f.type in (int, "int") else float,
+                            default=f.default)
+    parser.add_argument("-o", "--output", default="torsion_box.dxf")
+    parser.add_argument("--sweep", action="append", type=_parse_axis, default=[],
+                        metavar="FIELD=V1,V2,...",
+                        help="generate every combination of the given values")
+    parser.add_argument("--out-dir", default=".",
+                        help="directory for --sweep output")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="worker processes for --sweep (default: all cores)")
+    parser.add_argument("--lines", action="store_true",
+                        help="write separate LINE/ARC entities instead of "
+                        "one closed polyline per outline")
+    parser.add_argument("--blocks", action="store_true",
+                        help="define each unique part once as a BLOCK and "
+                        "place copies with INSERTs")
+    parser.add_argument("--explode", metavar="DXF",
+                        help="explode the blocks of an existing DXF into "
+                        "plain entities and save it as --output")
+    parser.add_argument("--consolidate", metavar="DXF",
+                        help="chain the loose LINE/ARC entities of an existing "
+                        "DXF into polylines, merging collinear runs, save it "
+                        "as --output and print a JSON report")
+    parser.add_argument("--diff", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare the cut geometry of two DXFs, print a "
+                        "JSON report of what was added, removed or moved on "
+                        "each layer and exit 1 if they differ")
+    parser.add_argument("--combine", action="store_true",
+                        help="with --sweep, lay every box out in one DXF "
+                        "(--output) instead of one file each")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream entities to an R12 DXF as they are "
+                        "generated; memory stays flat for very large jobs")
+    parser.add_argument("--nest", action="store_true",
+                        help="pack the parts onto as few sheets as possible "
+                        "and print the sheet count and utilization")
+    parser.add_argument("--gcode", action="store_true",
+                        help="write one G-code file per sheet next to "
+                        "--output instead of a DXF, and print a JSON report")
+    parser.add_argument("--sheets", action="store_true",
+                        help="write each plywood sheet to its own DXF next "
+                        "to --output, in parallel across --jobs workers, plus "
+                        "a JSON manifest of the sheets and their parts")
+    parser.add_argument("--tools", type=lambda s: [float(v) for v in s.split(",")],
+                        metavar="D1,D2,...",
+                        help="write the job once per endmill diameter next to "
+                        "--output and print a JSON comparison of fillets, path "
+                        "length, machine time and joint fit")
+    parser.add_argument("--optimize", action="store_true",
+                        help="search nbraces, ntabs and notch_length for the "
+                        "box size given, print the best trade-offs as JSON and "
+                        "write the first one (fewest sheets, shortest cut)")
+    parser.add_argument("--max-spacing", type=float, default=None, metavar="INCHES",
+                        help="with --optimize, the largest brace and tab pitch")
+    parser.add_argument("--emit-order", action="store_true",
+                        help="with --gcode, cut in drawing order instead of "
+                        "the travel-minimising order")
+    parser.add_argument("--validate", action="store_true",
+                        help="check closure, overlaps, sheet bounds and joint "
+                        "clearances instead of writing output; print a JSON "
+                        "report and exit 1 on errors")
+    parser.add_argument("--formats", type=_parse_formats,
+                        metavar="dxf,svg,pdf",
+                        help="render the job once and write it in each format "
+                        "next to --output, the exporters running side by side")
+    parser.add_argument("--cache", nargs="?", const="", metavar="DIR",
+                        help="reuse identical earlier outputs from a cache "
+                        "directory ($TORSION_BOX_CACHE or ~/.cache/torsion_box "
+                        "if DIR is left out)")
+    parser.add_argument("--cache-size", type=float, default=512, metavar="MB",
+                        help="evict least recently used outputs beyond this size")
+    parser.add_argument("--cache-stats", action="store_true",
+                        help="print the cache hit/miss statistics at the end")
+    parser.add_argument("--stats", metavar="JSON",
+                        help="time each part generator and the save step, "
+                        "count the lines, arcs and pockets drawn, and write "
+                        "the report to this file ('-' for stdout)")
+    parser.add_argument("--profile", metavar="PSTATS",
+                        help="also run cProfile and dump it to this file; "
+                        "the slowest functions go into the --stats report")
+    args = parser.parse_args(argv)
+    if args.formats and (args.blocks or args.stream):
+        # the exporters draw the recorded contours, which know no parts
+        parser.error("--formats writes plain contours; it takes --lines but "
+                     "not --blocks or --stream")
+    try:
+        args.spec = BoxSpec(**{f.name: getattr(args, f.name) for f in fields(BoxSpec)})
+        args.specs = spec_grid(args.spec, **dict(args.sweep)) if args.sweep else [args.spec]
+        for diameter in args.tools or ():
+            replace(args.spec, endmill_diameter=diameter)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def write_stats(stats, filename=None, profile=None, argv=None):
+    """
+    Write the stats report as JSON to filename ('-' for stdout) and the
+    raw profile, if any, to profile.
+    """
+    if profile and stats.profile is not None:
+        stats.profile.dump_stats(profile)
+    if not filename:
+        return
+    report = dict(stats.report(), argv=sys.argv[1:] if argv is None else list(argv))
+    text = json.dumps(report, indent=2)
+    if filename == "-":
+        print(text)
+        return
+    with open(filename, "w") as f:
+        f.write(text + "\n")
+
+
+def run(args, spec, specs, options, cache):
+    """
+    Carry out the command line. Returns the exit status.
+    """
+    if args.explode:
+        explode_inserts(ezdxf.readfile(args.explode)).saveas(args.output)
+    elif args.consolidate:
+        from consolidate import consolidate_file
+        print(json.dumps(consolidate_file(args.consolidate, args.output), indent=2))
+    elif args.diff:
+        from dxfdiff import diff_files
+        report = diff_files(*args.diff)
+        print(json.dumps(report, indent=2))
+        return 0 if report["same"] else 1
+    elif args.validate:
+        from validate import validate_job
+        try:
+            report = validate_job(specs, args.nest)
+        except ValueError as e:
+            print("error: {}".format(e), file=sys.stderr)
+            return 1
+        print(json.dumps(report.to_dict(), indent=2))
+        return 0 if report.ok else 1
+    elif args.formats:
+        from export import export, record
+        stem = os.path.splitext(args.output)[0]
+        try:
+            recorder = record(specs, args.nest)
+        except ValueError as e:
+            print("error: {}".format(e), file=sys.stderr)
+            return 1
+        for filename in export(recorder,
+                               [stem + "." + ext for ext in args.formats], args.jobs,
+                               polyline=options["polyline"]):
+            print(filename)
+    elif args.gcode:
+        from gcode import write_gcode
+        try:
+            reports = write_gcode(specs, args.output, args.nest,
+                                  optimize=not args.emit_order)
+        except ValueError as e:
+            print("error: {}".format(e), file=sys.stderr)
+            return 1
+        print(json.dumps(reports, indent=2))
+    elif args.optimize:
+        import optimizer
+        limits = {} if args.max_spacing is None else {"max_spacing": args.max_spacing}
+        front = optimizer.optimize(spec, processes=args.jobs, **limits)
+        print(json.dumps(optimizer.report(front), indent=2))
+        if not front:
+            print("error: no brace layout fits the box on {:g} x {:g} sheets within the "
+                  "spacing limits".format(*SHEET_SIZE), file=sys.stderr)
+            return 1
+        if args.nest:
+            from nesting import write_nested
+            write_nested([front[0].spec], args.output, **options)
+        else:
+            generate(front[0].spec, args.output, cache=cache, **options)
+    elif args.tools:
+        from tooling import write_variants
+        try:
+            report = write_variants(specs, args.tools, args.output, args.nest,
+                                    polyline=options["polyline"])
+        except ValueError as e:
+            print("error: {}".format(e), file=sys.stderr)
+            return 1
+        print(json.dumps(report, indent=2))
+        if any("error" in tool for tool in report["tools"]):
+            return 1
+    elif args.sheets:
+        from sheets import write_sheets
+        try:
+            manifest = write_sheets(specs, args.output, args.nest, args.jobs,
+                                    polyline=options["polyline"],
+                                    instance=options["instance"])
+        except ValueError as e:
+            print("error: {}".format(e), file=sys.stderr)
+            return 1
+        for entry in manifest["sheets"]:
+            print(entry["file"])
+    elif args.nest:
+        from nesting import write_nested
+        try:
+            report = write_nested(specs, args.output, **options).report()
+        except ValueError as e:
+            print("error: {}".format(e), file=sys.stderr)
+            return 1
+        print("{} sheets, {:.1%} utilization".format(report["sheets"],
+                                                     report["utilization"]))
+    elif args.sweep and args.combine:
+        write_job(specs, args.output, cache=cache, **options)
+    elif args.sweep:
+        for filename in sweep(specs, args.out_dir, args.jobs, cache, **options):
+            print(filename)
+    else:
+        generate(spec, args.output, cache=cache, **options)
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    spec, specs = args.spec, args.specs
+    options = {"polyline": not args.lines, "instance": args.blocks,
+               "streaming": args.stream}
+    cache = None
+    if args.cache is not None:
+        from cache import DEFAULT_DIR, OutputCache
+        cache = OutputCache(args.cache or DEFAULT_DIR, int(args.cache_size * 2**20))
+    if args.stats or args.profile:
+        with instrumented(profile=bool(args.profile)) as stats:
+            status = run(args, spec, specs, options, cache)
+        write_stats(stats, args.stats, args.profile, argv)
+    else:
+        status = run(args, spec, specs, options, cache)
+    if cache is not None and args.cache_stats:
+        print(json.dumps(cache.stats(), indent=2))
+    if status:
+        sys.exit(status)
+
+
+if __name__ == "__main__":
+    # modules imported by main() get this module rather than loading a second
+    # copy, so they report into the same instrumentation
+    sys.modules.setdefault("torsion_box_generator", sys.modules[__name__])
+    main()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+"""
+Check generated geometry before it reaches the router.
+
+- every part outline closes and does not cross itself
+- parts in a layout do not overlap and stay on their plywood sheet
+- brace fingers fit the pockets and edge notches they go into, measured
+  from the generated contours after padding and corner reliefs
+
+Arcs are flattened into short chords and every pairwise test goes through a
+uniform grid, so only neighbouring edges are compared.
+"""
+import math
+from dataclasses import dataclass, field
+
+import numpy as np
+
+import torsion_box_generator as tbg
+
+TOLERANCE = 1e-6
+# flattened arcs use this many chords per half circle
+ARC_STEPS = 8
+# grid cell of the spatial index, in inches
+CELL = 2.0
+# a fit looser than this is reported as a warning
+MAX_CLEARANCE = 0.125
+
+
+@dataclass
+class Issue:
+    severity: str  # "error" or "warning"
+    check: str
+    message: str
+
+
+@dataclass
+class Report:
+    issues: list = field(default_factory=list)
+    fits: list = field(default_factory=list)
+
+    @property
+    def ok(self):
+        return not any(issue.severity == "error" for issue in self.issues)
+
+    def add(self, severity, check, message):
+        self.issues.append(Issue(severity, check, message))
+
+    def to_dict(self):
+        return {
+            "ok": self.ok,
+            "issues": [issue.__dict__ for issue in self.issues],
+            "fits": self.fits,
+        }
+
+
+def flatten(contour, steps=ARC_STEPS):
+    """
+    Closed polygon approximating the contour, arcs split into chords.
+    """
+    vertices = contour.vertices()
+    points = []
+    n = len(vertices)
+    for k in range(n):
+        x0, y0, bulge = vertices[k]
+        points.append((x0, y0))
+        if bulge == 0:
+            continue
+        x1, y1 = vertices[(k + 1) % n, :2]
+        chord = math.hypot(x1 - x0, y1 - y0)
+        theta = 4 * math.atan(bulge)
+        offset = chord * (1 - bulge**2) / (4 * bulge)
+        cx = (x0 + x1) / 2 - (y1 - y0) / chord * offset
+        cy = (y0 + y1) / 2 + (x1 - x0) / chord * offset
+        r = math.hypot(x0 - cx, y0 - cy)
+        a0 = math.atan2(y0 - cy, x0 - cx)
+        count = max(2, int(math.ceil(steps * abs(theta) / math.pi)))
+        for i in range(1, count):
+            a = a0 + theta * i / count
+            points.append((cx + r * math.cos(a), cy + r * math.sin(a)))
+    return np.array(points)
+
+
+def _cells(x0, y0, x1, y1, cell=CELL):
+    for i in range(int(math.floor(x0 / cell)), int(math.floor(x1 / cell)) + 1):
+        for j in range(int(math.floor(y0 / cell)), int(math.floor(y1 / cell)) + 1):
+            yield i, j
+
+
+def candidate_pairs(boxes, cell=CELL):
+    """
+    Index pairs (i < j) whose (x0, y0, x1, y1) boxes overlap, found with a
+    uniform grid instead of comparing every pair.
+    """
+    grid = {}
+    for i, (x0, y0, x1, y1) in enumerate(boxes):
+        for key in _cells(x0, y0, x1, y1, cell):
+            grid.setdefault(key, []).append(i)
+    pairs = set()
+    for members in grid.values():
+        for a in range(len(members)):
+            i = members[a]
+            for j in members[a + 1:]:
+                bi, bj = boxes[i], boxes[j]
+                if (bi[0] <= bj[2] + TOLERANCE and bj[0] <= bi[2] + TOLERANCE and
+                        bi[1] <= bj[3] + TOLERANCE and bj[1] <= bi[3] + TOLERANCE):
+                    pairs.add((i, j) if i < j else (j, i))
+    return sorted(pairs)
+
+
+def _edges(polygon):
+    return np.hstack([polygon, np.roll(polygon, -1, axis=0)])
+
+
+def _cross(ax, ay, bx, by):
+    return ax * by - ay * bx
+
+
+def _crossing(e, f):
+    """
+    True where edges e and f (rows of x0, y0, x1, y1) properly cross.
+    Touching end points do not count.
+    """
+    dx1, dy1 = e[:, 2] - e[:, 0], e[:, 3] - e[:, 1]
+    dx2, dy2 = f[:, 2] - f[:, 0], f[:, 3] - f[:, 1]
+    d1 = _cross(dx1, dy1, f[:, 0] - e[:, 0], f[:, 1] - e[:, 1])
+    d2 = _cross(dx1, dy1, f[:, 2] - e[:, 0], f[:, 3] - e[:, 1])
+    d3 = _cross(dx2, dy2, e[:, 0] - f[:, 0], e[:, 1] - f[:, 1])
+    d4 = _cross(dx2, dy2, e[:, 2] - f[:, 0], e[:, 3] - f[:, 1])
+    return (d1 * d2 < -TOLERANCE) & (d3 * d4 < -TOLERANCE)
+
+
+def _edge_boxes(edges):
+    return np.stack([np.minimum(edges[:, 0], edges[:, 2]), np.minimum(edges[:, 1], edges[:, 3]),
+                     np.maximum(edges[:, 0], edges[:, 2]), np.maximum(edges[:, 1], edges[:, 3])],
+                    axis=1).tolist()
+
+
+def self_intersections(contour):
+    """
+    Number of crossings between non-adjacent edges of the flattened contour.
+    """
+    edges = _edges(flatten(contour))
+    n = len(edges)
+    pairs = [(i, j) for i, j in candidate_pairs(_edge_boxes(edges), CELL / 4)
+             if j - i > 1 and not (i == 0 and j == n - 1)]
+    if not pairs:
+        return 0
+    pairs = np.array(pairs)
+    return int(_crossing(edges[pairs[:, 0]], edges[pairs[:, 1]]).sum())
+
+
+def inside(points, polygon):
+    """
+    Even-odd point in polygon test for many points at once.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    x, y = points[:, 0:1], points[:, 1:2]
+    x0, y0 = polygon[:, 0], polygon[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    straddles = (y0 > y) != (y1 > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xc = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+    return (straddles & (x < xc)).sum(axis=1) % 2 == 1
+
+
+def check_part(report, name, contours, seen=None):
+    """
+    Closure and self-intersection of each contour. Contours whose moves are
+    in seen (e.g. a plate's identical pockets) were checked already.
+    """
+    seen = set() if seen is None else seen
+    for contour in contours:
+        key = (np.round(contour.moves(), 9) + 0.0).tobytes()
+        if key in seen:
+            continue
+        seen.add(key)
+        gap = math.hypot(*np.subtract(contour.end(), contour.start))
+        if gap > TOLERANCE:
+            report.add("error", "closure", "{} {} contour misses its start by {:.6f}"
+                       .format(name, contour.layer, gap))
+        crossings = self_intersections(contour)
+        if crossings:
+            report.add("error", "self-intersection", "{} {} contour crosses itself {} times"
+                       .format(name, contour.layer, crossings))
+
+
+def check_layout(report, contours):
+    """
+    Outer profiles must not overlap each other and must lie on a sheet.
+    """
+    sheets = [c for c in contours if c.layer == "Plywood"]
+    profiles = [c for c in contours if c.layer not in ("Plywood", "Pocket")]
+    polygons = [flatten(c) for c in profiles]
+    boxes = [c.bounds() for c in profiles]
+
+    for i, j in candidate_pairs(boxes, 4 * CELL):
+        a, b = polygons[i], polygons[j]
+        ea, eb = _edges(a), _edges(b)
+        hits = 0
+        for k, m in candidate_pairs(_edge_boxes(ea) + _edge_boxes(eb), CELL):
+            if k < len(ea) <= m:
+                hits += int(_crossing(ea[k:k + 1], eb[m - len(ea):m - len(ea) + 1])[0])
+        if hits or inside(a[:1], b)[0] or inside(b[:1], a)[0]:
+            report.add("error", "overlap", "parts at ({:.3f}, {:.3f}) and ({:.3f}, {:.3f}) overlap"
+                       .format(boxes[i][0], boxes[i][1], boxes[j][0], boxes[j][1]))
+
+    sheet_boxes = [s.bounds() for s in sheets]
+    for box in boxes:
+        if not any(s[0] - TOLERANCE <= box[0] and s[1] - TOLERANCE <= box[1] and
+                   box[2] <= s[2] + TOLERANCE and box[3] <= s[3] + TOLERANCE
+                   for s in sheet_boxes):
+            report.add("error", "off-sheet", "part at ({:.3f}, {:.3f})-({:.3f}, {:.3f}) is not "
+                       "on a plywood sheet".format(*box))
+
+
+def _straight(contour):
+    # end points of the straight segments
+    vertices = contour.vertices()
+    ends = np.roll(vertices[:, :2], -1, axis=0)
+    keep = vertices[:, 2] == 0
+    return vertices[keep, :2], ends[keep]
+
+
+def pocket_openings(contour):
+    """
+    Clear (width, height) between the straight walls of a pocket.
+    """
+    p0, p1 = _straight(contour)
+    vertical = np.abs(p0[:, 0] - p1[:, 0]) < TOLERANCE
+    xs, ys = p0[vertical, 0], p0[~vertical, 1]
+    return float(xs.max() - xs.min()), float(ys.max() - ys.min())
+
+
+def finger_tips(contour, side):
+    """
+    Lengths of the straight segments lying on one side ("left", "bottom",
+    "right" or "top") of the outline's bounding box.
+    """
+    x0, y0, x1, y1 = contour.bounds()
+    axis, edge = {"left": (0, x0), "bottom": (1, y0), "right": (0, x1), "top": (1, y1)}[side]
+    p0, p1 = _straight(contour)
+    on_edge = (np.abs(p0[:, axis] - edge) < TOLERANCE) & (np.abs(p1[:, axis] - edge) < TOLERANCE)
+    return np.abs(p1[on_edge, 1 - axis] - p0[on_edge, 1 - axis]).tolist()
+
+
+def _ray_depth(polygon, axis, edge, inward, position):
+    """
+    Distance from the edge to the first boundary crossed by a ray going
+    inward at position along the edge.
+    """
+    along = 1 - axis
+    p0 = polygon
+    p1 = np.roll(polygon, -1, axis=0)
+    crosses = (p0[:, along] - position) * (p1[:, along] - position) < 0
+    a0, a1 = p0[crosses], p1[crosses]
+    t = (position - a0[:, along]) / (a1[:, along] - a0[:, along])
+    hits = (a0[:, axis] + t * (a1[:, axis] - a0[:, axis]) - edge) * inward
+    return float(hits[hits > TOLERANCE].min())
+
+
+def edge_notches(contour, side):
+    """
+    (opening, depth) of every notch cut into one side of the outline: the
+    gap between two walls standing on that side, and how far the notch
+    reaches in.
+    """
+    x0, y0, x1, y1 = contour.bounds()
+    axis, edge, inward = {"left": (0, x0, 1), "bottom": (1, y0, 1),
+                          "right": (0, x1, -1), "top": (1, y1, -1)}[side]
+    along = 1 - axis
+    p0, p1 = _straight(contour)
+    walls = (np.abs(p0[:, along] - p1[:, along]) < TOLERANCE) & (
+        (np.abs(p0[:, axis] - edge) < TOLERANCE) | (np.abs(p1[:, axis] - edge) < TOLERANCE))
+    positions = np.unique(np.round(p0[walls, along], 9))
+    polygon = flatten(contour)
+    notches = []
+    for a, b in zip(positions[:-1], positions[1:]):
+        probe = [0.0, 0.0]
+        probe[along] = (a + b) / 2
+        probe[axis] = edge + inward * 1e-3
+        if inside([probe], polygon)[0]:
+            continue
+        depth = _ray_depth(polygon, axis, edge, inward, probe[along])
+        notches.append((float(b - a), depth))
+    return notches
+
+
+def _fit(report, joint, opening, finger, what):
+    clearance = opening - finger
+    report.fits.append({"joint": joint, "measure": what, "opening": round(opening, 6),
+                        "finger": round(finger, 6), "clearance": round(clearance, 6)})
+    if clearance < -TOLERANCE:
+        report.add("error", "fit", "{}: {} {:.4f} is {:.4f} too small for {:.4f}"
+                   .format(joint, what, opening, -clearance, finger))
+    elif clearance > MAX_CLEARANCE:
+        report.add("warning", "fit", "{}: {} clearance {:.4f} is looser than {:.4f}"
+                   .format(joint, what, clearance, MAX_CLEARANCE))
+
+
+def _longest(report, part, edges, tips):
+    # the longest finger tip, or None and an error when the edges have none,
+    # as when notches longer than the fingers leave nothing between them
+    if not tips:
+        report.add("error", "fit", "{}: no finger tips found on its {} edges"
+                   .format(part, edges))
+        return None
+    return max(tips)
+
+
+def check_fits(report, spec):
+    """
+    Measure every mating pair of one box from its generated contours.
+    """
+    plate, *plate_pockets = tbg.top_plate_contours(spec)
+    short, = tbg.short_brace_contours(spec, (0, 0))
+    long, *long_pockets = tbg.long_brace_contours(spec, (0, 0))
+    thickness = spec.plywood_thickness
+
+    # short brace fingers into the plate pockets and the plate's end notches
+    tip = _longest(report, "short brace", "top and bottom",
+                   finger_tips(short, "top") + finger_tips(short, "bottom"))
+    end_tip = _longest(report, "short brace", "end",
+                       finger_tips(short, "left") + finger_tips(short, "right"))
+    if tip is not None:
+        if plate_pockets:
+            width, height = pocket_openings(plate_pockets[0])
+            _fit(report, "short brace -> plate pocket", height, tip, "length")
+            _fit(report, "short brace -> plate pocket", width, thickness, "thickness")
+        for side in ("left", "right"):
+            for opening, depth in edge_notches(plate, side):
+                _fit(report, "end brace -> plate {} notch".format(side), opening, tip, "length")
+                _fit(report, "end brace -> plate {} notch".format(side), depth, thickness, "depth")
+
+    # long brace fingers into the plate's side notches
+    long_tip = _longest(report, "long brace", "top and bottom",
+                        finger_tips(long, "top") + finger_tips(long, "bottom"))
+    if long_tip is not None:
+        for side in ("bottom", "top"):
+            for opening, depth in edge_notches(plate, side):
+                _fit(report, "long brace -> plate {} notch".format(side), opening, long_tip, "length")
+                _fit(report, "long brace -> plate {} notch".format(side), depth, thickness, "depth")
+
+    # short brace end fingers into the long brace pockets and end notches
+    if end_tip is not None:
+        if long_pockets:
+            width, height = pocket_openings(long_pockets[0])
+            _fit(report, "short brace end -> long brace pocket", height, end_tip, "length")
+            _fit(report, "short brace end -> long brace pocket", width, thickness, "thickness")
+        for side in ("left", "right"):
+            for opening, depth in edge_notches(long, side):
+                _fit(report, "end brace -> long brace {} notch".format(side), opening, end_tip, "length")
+                _fit(report, "end brace -> long brace {} notch".format(side), depth, thickness, "depth")
+
+
+def validate_job(specs, nested=False):
+    """
+    Run every check on a job and return a Report.
+    """
+    from nesting import box_parts
+
+    report = Report()
+    checked = set()
+    for spec in specs:
+        names = set()
+        # nested jobs cut long boxes in pieces, so check those instead
+        for part in box_parts(spec, max(tbg.SHEET_SIZE) if nested else None):
+            if part.name not in names:
+                names.add(part.name)
+                check_part(report, part.name, part.contours, checked)
+        check_fits(report, spec)
+    check_layout(report, tbg.layout_contours(specs, nested))
+    return report
+
+
+def validate(spec, nested=False):
+    return validate_job([spec], nested)